@@ -0,0 +1,12 @@
+# -----------------------------------------------------------------------------
+# Runs mtech_offers/candidate_lookup.py, see there and README.md for the arguments.
+# -----------------------------------------------------------------------------
+import sys
+
+from mtech_offers.candidate_lookup import main
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+# -----------------------------------------------------------------------------
+# Runs mtech_offers/decision_query.py, see there and README.md for the arguments.
+# -----------------------------------------------------------------------------
+import sys
+
+from mtech_offers.decision_query import main
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
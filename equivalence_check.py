@@ -0,0 +1,12 @@
+# -----------------------------------------------------------------------------
+# Runs mtech_offers/equivalence_check.py, see there and README.md for the arguments.
+# -----------------------------------------------------------------------------
+import sys
+
+from mtech_offers.equivalence_check import main
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
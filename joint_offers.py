@@ -0,0 +1,12 @@
+# -----------------------------------------------------------------------------
+# Runs mtech_offers/joint_offers.py, see there and README.md for the arguments.
+# -----------------------------------------------------------------------------
+import sys
+
+from mtech_offers.joint_offers import main
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
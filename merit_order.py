@@ -0,0 +1,12 @@
+# -----------------------------------------------------------------------------
+# Runs mtech_offers/merit_order.py, see there and README.md for the arguments.
+# -----------------------------------------------------------------------------
+import sys
+
+from mtech_offers.merit_order import main
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,7 @@
+# -----------------------------------------------------------------------------
+# Make and update MTech admission offers from COAP files.
+#
+# The scripts (make_offers.py, update_offers.py, ...) are the modules of this
+# package; the files of the same name next to it run them, and cli.py runs
+# them as subcommands of the mtech-offers command (see README.md).
+# -----------------------------------------------------------------------------
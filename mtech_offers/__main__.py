@@ -0,0 +1,8 @@
+# -----------------------------------------------------------------------------
+# python3 -m mtech_offers <subcommand> ..., the same as mtech-offers (see cli.py)
+# -----------------------------------------------------------------------------
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,183 @@
+# -----------------------------------------------------------------------------
+# Dedupe stage for the master file.
+#
+# The master file can hold several rows for one person: the same coap_id
+# twice, or different application ids with the same GATE registration,
+# email or mobile. Each row used to be a separate applicant, so one person
+# could take two seats, and update_offers.py kept whichever row came last.
+#
+# Here the rows are indexed on each key of DUPLICATE_RULES in one pass.
+# Rows that share a "merge" key (coap_id, gate_id) are one applicant, and
+# only the row with the best merit (GATE score, then BTech score, the first
+# row on a tie) is kept, where it was in the file. Rows that share only a
+# "flag" key (email, mobile) are all kept and just reported, for someone
+# to look at. The keys are normalized first; empty keys, placeholders such
+# as "NA" or "-", and emails or mobiles that are not one never match.
+#
+# Everything that was merged or flagged is reported, see report_duplicates().
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+import csv
+import os
+
+# What to do with rows that share a key. Only the ids COAP and GATE give
+# out are merged on. An email or a mobile number can be a parent's, a
+# coaching centre's or shared by siblings, so they are only flagged.
+DUPLICATE_RULES = {
+    "coap_id": "merge",
+    "gate_id": "merge",
+    "email": "flag",
+    "mobile": "flag",
+}
+
+# What is typed into a cell that has nothing to say, never a key
+PLACEHOLDERS = {"", "NA", "N/A", "N.A.", "NIL", "NULL", "NONE", "-", "--", "0", "."}
+
+
+@dataclass
+class DuplicateApplicant:
+    """A class for holding a duplicate master file row and what was done"""
+
+    coap_id: str  # of the row kept
+    kind: str  # merged | flagged
+    matched_on: str  # key=value the rows share
+    kept: str
+    dropped: str  # the other row, still kept if flagged
+
+
+def _normalize(key, value):
+    if value is None:
+        return None
+    value = "".join(str(value).split())
+    if value.upper() in PLACEHOLDERS:
+        return None
+    if key == "mobile":
+        digits = "".join(ch for ch in value if ch.isdigit())
+        # +91 98xxxxxxxx, 098xxxxxxxx and 98xxxxxxxx are the same number;
+        # anything shorter, or all zeros, is not a number
+        digits = digits[-10:]
+        return digits if len(digits) == 10 and digits.strip("0") else None
+    if key == "email":
+        # Not an address at all, e.g. "no email" or "-@-"
+        name, at, domain = value.lower().rpartition("@")
+        if not at or not name.strip("-.") or "." not in domain.strip("."):
+            return None
+        return f"{name}@{domain}"
+    return value.upper()
+
+
+def _merit(s):
+    return (s.gate_score or 0, s.btech_score or 0)
+
+
+def _describe(s):
+    return f"{s.coap_id} (appl {s.appl_id}, gate {s.gate_score}, btech {s.btech_score})"
+
+
+def duplicates_report_fname(offers_prefix, rnd):
+    return f"{offers_prefix}_Round_{rnd}_duplicate_applicants.csv"
+
+
+def dedupe_students(students):
+    """ Merge the rows of one person down to one Student.
+
+    Parameters
+    ----------
+    students : list of Student objects
+        As loaded from the master file, in file order
+    returns (list of Student objects, list of DuplicateApplicant objects)
+    """
+    # Rows that share a merge key are joined in a union-find over the row
+    # numbers, so a row can link two groups found earlier (same gate_id
+    # as one, same email as another).
+    parent = list(range(len(students)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    index, links, flags = {}, {}, []
+    for i, s in enumerate(students):
+        for key, rule in DUPLICATE_RULES.items():
+            value = _normalize(key, getattr(s, key))
+            if value is None:
+                continue
+            j = index.setdefault((key, value), i)
+            if j == i:
+                continue
+            if rule == "merge":
+                links.setdefault(i, f"{key}={value}")
+                a, b = find(i), find(j)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+            else:
+                flags.append((j, i, f"{key}={value}"))
+
+    # The best row of each group, the first one on a tie
+    best = {}
+    for i, s in enumerate(students):
+        root = find(i)
+        if root not in best or _merit(s) > _merit(students[best[root]]):
+            best[root] = i
+
+    kept, duplicates = [], []
+    for i, s in enumerate(students):
+        b = best[find(i)]
+        if b == i:
+            kept.append(s)
+            continue
+        # A row is reported with what linked it to the group; the first row
+        # of a group, when it lost to a later one, with the winner's link.
+        duplicates.append(
+            DuplicateApplicant(
+                students[b].coap_id,
+                "merged",
+                links.get(i) or links.get(b) or "",
+                _describe(students[b]),
+                _describe(s),
+            )
+        )
+
+    # Flagged rows are reported against the rows kept for them, once
+    seen = set()
+    for j, i, matched_on in flags:
+        a, b = best[find(j)], best[find(i)]
+        if a == b or (a, b, matched_on) in seen:
+            continue
+        seen.add((a, b, matched_on))
+        duplicates.append(
+            DuplicateApplicant(
+                students[a].coap_id,
+                "flagged",
+                matched_on,
+                _describe(students[a]),
+                _describe(students[b]),
+            )
+        )
+    return kept, duplicates
+
+
+def report_duplicates(duplicates, offers_prefix, rnd):
+    """ Print the duplicate rows and write them to the round's report """
+    fname = duplicates_report_fname(offers_prefix, rnd)
+    if not duplicates:
+        # No stale report from an earlier run of the round
+        if os.path.exists(fname):
+            os.remove(fname)
+        return
+    n_merged = sum(d.kind == "merged" for d in duplicates)
+    print(
+        f"\n!!!!! {n_merged} duplicate applicant row(s) were merged, "
+        f"{len(duplicates) - n_merged} flagged:"
+    )
+    for d in duplicates:
+        print(f"  [{d.kind}] {d.matched_on}: kept {d.kept}, other {d.dropped}")
+
+    with open(fname, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["coap_id", "kind", "matched_on", "kept", "other"])
+        for d in duplicates:
+            writer.writerow([d.coap_id, d.kind, d.matched_on, d.kept, d.dropped])
+    print(f"  (also written to {fname})\n")
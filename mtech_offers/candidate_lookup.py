@@ -0,0 +1,322 @@
+# -----------------------------------------------------------------------------
+# Answer "what is my status?" queries from the helpdesk.
+#
+# The offers files of one or more prefixes, their summary files and the
+# master file are indexed once into an SQLite file. A candidate can then be
+# looked up by coap_id, appl_id, gate_id, email or mobile number, or by the
+# start of their name, and their round by round history is printed with
+# the cutoffs of the round. Lookups read only the index, the xlsx files are
+# parsed again only when one of them has changed since the index was built.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE candidates (
+    coap_id TEXT PRIMARY KEY, name TEXT, name_lc TEXT, gender TEXT,
+    category TEXT, appl_id TEXT, gate_id TEXT, email TEXT, mobile TEXT,
+    gate_score REAL, btech_score REAL, gate_stream TEXT, btech_stream TEXT
+);
+CREATE INDEX candidates_appl_id ON candidates (appl_id);
+CREATE INDEX candidates_gate_id ON candidates (gate_id);
+CREATE INDEX candidates_email ON candidates (email);
+CREATE INDEX candidates_mobile ON candidates (mobile);
+CREATE INDEX candidates_name_lc ON candidates (name_lc);
+CREATE TABLE history (
+    coap_id TEXT, prefix TEXT, round INTEGER, status TEXT, reason TEXT,
+    offer_seat_category TEXT
+);
+CREATE INDEX history_coap_id ON history (coap_id);
+CREATE TABLE cutoffs (
+    prefix TEXT, round INTEGER, seat_category TEXT, remaining_seats INTEGER,
+    post_round_cutoff REAL, accept_retain_cutoff REAL,
+    PRIMARY KEY (prefix, round, seat_category)
+);
+"""
+
+
+def _text(v):
+    return None if v is None or v == "" else str(v)
+
+
+def _mobile(v):
+    # Compare on the last 10 digits, so +91 and spaces don't matter
+    digits = re.sub(r"\D", "", str(v or ""))
+    return digits[-10:] or None
+
+
+# Only queries that look like a phone number are looked up as one, so that
+# the digits of e.g. a gate_id can't match somebody's mobile
+_PHONE_QUERY = re.compile(r"\+?[\d ]+")
+
+
+def _round_number(title):
+    return int(title[6:]) if title.startswith("Round_") and title[6:].isdigit() else None
+
+
+def _sources(applicants_file, prefixes):
+    fnames = [applicants_file]
+    for prefix in prefixes:
+        fnames += [prefix + "_offers.xlsx", prefix + "_summary.xlsx"]
+    return fnames
+
+
+def _stamps(fnames):
+    stamps = {}
+    for fname in fnames:
+        try:
+            st = os.stat(fname)
+            stamps[os.path.abspath(fname)] = [st.st_size, st.st_mtime_ns]
+        except OSError:
+            stamps[os.path.abspath(fname)] = None
+    return stamps
+
+
+def build_index(index_fname, applicants_file, prefixes):
+    """ (Re)build the lookup index from the master, offers and summary files """
+    # Only needed when building, lookups start faster without them
+    import openpyxl
+    from .offers_ledger import OFFER_COLUMNS, read_offer_sheets
+    from .offers_model import MASTER_FILE_ROW_START, load_students
+    from .preflight import Preflight
+    from .round_stats import STATS_COLUMNS
+
+    fnames = _sources(applicants_file, prefixes)
+    stamps = _stamps(fnames)
+
+    checks = Preflight()
+    checks.check_applicants(applicants_file, MASTER_FILE_ROW_START)
+    if checks.applicant_values is None:
+        checks.report()
+        raise SystemExit(1)
+    students = load_students(applicants_file, checks.applicant_values)
+
+    tmp_fname = index_fname + ".tmp"
+    if os.path.exists(tmp_fname):
+        os.remove(tmp_fname)
+    db = sqlite3.connect(tmp_fname)
+    db.executescript(SCHEMA)
+    db.executemany(
+        "INSERT OR REPLACE INTO candidates VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+        (
+            (
+                str(s.coap_id), _text(s.name), (s.name or "").lower(), _text(s.gender),
+                s.category, _text(s.appl_id), _text(s.gate_id),
+                (_text(s.email) or "").lower() or None, _mobile(s.mobile),
+                s.gate_score, s.btech_score, _text(s.gate_stream), _text(s.btech_stream),
+            )
+            for s in students
+        ),
+    )
+
+    cols = {c: i for i, c in enumerate(OFFER_COLUMNS)}
+    stats_cols = dict(STATS_COLUMNS)
+    for prefix in prefixes:
+        for title, rows in read_offer_sheets(prefix + "_offers.xlsx").items():
+            rnd = _round_number(title)
+            history = [
+                (
+                    str(r[0]), prefix, rnd, r[cols["status"]], r[cols["reason"]],
+                    r[cols["offer_seat_category"]],
+                )
+                for r in rows
+                if r[0] is not None
+            ]
+            db.executemany("INSERT INTO history VALUES (?,?,?,?,?,?)", history)
+            # Candidates only in the offers file (e.g. a different master file)
+            db.executemany(
+                "INSERT OR IGNORE INTO candidates (coap_id, name, name_lc, category, "
+                "appl_id, gate_id, email, mobile, gate_score, btech_score) "
+                "VALUES (?,?,?,?,?,?,?,?,?,?)",
+                (
+                    (
+                        str(r[0]), _text(r[cols["name"]]), (r[cols["name"]] or "").lower(),
+                        r[cols["student_category"]], _text(r[cols["appl_id"]]),
+                        _text(r[cols["gate_id"]]),
+                        (_text(r[cols["email"]]) or "").lower() or None,
+                        _mobile(r[cols["mobile"]]), r[cols["gate_score"]],
+                        r[cols["btech_score"]],
+                    )
+                    for r in rows
+                    if r[0] is not None
+                ),
+            )
+
+        wb = openpyxl.load_workbook(filename=prefix + "_summary.xlsx", read_only=True)
+        for worksheet in wb.worksheets:
+            rnd = _round_number(worksheet.title)
+            for r in worksheet.iter_rows(min_row=2, max_col=12, values_only=True):
+                r = tuple(r) + (None,) * (12 - len(r))
+                if r[0] is None:
+                    continue
+                db.execute(
+                    "INSERT OR REPLACE INTO cutoffs VALUES (?,?,?,?,?,?)",
+                    (prefix, rnd, r[0], r[1], r[3], r[11]),
+                )
+        wb.close()
+
+    db.execute(
+        "INSERT INTO meta VALUES ('sources', ?)",
+        (json.dumps({"prefixes": list(prefixes), "stamps": stamps}),),
+    )
+    db.commit()
+    db.close()
+    os.replace(tmp_fname, index_fname)
+
+
+def index_is_fresh(index_fname, applicants_file, prefixes):
+    """ True if the index was built from the files as they are now """
+    if not os.path.exists(index_fname):
+        return False
+    try:
+        db = sqlite3.connect(index_fname)
+        (value,) = db.execute("SELECT value FROM meta WHERE key = 'sources'").fetchone()
+        db.close()
+    except (sqlite3.Error, TypeError):
+        return False
+    sources = json.loads(value)
+    return sources["prefixes"] == list(prefixes) and sources["stamps"] == _stamps(
+        _sources(applicants_file, prefixes)
+    )
+
+
+class CandidateIndex:
+    """ Lookups in an index built by build_index """
+
+    def __init__(self, index_fname):
+        self.db = sqlite3.connect(index_fname)
+        self.db.row_factory = sqlite3.Row
+
+    def close(self):
+        self.db.close()
+
+    def find(self, query):
+        """ Candidates whose coap_id, appl_id, gate_id, email or mobile is query """
+        query = str(query).strip()
+        mobile = _mobile(query) if _PHONE_QUERY.fullmatch(query) else None
+        rows = self.db.execute(
+            "SELECT * FROM candidates WHERE coap_id = ? OR appl_id = ? OR gate_id = ? "
+            "OR email = ? OR mobile = ?",
+            (query, query, query, query.lower(), mobile),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def find_by_name(self, prefix, limit=50):
+        """ Candidates whose name starts with prefix (any case) """
+        prefix = prefix.strip().lower()
+        rows = self.db.execute(
+            "SELECT * FROM candidates WHERE name_lc >= ? AND name_lc < ? "
+            "ORDER BY name_lc LIMIT ?",
+            (prefix, prefix + "\U0010ffff", limit),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def history(self, coap_id):
+        """ The candidate's offers round by round, with the round's cutoffs """
+        rows = self.db.execute(
+            "SELECT h.prefix, h.round, h.status, h.reason, h.offer_seat_category, "
+            "c.remaining_seats, c.post_round_cutoff, c.accept_retain_cutoff "
+            "FROM history h LEFT JOIN cutoffs c ON c.prefix = h.prefix "
+            "AND c.round = h.round AND c.seat_category = h.offer_seat_category "
+            "WHERE h.coap_id = ? ORDER BY h.prefix, h.round",
+            (coap_id,),
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+
+def print_candidate(index, c):
+    print(f"{c['coap_id']}  {c['name']}  ({c['category']})")
+    print(
+        f"  appl_id {c['appl_id']}, gate_id {c['gate_id']}, email {c['email']}, "
+        f"mobile {c['mobile']}"
+    )
+    print(f"  gate_score {c['gate_score']}, btech_score {c['btech_score']}")
+    history = index.history(c["coap_id"])
+    if not history:
+        print("  No offers made so far")
+    for h in history:
+        line = f"  {h['prefix']} Round_{h['round']}: {h['status']} ({h['reason']})"
+        if h["offer_seat_category"]:
+            line += f", seat {h['offer_seat_category']}"
+        if h["post_round_cutoff"] is not None:
+            line += f", round cutoff {h['post_round_cutoff']:g}"
+        if h["accept_retain_cutoff"] is not None:
+            line += f", accept/retain cutoff {h['accept_retain_cutoff']:g}"
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--applicants_file",
+        type=str,
+        required=True,
+        help="The master file containing all the applications with coap_id, gate_id, appl_id",
+    )
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        action="append",
+        required=True,
+        help="Index <prefix>_offers.xlsx and <prefix>_summary.xlsx, can be given more than once.",
+    )
+    parser.add_argument(
+        "-i",
+        "--index_file",
+        type=str,
+        default="candidate_lookup.sqlite",
+        help="The index file, rebuilt when any of the xlsx files change",
+    )
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument(
+        "-q", "--query", type=str, help="A coap_id, appl_id, gate_id, email or mobile"
+    )
+    group.add_argument("-n", "--name", type=str, help="The start of the candidate's name")
+    group.add_argument(
+        "--build", action="store_true", help="Only (re)build the index"
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Look up candidates, returns the exit status """
+    args = build_parser().parse_args(argv)
+
+    t0 = time.perf_counter()
+    if args.build or not index_is_fresh(
+        args.index_file, args.applicants_file, args.offers_prefix
+    ):
+        print(f"-- Building {args.index_file} ...")
+        build_index(args.index_file, args.applicants_file, args.offers_prefix)
+        print(f"-- Built in {time.perf_counter() - t0:.2f}s")
+        if args.build:
+            return 0
+        t0 = time.perf_counter()
+
+    index = CandidateIndex(args.index_file)
+    if args.query:
+        found = index.find(args.query)
+    else:
+        found = index.find_by_name(args.name)
+    for c in found:
+        print_candidate(index, c)
+    index.close()
+    print(f"-- {len(found)} candidate(s) found in {1000 * (time.perf_counter() - t0):.1f}ms")
+    if not found:
+        return 1
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,71 @@
+# -----------------------------------------------------------------------------
+# mtech-offers: one command for all the scripts.
+#
+#   mtech-offers make -a "sample_app_file.xlsx" -o "SAMPLE_TA" -r 1
+#   mtech-offers update -a "sample_app_file.xlsx" -u ... -op "SAMPLE_TA" -r 1 -our J
+#   mtech-offers lookup -a "sample_app_file.xlsx" -op "SAMPLE_TA" -q COAP2000134281
+#
+#   python3 -m mtech_offers make -a "sample_app_file.xlsx" -o "SAMPLE_TA" -r 1
+#
+# A subcommand runs its script exactly as "python3 <script>.py" would, with
+# the same arguments. Only the module of the subcommand is imported, and the
+# scripts only import openpyxl once they read or write a workbook, so
+# --help, argument errors and lookups start without it.
+# -----------------------------------------------------------------------------
+import importlib
+import sys
+
+# subcommand -> (module, what it does)
+SUBCOMMANDS = {
+    "make": ("make_offers", "make the offers of a round"),
+    "update": ("update_offers", "apply a COAP update file to a round"),
+    "joint": ("joint_offers", "make a round's offers for several programs at once"),
+    "jobs": ("season_jobs", "run the make/update jobs of a manifest"),
+    "replay": ("replay_season", "replay a season log in memory"),
+    "notify": ("notify_offers", "e-mail the candidates about their offers"),
+    "letters": ("offer_letters", "make the offer letters of a round's new offers"),
+    "lookup": ("candidate_lookup", "look up a candidate's status"),
+    "diff": ("offers_diff", "what changed between a round and the one before"),
+    "decisions": ("decision_query", "look through the decision log"),
+    "check": ("equivalence_check", "check engines against the scripts on random seasons"),
+    "pool": ("merit_order", "make offers over pooled master files larger than memory"),
+    "report": ("season_report", "statistics of the whole season per round, category and stream"),
+}
+
+PROG = "mtech-offers"
+
+
+def usage():
+    lines = [f"usage: {PROG} <subcommand> [-h] ...", "", "subcommands:"]
+    for name, (module, help) in SUBCOMMANDS.items():
+        lines.append(f"  {name:<10} {help} ({module}.py)")
+    lines.append("")
+    lines.append(f"Run '{PROG} <subcommand> -h' for the arguments of a subcommand.")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    """ Run a subcommand, returns the exit status """
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] in ("-h", "--help"):
+        print(usage())
+        return 0 if argv else 2
+    name, argv = argv[0], list(argv[1:])
+    if name not in SUBCOMMANDS:
+        print(f"!!! ERROR: unknown subcommand {name!r}")
+        print(usage())
+        return 2
+
+    module_name = SUBCOMMANDS[name][0]
+    # So that argparse shows "mtech-offers make" in its messages
+    sys.argv = [f"{PROG} {name}"] + argv
+    module = importlib.import_module("." + module_name, __package__)
+    return module.main(argv)
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,150 @@
+# -----------------------------------------------------------------------------
+# Structured log of every allocation and status decision.
+#
+# make_offers.py (and joint_offers.py) record one event per applicant looked
+# at, update_offers.py one per update, in <prefix>_decisions.jsonl:
+#
+#   {"run": ..., "seq": 12, "coap_id": "...", "rule": "gen_seat",
+#    "status": "Initial_Offer", "seat_category": "gen", "before": 4,
+#    "after": 3, "us": 3.1}
+#
+# before/after are the offers (make) or seats (update) left in the seat
+# category, "us" is how long the decision took in microseconds. The first
+# line of a run has rule "run" and says which script, prefix, round and
+# arguments it was.
+#
+# Events are only appended to a list in the allocation loop. Full batches
+# are handed to a background thread that encodes and writes them, so the
+# loop never waits on the disk. decision_query.py reads the log.
+# -----------------------------------------------------------------------------
+from datetime import datetime
+import json
+import os
+import queue
+import threading
+import time
+
+# What the rule of an event means
+RULES = {
+    "run": "a run started",
+    "gen_seat": "offered a general seat",
+    "category_seat": "general seats are used up, offered a seat of their category",
+    "no_seat": "no seat left for them",
+    "carried_over": "accepted or retained an earlier offer, offered the same seat again",
+    "negative_list": "rejected an earlier offer, skipped",
+    "no_response": "made an offer earlier and it got no update, skipped",
+    "status_update": "the status of an offer was updated",
+    "never_offered": "not offered by us, accepted another offer",
+    "other_program": "the update is for another program, skipped",
+    "consolidated_seen": "consolidated update for a candidate offered earlier, skipped",
+    "not_in_master": "not in the master file, skipped",
+}
+
+_encode = json.JSONEncoder(default=str).encode
+
+# Events handed to the writer thread at a time
+BATCH = 2000
+
+
+def decision_log_fname(offers_prefix):
+    return f"{offers_prefix}_decisions.jsonl"
+
+
+class DecisionLog:
+    """ Buffered, asynchronously written JSON Lines log of decisions """
+
+    def __init__(self, offers_prefix, script, rnd, argv, batch=BATCH):
+        self.fname = decision_log_fname(offers_prefix)
+        self.run = f"{datetime.now():%Y%m%dT%H%M%S.%f}-{os.getpid()}"
+        self.batch = batch
+        self._seq = 0
+        self._buf = []
+        self._encoded = {}
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._writer, daemon=True)
+        self._thread.start()
+        self._queue.put(
+            [
+                {
+                    "run": self.run,
+                    "rule": "run",
+                    "script": script,
+                    "prefix": offers_prefix,
+                    "round": rnd,
+                    "argv": list(argv),
+                    "started": datetime.now().isoformat(timespec="seconds"),
+                }
+            ]
+        )
+
+    def record(self, coap_id, rule, status=None, seat_category=None, before=None,
+               after=None, ns=0):
+        """ Add an event, ns is the time the decision took in nanoseconds """
+        self._seq += 1
+        self._buf.append(
+            (self._seq, coap_id, rule, status, seat_category, before, after, ns)
+        )
+        if len(self._buf) >= self.batch:
+            self._queue.put(self._buf)
+            self._buf = []
+
+    def _writer(self):
+        with open(self.fname, "a") as f:
+            while True:
+                batch = self._queue.get()
+                if batch is None:
+                    break
+                f.write("".join(self._line(e) for e in batch))
+                f.flush()
+
+    def _line(self, e):
+        if not isinstance(e, tuple):
+            return _encode(e) + "\n"
+        # Rules, statuses, categories and seat counts repeat all the time,
+        # so their JSON is kept instead of encoding them for every event.
+        seq, coap_id, rule, status, seat_category, before, after, ns = e
+        j = self._json
+        return (
+            f'{{"seq": {seq}, "coap_id": {_encode(coap_id)}, "rule": {j(rule)}, '
+            f'"status": {j(status)}, "seat_category": {j(seat_category)}, '
+            f'"before": {j(before)}, "after": {j(after)}, "us": {round(ns / 1000, 1)}, '
+            f'"run": {j(self.run)}}}\n'
+        )
+
+    def _json(self, v):
+        try:
+            return self._encoded[v]
+        except KeyError:
+            self._encoded[v] = _encode(v)
+            return self._encoded[v]
+
+    def close(self):
+        """ Write out what is left and wait for the writer to finish """
+        if self._thread is None:
+            return
+        if self._buf:
+            self._queue.put(self._buf)
+            self._buf = []
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def timer():
+    """ A clock for the ns of DecisionLog.record() """
+    return time.perf_counter_ns()
+
+
+def read_events(fname):
+    """ The events of a decision log, as dicts, oldest first """
+    with open(fname) as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                yield json.loads(line)
@@ -0,0 +1,166 @@
+# -----------------------------------------------------------------------------
+# Look through the decision log of a prefix (see decision_log.py).
+#
+# By default the events of the latest run are listed; the runs of a round,
+# or all runs, can be picked instead, and the events narrowed down by
+# coap_id, rule, seat category or status. --summary counts the events per
+# rule and seat category with the spread of the decision times, --slowest
+# lists the decisions that took longest.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import sys
+from collections import Counter, defaultdict
+
+from .decision_log import RULES, decision_log_fname, read_events
+
+
+def select_runs(events, rnd=None, all_runs=False, run=None):
+    """ Split the events up by run, and keep the runs asked for
+
+    Parameters
+    ----------
+    events : iterable of dicts
+        As read from the log
+    rnd : int
+        Optional, only runs of this round
+    all_runs : bool
+        Keep every run, not only the latest one
+    run : str
+        Optional, only the run with this id
+    returns a list of (run header, list of events)
+    """
+    runs = {}
+    for e in events:
+        if e["rule"] == "run":
+            runs[e["run"]] = (e, [])
+        elif e["run"] in runs:
+            runs[e["run"]][1].append(e)
+    runs = list(runs.values())
+    if run is not None:
+        return [r for r in runs if r[0]["run"] == run]
+    if rnd is not None:
+        runs = [r for r in runs if r[0]["round"] == rnd]
+    if not all_runs:
+        runs = runs[-1:]
+    return runs
+
+
+def matches(e, coap_id=None, rule=None, category=None, status=None):
+    return (
+        (coap_id is None or str(e["coap_id"]) == coap_id)
+        and (rule is None or e["rule"] == rule)
+        and (category is None or e["seat_category"] == category)
+        and (status is None or e["status"] == status)
+    )
+
+
+def percentile(values, p):
+    """ The p-th percentile of a sorted list, nearest rank """
+    if not values:
+        return None
+    k = max(0, min(len(values) - 1, round(p / 100 * len(values) + 0.5) - 1))
+    return values[k]
+
+
+def print_event(e):
+    line = f"  {e['seq']:>7}  {e['coap_id']!s:<14} {e['rule']:<18} {e['status'] or '-':<14}"
+    if e["seat_category"] is not None:
+        line += f" {e['seat_category']:<7} {e['before']!s:>5} -> {e['after']!s:<5}"
+    print(line + f" {e['us']:>9.1f}us")
+
+
+def print_summary(events):
+    print(f"  {'rule':<18} {'events':>7} {'p50 us':>9} {'p99 us':>9} {'max us':>9}")
+    times = defaultdict(list)
+    for e in events:
+        times[e["rule"]].append(e["us"])
+    for rule, us in sorted(times.items(), key=lambda x: -len(x[1])):
+        us.sort()
+        print(
+            f"  {rule:<18} {len(us):>7} {percentile(us, 50):>9.1f} "
+            f"{percentile(us, 99):>9.1f} {us[-1]:>9.1f}"
+        )
+    per_category = Counter(
+        (e["seat_category"], e["status"]) for e in events if e["status"] is not None
+    )
+    if per_category:
+        print("  seat_category / status:")
+        for (category, status), n in sorted(per_category.items(), key=str):
+            print(f"    {category or '-':<8} {status:<14} {n}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use the <prefix>_decisions.jsonl file.",
+    )
+    parser.add_argument("-r", "--round", type=int, help="Only the runs of this round")
+    parser.add_argument("--all", action="store_true", help="All runs, not only the latest")
+    parser.add_argument("--run", type=str, help="Only the run with this id")
+    parser.add_argument("-q", "--coap_id", type=str, help="Only this candidate")
+    parser.add_argument(
+        "-k", "--rule", type=str, choices=sorted(RULES), help="Only events of this rule"
+    )
+    parser.add_argument("-c", "--category", type=str, help="Only this seat category")
+    parser.add_argument("-s", "--status", type=str, help="Only events with this status")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument(
+        "--summary", action="store_true", help="Counts and decision times per rule"
+    )
+    group.add_argument("--slowest", type=int, help="The N decisions that took longest")
+    group.add_argument("--json", action="store_true", help="Print the events as JSON Lines")
+    return parser
+
+
+def main(argv=None):
+    """ Print the events of the decision log, returns the exit status """
+    args = build_parser().parse_args(argv)
+
+    log_fname = decision_log_fname(args.offers_prefix)
+    try:
+        runs = select_runs(read_events(log_fname), args.round, args.all, args.run)
+    except FileNotFoundError:
+        print(f"!!! ERROR: no decision log {log_fname}")
+        return 1
+    if not runs:
+        print("!!! ERROR: no such run in the decision log")
+        return 1
+
+    n_found = 0
+    for header, events in runs:
+        events = [
+            e
+            for e in events
+            if matches(e, args.coap_id, args.rule, args.category, args.status)
+        ]
+        n_found += len(events)
+        if args.json:
+            for e in events:
+                print(json.dumps(e))
+            continue
+        print(
+            f"-- Run {header['run']}: {header['script']} round {header['round']}, "
+            f"started {header['started']}, {len(events)} event(s)"
+        )
+        if args.summary:
+            print_summary(events)
+            continue
+        if args.slowest:
+            events = sorted(events, key=lambda e: -e["us"])[: args.slowest]
+        for e in events:
+            print_event(e)
+    if not n_found:
+        return 1
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,701 @@
+# -----------------------------------------------------------------------------
+# Check that the ways of making offers agree, and that none got slower.
+#
+#   python3 equivalence_check.py -n 20 --seed 1
+#   python3 equivalence_check.py -n 20 --baseline engines.json --save_baseline
+#   python3 equivalence_check.py -e my_engine:run_season --baseline engines.json
+#   python3 equivalence_check.py -e scripts --reference_scripts ../original --unique_updates
+#
+# Random seasons are made up: applicants of every category with PWD flags
+# and ties on (gate_score, btech_score), a few rounds with their seats and
+# factors, and after every round "our" and "other" update files with every
+# COAP status (in odd spellings), other programs' rows, consolidated files,
+# repeated rows and coap_ids that are not in the master file.
+# Some rounds are made again after their updates, with the seats those
+# left, so the round sheet gets fewer offers than it had.
+#
+# Every season is run through the make_offers.py / update_offers.py scripts,
+# which are the reference, and through every other engine. The Round_N
+# offers sheets and the seats left per round must come out the same. An
+# engine is a function engine(season, inputs) returning read_results()'s
+# dict; inputs are the season's files, written before the engine is timed.
+#
+# By default this only checks that the engines of this tree agree with its
+# own scripts. With --reference_scripts DIR the scripts in DIR (e.g. a
+# checkout of the original make_offers.py / update_offers.py) are the
+# reference instead. Repeated and contradicting updates of a candidate
+# within a round are resolved differently since (see update_ingest.py);
+# --unique_updates leaves them out of the seasons, so that what did not
+# change on purpose can be compared.
+#
+# The "incremental" engine makes every round twice: first with one seat
+# count changed (or, after round 1, one status of the round before), then,
+# with the change undone, again with --incremental, which has to resume
+# from the state of the first run and come out as the reference.
+#
+# The applicants per second of every engine are printed, and compared with
+# a baseline file if one is given: an engine slower than its baseline by
+# more than --max_slowdown fails the check.
+# -----------------------------------------------------------------------------
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass, field
+from functools import partial
+import argparse
+import importlib
+import io
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from .preflight import CATEGORY_NAMES
+
+SEAT_CATEGORIES = ["gen", "obc_nc", "ews", "sc", "st", "pwd"]
+FACTORS = [1, 1, 1.5, 2, 1.34, 0.5]
+PROGRAM = "CSE"
+
+# Status column letters of the update files
+STATUS_COLS = {"our": "J", "oth": "N"}
+PROGRAM_COL = "H"
+
+# The COAP statuses each kind of update file has
+COAP_STATUSES = {
+    "our": ["Accept and Freeze", "Reject and Wait", "Retain and Wait"],
+    "oth": ["Accept and Freeze"],
+}
+
+
+@dataclass
+class UpdateFile:
+    """ One COAP update file of a round """
+
+    # "our" or "oth"
+    flg: str
+    # (coap_id, COAP status, program) in file order, program is None in a
+    # consolidated file
+    rows: list
+    consolidated: bool = False
+
+
+@dataclass
+class RoundSpec:
+    rnd: int
+    rem_seats: dict
+    factors: dict
+    updates: list = field(default_factory=list)
+    # Made again after its updates, with the seats they left, so with
+    # fewer offers than the first time
+    remake: bool = False
+
+
+@dataclass
+class SeasonSpec:
+    """ A made up season """
+
+    seed: int
+    # Columns A..N of the master file, one tuple per row
+    applicants: list
+    rounds: list
+
+
+@dataclass
+class SeasonInputs:
+    """ The files of a season, with the script runs in order """
+
+    workdir: str
+    prefix: str
+    applicants_file: str
+    summary_file: str
+    # (script, argv) as in a season log
+    operations: list
+
+
+def _variant(rng, status):
+    # The same status as COAP files spell it now and then
+    return rng.choice(
+        [status, status, status.upper(), status.lower(), status.replace(" ", "  "), f" {status} "]
+    )
+
+
+def random_season(seed, n_applicants, n_rounds, unique_updates=False):
+    """ A season with n_applicants and n_rounds, the same for the same seed
+
+    With unique_updates a coap_id is in at most one update row per round,
+    and no round is made again.
+    """
+    rng = random.Random(seed)
+    # Apart, so that the seasons are the same with and without remakes
+    remake_rng = random.Random(-seed)
+    descs = list(CATEGORY_NAMES)
+
+    applicants = []
+    ids = rng.sample(range(10 ** 9), n_applicants)
+    # Narrow score ranges, so that ties on both scores are common
+    top_gate = 300 + max(10, n_applicants // 3)
+    for i, x in enumerate(ids):
+        btech_score = rng.choice([70.0, 75.5, 80.25, round(rng.uniform(55, 95), 2)])
+        marks, gp = (btech_score, None) if rng.random() < 0.5 else (None, btech_score)
+        applicants.append(
+            (
+                f"COAP{2000000000 + x}",
+                rng.randint(300, top_gate),
+                i + 1,
+                f"Applicant {i + 1}",
+                rng.choice(["Male", "Female"]),
+                rng.choice(descs),
+                "Yes" if rng.random() < 0.06 else "No",
+                f"CS{20000000 + x}",
+                marks,
+                gp,
+                rng.choice([None, f"a{i + 1}@example.com"]),
+                rng.choice([None, 9000000000 + i]),
+                rng.choice(["General CS", "AI"]),
+                rng.choice(["Computer Science", "Mathematics", "Electrical"]),
+            )
+        )
+    # BTech applications, which the loaders skip
+    for i in range(rng.randint(0, 2)):
+        applicants.insert(rng.randrange(len(applicants)), (i,) + (None,) * 13)
+
+    # Who updates are about: "our" files are about candidates holding one
+    # of our offers, which the season so far tells, other files mostly
+    # about the top of the merit list.
+    from .offers_api import Season, apply_updates, make_round
+    from .offers_model import load_students
+
+    state = Season(load_students(None, applicants))
+    merit = sorted(state.applicants, key=lambda s: (s.gate_score, s.btech_score), reverse=True)
+
+    rounds = []
+    for rnd in range(1, n_rounds + 1):
+        rem_seats = {k: rng.randint(1, 8) if k == "gen" else rng.randint(0, 4) for k in SEAT_CATEGORIES}
+        factors = {k: rng.choice(FACTORS) for k in SEAT_CATEGORIES}
+        round_spec = RoundSpec(rnd, rem_seats, factors)
+        state.rounds[rnd] = make_round(state, rnd, rem_seats, factors)
+        n_offers = sum(rem_seats.values()) * 2
+        updated = set()
+        for i in range(rng.randint(1, 3)):
+            flg = rng.choice(["our", "oth"])
+            consolidated = (rnd > 1 or i > 0) and rng.random() < 0.3
+            if flg == "our":
+                offers = state.rounds[rnd].offers
+                pool = [c for c, o in offers.items() if o["offer_seat_category"]]
+            else:
+                pool = [s.coap_id for s in merit[: n_offers * (rnd + 1)]]
+            # Nobody accepts a seat that is not there any more
+            left = dict(state.rounds[rnd].rem_seats)
+            rows = []
+            for coap_id in rng.sample(pool, min(len(pool), rng.randint(1, n_offers + 1))):
+                if unique_updates and coap_id in updated:
+                    continue
+                updated.add(coap_id)
+                program = None if consolidated else rng.choice([PROGRAM] * 4 + ["NIS"])
+                statuses = COAP_STATUSES[flg]
+                if flg == "our":
+                    o = state.rounds[rnd].offers[coap_id]
+                    category = o["offer_seat_category"]
+                    if o["status"] == "Accept" or left[category] <= 0:
+                        statuses = statuses[1:]
+                status = rng.choice(statuses)
+                if flg == "our" and status == "Accept and Freeze" and program != "NIS":
+                    left[category] -= 1
+                rows.append((coap_id, _variant(rng, status), program))
+            if rows and rng.random() < 0.3 and not unique_updates:
+                rows.append(rng.choice(rows))
+            if rng.random() < 0.2:
+                program = None if consolidated else PROGRAM
+                rows.append((f"COAP{rng.randint(10 ** 9, 2 * 10 ** 9)}", "Accept and Freeze", program))
+            round_spec.updates.append(UpdateFile(flg, rows, consolidated))
+            state.rounds[rnd], _ = apply_updates(
+                state, rnd, rows, flg, "NA" if consolidated else PROGRAM
+            )
+        if remake_rng.random() < 0.3 and not unique_updates:
+            round_spec.remake = True
+            st = state.rounds[rnd]
+            state.rounds[rnd] = make_round(state, rnd, st.rem_seats, st.factors)
+        rounds.append(round_spec)
+
+    return SeasonSpec(seed, applicants, rounds)
+
+
+def write_inputs(season, workdir):
+    """ Write the master, summary, offers and update files of a season
+
+    returns SeasonInputs
+    """
+    import openpyxl
+
+    os.makedirs(workdir, exist_ok=True)
+    prefix = "SEASON"
+    n_sheets = len(season.rounds) + 1
+
+    wb = openpyxl.Workbook()
+    sh = wb.active
+    sh.title = "APPLICATIONS"
+    sh.append(["MTech applications"])
+    sh.append(["coap_id", "gate_score", "appl_id", "name", "gender", "category",
+               "disabled", "gate_id", "marks_pct", "gp_pct", "email", "mobile",
+               "gate_stream", "btech_stream"])
+    for row in season.applicants:
+        sh.append(list(row))
+    applicants_file = "applicants.xlsx"
+    wb.save(os.path.join(workdir, applicants_file))
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for rnd in range(1, n_sheets + 1):
+        sh = wb.create_sheet("Round_" + str(rnd))
+        sh.append(["seat_category", "remaining_seats", "offers_multiply_by", "post_round_cutoff"])
+        if rnd <= len(season.rounds):
+            round_spec = season.rounds[rnd - 1]
+            for k, v in round_spec.rem_seats.items():
+                sh.append([k, v, round_spec.factors[k]])
+    summary_file = prefix + "_summary.xlsx"
+    wb.save(os.path.join(workdir, summary_file))
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for rnd in range(1, n_sheets + 1):
+        wb.create_sheet("Round_" + str(rnd))
+    wb.save(os.path.join(workdir, prefix + "_offers.xlsx"))
+
+    operations = []
+    for round_spec in season.rounds:
+        rnd = str(round_spec.rnd)
+        operations.append(
+            ("make_offers.py", ["-a", applicants_file, "-o", prefix, "-r", rnd])
+        )
+        for i, u in enumerate(round_spec.updates, 1):
+            wb = openpyxl.Workbook()
+            sh = wb.active
+            status_col = STATUS_COLS[u.flg]
+            sh["A1"], sh[status_col + "1"] = "coap_id", "status"
+            if not u.consolidated:
+                sh[PROGRAM_COL + "1"] = "program"
+            for row, (coap_id, status, program) in enumerate(u.rows, 2):
+                sh[f"A{row}"] = coap_id
+                sh[f"{status_col}{row}"] = status
+                if program is not None:
+                    sh[f"{PROGRAM_COL}{row}"] = program
+            update_file = f"update_{rnd}_{i}.xlsx"
+            wb.save(os.path.join(workdir, update_file))
+            argv = ["-a", applicants_file, "-u", update_file, "-c", "A", "-op", prefix,
+                    "-r", rnd, "-" + u.flg, status_col]
+            if not u.consolidated:
+                argv += ["-prg", PROGRAM, "-pcol", PROGRAM_COL]
+            operations.append(("update_offers.py", argv))
+        if round_spec.remake:
+            operations.append(
+                ("make_offers.py", ["-a", applicants_file, "-o", prefix, "-r", rnd])
+            )
+
+    return SeasonInputs(workdir, prefix, applicants_file, summary_file, operations)
+
+
+def _rows(values):
+    # Sheet rows without the padding of empty cells
+    rows = []
+    for row in values:
+        row = list(row)
+        while row and row[-1] is None:
+            row.pop()
+        if row:
+            rows.append(row)
+    return rows
+
+
+def read_results(offers_file, summary_file, n_rounds):
+    """ What engines are compared on, read from an offers and a summary file
+
+    returns a dict of "Round_N" -> rows of the offers sheet, and
+    "seats:Round_N" -> [seat category, seats left] rows of the summary
+    """
+    import openpyxl
+
+    results = {}
+    wb = openpyxl.load_workbook(filename=offers_file)
+    for rnd in range(1, n_rounds + 1):
+        results["Round_" + str(rnd)] = _rows(wb["Round_" + str(rnd)].iter_rows(values_only=True))
+    wb = openpyxl.load_workbook(filename=summary_file)
+    for rnd in range(1, n_rounds + 1):
+        rows = wb["Round_" + str(rnd)].iter_rows(min_row=2, max_col=2, values_only=True)
+        results["seats:Round_" + str(rnd)] = [list(r) for r in rows if r[0] is not None]
+    return results
+
+
+@contextmanager
+def _in_dir(workdir):
+    # The scripts take their file names relative to where they are run
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def _quietly(script, main, argv):
+    out = io.StringIO()
+    with redirect_stdout(out):
+        status = main(argv)
+    if status:
+        tail = "\n".join(out.getvalue().splitlines()[-20:])
+        raise RuntimeError(f"{script} {' '.join(argv)} exited with {status}:\n{tail}")
+
+
+def run_scripts(season, inputs, make_flags=(), update_flags=()):
+    """ The reference: every run as make_offers.py / update_offers.py """
+    from . import make_offers
+    from . import update_offers
+    mains = {
+        "make_offers.py": (make_offers.main, list(make_flags)),
+        "update_offers.py": (update_offers.main, list(update_flags)),
+    }
+    with _in_dir(inputs.workdir):
+        for script, argv in inputs.operations:
+            main, flags = mains[script]
+            _quietly(script, main, argv + flags)
+        return read_results(
+            inputs.prefix + "_offers.xlsx", inputs.summary_file, len(season.rounds)
+        )
+
+
+def run_other_scripts(season, inputs, scripts_dir):
+    """ Every run with the make_offers.py / update_offers.py in scripts_dir """
+    for script, argv in inputs.operations:
+        run = subprocess.run(
+            [sys.executable, os.path.join(scripts_dir, script)] + argv,
+            cwd=inputs.workdir,
+            capture_output=True,
+            text=True,
+        )
+        if run.returncode:
+            tail = "\n".join((run.stdout + run.stderr).splitlines()[-20:])
+            raise RuntimeError(f"{script} {' '.join(argv)} exited with {run.returncode}:\n{tail}")
+    return read_results(
+        os.path.join(inputs.workdir, inputs.prefix + "_offers.xlsx"),
+        os.path.join(inputs.workdir, inputs.summary_file),
+        len(season.rounds),
+    )
+
+
+def _change_round_inputs(season, inputs, rnd):
+    """ Change one seat count of round rnd, or one status of round rnd - 1
+
+    returns a function that undoes the change
+    """
+    import openpyxl
+
+    from .offers_ledger import write_ledger
+
+    rng = random.Random(season.seed * 1000 + rnd)
+    offers_fname = inputs.prefix + "_offers.xlsx"
+    if rnd > 1 and rng.random() < 0.5:
+        wb = openpyxl.load_workbook(filename=offers_fname)
+        sh = wb["Round_" + str(rnd - 1)]
+        # Rows of offers, a never offered candidate has no seat category
+        rows = [
+            i for i in range(2, sh.max_row + 1)
+            if sh.cell(i, 1).value is not None and sh.cell(i, 7).value
+        ]
+        if rows:
+            row = rng.choice(rows)
+            status = sh.cell(row, 2).value
+            new_status = rng.choice([s for s in ("Accept", "Retain", "Reject") if s != status])
+
+            def set_status(value):
+                wb = openpyxl.load_workbook(filename=offers_fname)
+                wb["Round_" + str(rnd - 1)].cell(row, 2).value = value
+                wb.save(offers_fname)
+                write_ledger(offers_fname, wb)
+
+            set_status(new_status)
+            return partial(set_status, status)
+
+    wb = openpyxl.load_workbook(filename=inputs.summary_file)
+    sh = wb["Round_" + str(rnd)]
+    row = rng.randint(2, 1 + len(season.rounds[rnd - 1].rem_seats))
+    seats = sh.cell(row, 2).value
+
+    def set_seats(value):
+        wb = openpyxl.load_workbook(filename=inputs.summary_file)
+        wb["Round_" + str(rnd)].cell(row, 2).value = value
+        wb.save(inputs.summary_file)
+
+    set_seats(max(0, seats + rng.choice([-2, -1, 1, 2])))
+    return partial(set_seats, seats)
+
+
+def run_incremental(season, inputs):
+    """ Every round made with a changed input, then again with --incremental """
+    from . import make_offers
+    from . import update_offers
+    with _in_dir(inputs.workdir):
+        for script, argv in inputs.operations:
+            if script == "update_offers.py":
+                _quietly(script, update_offers.main, argv)
+                continue
+            rnd = int(argv[argv.index("-r") + 1])
+            undo = _change_round_inputs(season, inputs, rnd)
+            _quietly(script, make_offers.main, argv)
+            undo()
+            out = io.StringIO()
+            with redirect_stdout(out):
+                status = make_offers.main(argv + ["--incremental"])
+            if status or "-- Recomputing from merit position" not in out.getvalue():
+                tail = "\n".join(out.getvalue().splitlines()[-5:])
+                raise RuntimeError(f"round {rnd} was not remade incrementally:\n{tail}")
+        return read_results(
+            inputs.prefix + "_offers.xlsx", inputs.summary_file, len(season.rounds)
+        )
+
+
+def run_replay(season, inputs):
+    """ The whole season in memory with replay_season.py """
+    from .replay_season import SeasonReplay
+
+    with _in_dir(inputs.workdir), redirect_stdout(io.StringIO()):
+        replay = SeasonReplay(inputs.applicants_file, inputs.summary_file, "REPLAY")
+        replay.run(inputs.operations)
+        replay.write()
+        return read_results("REPLAY_offers.xlsx", "REPLAY_summary.xlsx", len(season.rounds))
+
+
+def run_api(season, inputs):
+    """ The whole season with offers_api.py, without any files """
+    import openpyxl
+
+    from .make_offers import fill_offers_sheet
+    from .offers_api import Season, apply_updates, make_round
+    from .offers_model import load_students
+
+    state = Season(load_students(None, season.applicants))
+    for round_spec in season.rounds:
+        rnd = round_spec.rnd
+        state.rounds[rnd] = make_round(state, rnd, round_spec.rem_seats, round_spec.factors)
+        for i, u in enumerate(round_spec.updates, 1):
+            state.rounds[rnd], _ = apply_updates(
+                state, rnd, u.rows, u.flg, "NA" if u.consolidated else PROGRAM,
+                f"update_{rnd}_{i}.xlsx",
+            )
+        if round_spec.remake:
+            st = state.rounds[rnd]
+            state.rounds[rnd] = make_round(state, rnd, st.rem_seats, st.factors)
+
+    results = {}
+    sh = openpyxl.Workbook().active
+    for rnd, st in state.rounds.items():
+        sh.delete_rows(1, sh.max_row)
+        fill_offers_sheet(sh, st.offers)
+        results["Round_" + str(rnd)] = _rows(sh.iter_rows(values_only=True))
+        results["seats:Round_" + str(rnd)] = [[k, v] for k, v in st.rem_seats.items()]
+    return results
+
+
+REFERENCE = "scripts"
+
+# name -> engine(season, inputs)
+ENGINES = {
+    REFERENCE: run_scripts,
+    "fast_save": partial(run_scripts, make_flags=["--fast_save"], update_flags=["--fast_save"]),
+    "incremental": run_incremental,
+    "replay": run_replay,
+    "api": run_api,
+}
+
+
+def load_engine(name):
+    """ A built-in engine, or module:function for another one """
+    if name in ENGINES:
+        return ENGINES[name]
+    module, _, function = name.partition(":")
+    if not function:
+        raise ValueError(f"unknown engine {name!r}, use one of {sorted(ENGINES)} or module:function")
+    return getattr(importlib.import_module(module), function)
+
+
+def first_difference(expected, got):
+    """ (sheet, row number, expected row, row got) where two results first differ """
+    for sheet in expected:
+        a, b = expected[sheet], got.get(sheet, [])
+        for i in range(max(len(a), len(b))):
+            ra = a[i] if i < len(a) else None
+            rb = b[i] if i < len(b) else None
+            if ra != rb:
+                return sheet, i + 1, ra, rb
+    return None
+
+
+def check_throughput(throughput, baseline, max_slowdown):
+    """ The engines that got slower than their baseline allows
+
+    Parameters
+    ----------
+    throughput, baseline : dict
+        engine -> applicants per second
+    returns a list of (engine, applicants per second, baseline)
+    """
+    slower = []
+    for name, aps in throughput.items():
+        if name in baseline and aps < baseline[name] * (1 - max_slowdown):
+            slower.append((name, aps, baseline[name]))
+    return slower
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--seasons", type=int, default=20, help="How many seasons to make up")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the first season, the next ones count up")
+    parser.add_argument("--applicants", type=int, default=150, help="Applicants per season")
+    parser.add_argument("--rounds", type=int, default=3, help="Rounds per season")
+    parser.add_argument(
+        "-e",
+        "--engine",
+        action="append",
+        help=f"Engine to check against the scripts, one of {sorted(ENGINES)} or "
+        "module:function (can be repeated, all built-in ones by default)",
+    )
+    parser.add_argument(
+        "--baseline", type=str, help="JSON file with the applicants per second of every engine"
+    )
+    parser.add_argument(
+        "--save_baseline",
+        action="store_true",
+        help="Write the throughput measured now to the --baseline file",
+    )
+    parser.add_argument(
+        "--max_slowdown",
+        type=float,
+        default=0.25,
+        help="Fail if an engine is this much slower than its baseline (0.25 = 25%%)",
+    )
+    parser.add_argument(
+        "--keep", type=str, help="Keep the files of seasons that differ under this directory"
+    )
+    parser.add_argument(
+        "--reference_scripts",
+        type=str,
+        help="Directory with the make_offers.py and update_offers.py to check against "
+        "(e.g. a checkout of the original scripts), run as they are",
+    )
+    parser.add_argument(
+        "--unique_updates",
+        action="store_true",
+        help="Update a candidate at most once per round, leaving out what is resolved "
+        "differently since the original scripts",
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Run the check, returns the exit status """
+    args = build_parser().parse_args(argv)
+    reference = REFERENCE
+    if args.reference_scripts:
+        reference = "reference_scripts"
+        for script in ("make_offers.py", "update_offers.py"):
+            if not os.path.isfile(os.path.join(args.reference_scripts, script)):
+                print(f"!!! ERROR: no {script} in {args.reference_scripts}")
+                return 2
+    names = [n for n in (args.engine or ENGINES) if n != reference]
+    try:
+        engines = {name: load_engine(name) for name in names}
+    except (ValueError, ImportError, AttributeError) as e:
+        print(f"!!! ERROR: {e}")
+        return 2
+    if args.reference_scripts:
+        run_reference = partial(run_other_scripts, scripts_dir=os.path.abspath(args.reference_scripts))
+        engines = {reference: run_reference, **engines}
+    else:
+        engines = {reference: ENGINES[REFERENCE], **engines}
+
+    seconds = dict.fromkeys(engines, 0.0)
+    n_failed = 0
+    n_applicants = 0
+    tmp = tempfile.mkdtemp(prefix="equivalence_")
+    try:
+        for seed in range(args.seed, args.seed + args.seasons):
+            season = random_season(seed, args.applicants, args.rounds, args.unique_updates)
+            n_applicants += args.applicants * len(season.rounds)
+            results = {}
+            differs = False
+            for name, engine in engines.items():
+                workdir = os.path.join(tmp, f"{seed}_{name.replace(':', '_')}")
+                inputs = write_inputs(season, workdir)
+                t0 = time.perf_counter()
+                try:
+                    results[name] = engine(season, inputs)
+                except Exception as e:
+                    print(f"!!! ERROR: season {seed}, {name} failed: {type(e).__name__}: {e}")
+                    differs = True
+                    continue
+                finally:
+                    seconds[name] += time.perf_counter() - t0
+                if name == reference or reference not in results:
+                    continue
+                diff = first_difference(results[reference], results[name])
+                if diff is not None:
+                    sheet, row, expected, got = diff
+                    print(f"!!! ERROR: season {seed}, {name} differs in {sheet} row {row}:")
+                    print(f"    {reference}: {expected}")
+                    print(f"    {name}: {got}")
+                    differs = True
+            n_updates = sum(len(r.updates) for r in season.rounds)
+            n_remakes = sum(r.remake for r in season.rounds)
+            print(
+                f"-- season {seed}: {len(season.rounds)} rounds, {n_updates} update files, "
+                + (f"{n_remakes} made again, " if n_remakes else "")
+                + ("DIFFERS" if differs else "same")
+            )
+            if differs:
+                n_failed += 1
+                if args.keep:
+                    for name in engines:
+                        src = os.path.join(tmp, f"{seed}_{name.replace(':', '_')}")
+                        shutil.copytree(src, os.path.join(args.keep, os.path.basename(src)), dirs_exist_ok=True)
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    throughput = {name: n_applicants / s for name, s in seconds.items() if s > 0}
+    width = max(12, len(reference) + 3)
+    print(f"\n  {'engine':<24} {'seconds':>9} {'applicants/s':>13} {'vs ' + reference:>{width}}")
+    for name in engines:
+        print(
+            f"  {name:<24} {seconds[name]:>9.2f} {throughput[name]:>13.0f} "
+            f"{throughput[name] / throughput[reference]:>{width - 1}.2f}x"
+        )
+
+    status = 0
+    if n_failed:
+        print(f"!!! ERROR: {n_failed} of {args.seasons} season(s) differ")
+        status = 1
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(throughput, f, indent=1)
+        print(f"-- Baseline written to {args.baseline}")
+    elif args.baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            print(f"!!! ERROR: no baseline {args.baseline}, write one with --save_baseline")
+            return 2
+        for name, aps, expected in check_throughput(throughput, baseline, args.max_slowdown):
+            print(
+                f"!!! ERROR: {name} makes {aps:.0f} applicants/s, its baseline is "
+                f"{expected:.0f} (more than {args.max_slowdown:.0%} slower)"
+            )
+            status = 1
+    return status
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
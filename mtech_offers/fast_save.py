@@ -0,0 +1,196 @@
+# -----------------------------------------------------------------------------
+# Fast save of one round sheet of the <prefix>_offers.xlsx workbook.
+#
+# Saving through openpyxl means loading every sheet of the workbook into
+# cell objects and writing all of them out again, even though a run only
+# changes the sheet of its round. An xlsx is a zip of XML parts, one part
+# per sheet, so here only the part of the round sheet is written:
+#
+#   * every other part (the other Round_k sheets, shared strings, styles,
+#     ...) is copied into the new zip as it is, without being parsed;
+#   * the round sheet keeps what comes before and after its <sheetData>
+#     (column widths, views, ...), and its rows are streamed out with the
+#     values inline, so there is no shared string table to rebuild;
+#   * the column headings all point at one bold cell format that is
+#     already in the workbook's styles.
+#
+# The ledger is written from the rows of the other sheets as they were
+# before (see offers_ledger.py) and the rows just written. When a workbook
+# can't be saved this way (no such sheet, no bold cell format yet, cell
+# values that XML can't hold) fast_save_round() returns False and the
+# caller saves it with openpyxl as usual.
+# -----------------------------------------------------------------------------
+from datetime import datetime
+from html import escape
+import math
+import re
+import xml.etree.ElementTree as ET
+
+from .offers_ledger import OFFER_COLUMNS, read_offer_sheets, write_ledger_sheets
+from .prefix_lock import atomic_replace
+from .sheet_reader import NS, sheet_parts
+
+COLUMN_LETTERS = "ABCDEFGHIJKLMNOP"
+
+# Characters openpyxl refuses to write either
+_ILLEGAL = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_FLOAT_FORMAT = "%.16g"
+
+# Rows are written out in blocks of this many
+_BLOCK = 1000
+
+
+def offer_rows(offers):
+    """ The offers dict as sheet rows (columns A..P), as they read back """
+    rows = []
+    for coap_id, v in offers.items():
+        row = (coap_id,) + tuple(v[c] for c in OFFER_COLUMNS[1:])
+        # Empty strings are not written, so they read back as empty cells
+        rows.append(tuple(None if x == "" else _number(x) for x in row))
+    return rows
+
+
+def _number(v):
+    # Floats are written with 16 digits, as openpyxl writes them
+    if isinstance(v, float):
+        return float(_FLOAT_FORMAT % v)
+    return v
+
+
+def bold_style(zin):
+    """ Index of a plain bold cell format in the workbook's styles, or None """
+    styles = ET.fromstring(zin.read("xl/styles.xml"))
+    bold_fonts = set()
+    for i, font in enumerate(styles.iterfind("main:fonts/main:font", NS)):
+        b = font.find("main:b", NS)
+        if b is not None and b.get("val", "1") not in ("0", "false"):
+            bold_fonts.add(str(i))
+    for i, xf in enumerate(styles.iterfind("main:cellXfs/main:xf", NS)):
+        if (
+            xf.get("fontId") in bold_fonts
+            and xf.get("numFmtId", "0") == "0"
+            and xf.get("fillId", "0") == "0"
+            and xf.get("borderId", "0") == "0"
+        ):
+            return i
+    return None
+
+
+def _cell(ref, v):
+    if isinstance(v, bool):
+        return f'<c r="{ref}" t="b"><v>{int(v)}</v></c>'
+    if isinstance(v, int):
+        return f'<c r="{ref}"><v>{v}</v></c>'
+    if isinstance(v, float):
+        return f'<c r="{ref}"><v>{_FLOAT_FORMAT % v}</v></c>'
+    return f'<c r="{ref}" t="inlineStr"><is><t xml:space="preserve">{escape(str(v), quote=False)}</t></is></c>'
+
+
+def _row(i, row):
+    cells = "".join(
+        _cell(f"{column}{i}", v) for column, v in zip(COLUMN_LETTERS, row) if v is not None
+    )
+    return f'<row r="{i}">{cells}</row>'
+
+
+def _writable(rows):
+    for row in rows:
+        for v in row:
+            if isinstance(v, float) and not math.isfinite(v):
+                return False
+            if v is None or isinstance(v, (bool, int, float)):
+                continue
+            if isinstance(v, datetime) or not isinstance(v, str) or _ILLEGAL.search(v):
+                return False
+    return True
+
+
+def _split_sheet(xml):
+    """ (what comes before <sheetData>, what comes after it) in a sheet part """
+    start = xml.find(b"<sheetData")
+    if start < 0:
+        return None
+    end = xml.find(b"</sheetData>", start)
+    if end >= 0:
+        end += len(b"</sheetData>")
+    else:
+        # <sheetData/>
+        end = xml.find(b">", start) + 1
+    head = re.sub(rb"<dimension [^>]*/>", b"", xml[:start])
+    return head, xml[end:]
+
+
+def _write_sheet(f, head, tail, style, rows):
+    last = len(rows) + 1
+    dimension = f'<dimension ref="A1:P{last}"/>'.encode()
+    # The dimension goes right after <sheetPr>, or first when there is none
+    m = re.search(rb"</sheetPr>|<sheetPr[^>]*/>", head)
+    if m is None:
+        m = re.search(rb"<worksheet[^>]*>", head)
+    f.write(head[: m.end()] + dimension + head[m.end():])
+
+    headings = "".join(
+        f'<c r="{column}1" s="{style}" t="inlineStr"><is><t>{heading}</t></is></c>'
+        for column, heading in zip(COLUMN_LETTERS, OFFER_COLUMNS)
+    )
+    f.write(f'<sheetData><row r="1">{headings}</row>'.encode())
+    for b in range(0, len(rows), _BLOCK):
+        f.write(
+            "".join(
+                _row(i, row) for i, row in enumerate(rows[b : b + _BLOCK], b + 2)
+            ).encode("utf-8")
+        )
+    f.write(b"</sheetData>" + tail)
+
+
+def fast_save_round(offers_file, offers, rnd):
+    """ Write the offers of a round into the offers workbook (see above)
+
+    Parameters
+    ----------
+    offers_file : str
+        The offers workbook, which must already have a Round_<rnd> sheet
+    offers : dict
+        coap_id -> offer, in the order the rows are written
+    rnd : int
+        The round whose sheet is written
+    returns True if the workbook was saved, False if it has to be saved
+    with openpyxl instead
+    """
+    # Only needed when saving, the scripts start faster without it
+    import zipfile
+
+    title = "Round_" + str(rnd)
+    rows = offer_rows(offers)
+    if not _writable(rows):
+        return False
+
+    with zipfile.ZipFile(offers_file) as zin:
+        part = sheet_parts(zin).get(title)
+        style = bold_style(zin)
+        if part is None or style is None or part not in zin.namelist():
+            return False
+        parts = _split_sheet(zin.read(part))
+        if parts is None:
+            return False
+        head, tail = parts
+
+        # The other sheets for the ledger, while the workbook is unchanged
+        sheets = read_offer_sheets(offers_file)
+        sheets[title] = rows
+
+        def write(tmp_fname):
+            with zipfile.ZipFile(tmp_fname, "w", zipfile.ZIP_DEFLATED) as zout:
+                for info in zin.infolist():
+                    if info.filename == part:
+                        with zout.open(info.filename, "w", force_zip64=True) as f:
+                            _write_sheet(f, head, tail, style, rows)
+                    else:
+                        zout.writestr(info, zin.read(info))
+
+        atomic_replace(offers_file, write)
+
+    # Keep the columnar ledger in sync with the xlsx
+    write_ledger_sheets(offers_file, list(sheets.items()))
+    return True
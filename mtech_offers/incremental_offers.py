@@ -0,0 +1,265 @@
+# -----------------------------------------------------------------------------
+# Incremental re-runs of make_offers.py for a round.
+#
+# After offers are made, the state of the allocation is kept in
+# <prefix>_Round_N_state.json: the offers per category that were available,
+# the previous rounds' offers that were taken into account, and a hash of
+# the applicants and of the round sheet as written. How far each category
+# got is not kept, it is read back from the round sheet itself.
+#
+# When make_offers.py -r N --incremental is run again after a correction
+# (a seat count or multiplier in the summary, or a status in an earlier
+# round), the first merit position whose decision changes is found from
+# that state. Everything before it is kept as it is, the allocation is
+# resumed from there, and only the rows of the round sheet from the first
+# changed offer on are rewritten.
+# -----------------------------------------------------------------------------
+from dataclasses import asdict
+import hashlib
+import json
+import os
+
+from .offers_ledger import OFFER_COLUMNS, read_offer_sheets
+
+STATE_VERSION = 1
+
+
+def round_state_fname(offers_prefix, rnd):
+    return f"{offers_prefix}_Round_{rnd}_state.json"
+
+
+def merit_order(students):
+    """ The order process_applicants() goes through the applicants in """
+    return sorted(students, key=lambda x: (x.gate_score, x.btech_score), reverse=True)
+
+
+def students_sha256(students):
+    h = hashlib.sha256()
+    for s in students:
+        h.update(json.dumps(asdict(s), default=str, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def sheet_sha256(rows):
+    """ Hash of the rows of a round sheet, as read back """
+    h = hashlib.sha256()
+    for r in rows:
+        if r[0] is not None:
+            h.update(json.dumps(list(r), default=str).encode())
+    return h.hexdigest()
+
+
+def prev_signature(pos_dict, neg_dict, prev_offers_dict):
+    """ What the allocation uses of the previous rounds, per coap_id """
+    return {
+        str(coap_id): [
+            coap_id in pos_dict,
+            coap_id in neg_dict,
+            o["status"],
+            o["offer_seat_category"],
+            o["reason"],
+        ]
+        for coap_id, o in prev_offers_dict.items()
+    }
+
+
+def _uses_seat(status):
+    # make_offer() only takes a seat off for these
+    return status in ["Retain", "Initial_Offer"]
+
+
+def _new_offer_category(rem_offers, category):
+    # The seat category offer_applicant() offers a new applicant, or None
+    if rem_offers["gen"] > 0:
+        return "gen"
+    if category != "gen" and rem_offers[category] > 0:
+        return category
+    return None
+
+
+def save_round_state(
+    offers_prefix, rnd, students, rem_offers, prev_sig, offers_file, joint=None
+):
+    """ Remember the allocation of a round, after its sheet was written
+
+    Parameters
+    ----------
+    rem_offers : dict
+        The offers per seat category there were to make
+    prev_sig : dict
+        See prev_signature()
+    joint : dict
+        The programs and preferences of a joint run (see joint_offers.py),
+        None for a make_offers.py run
+    """
+    rows = read_offer_sheets(offers_file, ["Round_" + str(rnd)])["Round_" + str(rnd)]
+    state = {
+        "version": STATE_VERSION,
+        "round": rnd,
+        "students_sha256": students_sha256(students),
+        "rem_offers": rem_offers,
+        "prev": prev_sig,
+        "sheet_sha256": sheet_sha256(rows),
+    }
+    if joint is not None:
+        state["joint"] = joint
+    fname = round_state_fname(offers_prefix, rnd)
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp_fname, fname)
+
+
+def load_round_state(offers_prefix, rnd):
+    fname = round_state_fname(offers_prefix, rnd)
+    if not os.path.exists(fname):
+        return None
+    with open(fname) as f:
+        state = json.load(f)
+    if state.get("version") != STATE_VERSION:
+        return None
+    return state
+
+
+def first_affected_position(state, order, rem_offers, prev_sig, old_offers):
+    """ The first merit position whose decision differs from the last run
+
+    Parameters
+    ----------
+    order : list of Student objects
+        In merit order
+    rem_offers : dict
+        The offers per seat category to make now
+    old_offers : dict
+        The offers made in the last run, as read from the sheet
+    returns a position, len(order) if nothing changes
+    """
+    first = len(order)
+
+    # Applicants whose previous offers changed
+    old_prev = state["prev"]
+    changed = {c for c in set(old_prev) | set(prev_sig) if old_prev.get(c) != prev_sig.get(c)}
+    for i, s in enumerate(order):
+        if str(s.coap_id) in changed:
+            first = i
+            break
+
+    # Applicants who get another seat category (or none) with the new counts
+    if rem_offers != state["rem_offers"]:
+        old_rem = dict(state["rem_offers"])
+        new_rem = dict(rem_offers)
+        for i, s in enumerate(order[:first]):
+            if str(s.coap_id) not in prev_sig:
+                if _new_offer_category(old_rem, s.category) != _new_offer_category(
+                    new_rem, s.category
+                ):
+                    return i
+            o = old_offers.get(s.coap_id)
+            if o is not None and _uses_seat(o["status"]):
+                old_rem[o["offer_seat_category"]] -= 1
+                new_rem[o["offer_seat_category"]] -= 1
+    return first
+
+
+def keep_offers(order, first, old_offers, rem_offers):
+    """ The offers of the last run before merit position first
+
+    Their seats are taken off rem_offers.
+    returns the offers dict, in merit order
+    """
+    offers = {}
+    for s in order[:first]:
+        o = old_offers.get(s.coap_id)
+        if o is not None:
+            offers[s.coap_id] = o
+            if _uses_seat(o["status"]):
+                rem_offers[o["offer_seat_category"]] -= 1
+    return offers
+
+
+def resume_allocation(
+    order, first, old_offers, rem_offers, pos_dict, neg_dict, prev_offers_dict, offer_applicant
+):
+    """ Keep the offers before merit position first and allocate the rest
+
+    returns the offers dict, in merit order
+    """
+    offers = keep_offers(order, first, old_offers, rem_offers)
+    for s in order[first:]:
+        offer_applicant(offers, s, rem_offers, pos_dict, neg_dict, prev_offers_dict)
+    return offers
+
+
+def offers_from_rows(rows):
+    """ The offers dict (as make_offer() builds it) for the rows of a sheet """
+    offers = {}
+    for r in rows:
+        if r[0] is None:
+            continue
+        offers[r[0]] = {k: v for k, v in zip(OFFER_COLUMNS[1:], r[1:])}
+    return offers
+
+
+def first_changed_row(old_offers, new_offers):
+    """ Index of the first offer that differs between two offers dicts """
+    def same(a, b):
+        return all((a[k] in (None, "")) and (b[k] in (None, "")) or a[k] == b[k] for k in a)
+
+    old_items = list(old_offers.items())
+    for j, (coap_id, o) in enumerate(new_offers.items()):
+        if j >= len(old_items):
+            return j
+        old_coap_id, old_o = old_items[j]
+        if old_coap_id != coap_id or not same(o, old_o):
+            return j
+    return len(new_offers) if len(new_offers) < len(old_items) else None
+
+
+def remake_round(
+    offers_prefix, rnd, students, rem_offers, pos_dict, neg_dict, prev_offers_dict,
+    sheets, offer_applicant,
+):
+    """ Redo a round's allocation from the first merit position that changed
+
+    Parameters
+    ----------
+    rem_offers : dict
+        The offers per seat category to make, used up as offers are made
+    sheets : dict
+        The offers sheets as read now (see read_offer_sheets)
+    offer_applicant : function
+        make_offers.offer_applicant
+    returns (offers dict, index of the first changed offer or None if
+    nothing changed), or None when the whole round has to be redone
+    """
+    state = load_round_state(offers_prefix, rnd)
+    rows = sheets.get("Round_" + str(rnd), [])
+    if state is None:
+        print(f"-- No state of an earlier run for round {rnd}, making all offers")
+        return None
+    if state.get("joint"):
+        # Its offers follow the joint rules, which one program can't resume
+        programs = ", ".join(state["joint"]["programs"])
+        print(
+            f"-- Round_{rnd} was made jointly with {programs} (see joint_offers.py "
+            "--incremental), making all offers"
+        )
+        return None
+    if state["students_sha256"] != students_sha256(students):
+        print("-- The applicants changed since the last run, making all offers")
+        return None
+    if state["sheet_sha256"] != sheet_sha256(rows):
+        print(f"-- Round_{rnd} was changed since the last run, making all offers")
+        return None
+
+    order = merit_order(students)
+    old_offers = offers_from_rows(rows)
+    prev_sig = prev_signature(pos_dict, neg_dict, prev_offers_dict)
+    first = first_affected_position(state, order, rem_offers, prev_sig, old_offers)
+    print(f"-- Recomputing from merit position {first} of {len(order)}")
+
+    offers = resume_allocation(
+        order, first, old_offers, rem_offers, pos_dict, neg_dict, prev_offers_dict,
+        offer_applicant,
+    )
+    return offers, first_changed_row(old_offers, offers)
@@ -0,0 +1,413 @@
+# -----------------------------------------------------------------------------
+# Make a round's offers for several programs at once.
+#
+# When every program runs make_offers.py on its own, a top candidate gets
+# an offer from each program they applied to and holds a seat in all of
+# them until COAP resolves it. Here all applicants of all programs are
+# taken in one merit order (GATE score, then BTech score) and each gets at
+# most one new offer in the round:
+#
+#   * offers carried over from earlier rounds (Accept/Retain) are made again
+#     in their program, as make_offers.py does;
+#   * a candidate who accepted an offer gets no other offer;
+#   * otherwise the programs are tried in the candidate's order of
+#     preference (from the -pref file), or in the order the programs were
+#     given on the command line, and the first program that has a seat
+#     for them under its usual rule (general seats first, then the
+#     candidate's category) makes the offer. A candidate holding a
+#     retained offer is only offered a program they prefer to it, and only
+#     if they gave their preferences.
+#
+# With a single program this makes exactly the offers make_offers.py makes.
+#
+# The state of the round is saved for every program as make_offers.py saves
+# it (see incremental_offers.py), marked with the programs and preferences
+# of the run. With --incremental a joint round is redone from the first
+# position of the joint merit order that changed in any of the programs.
+# -----------------------------------------------------------------------------
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+import argparse
+import csv
+import hashlib
+import json
+import math
+import sys
+import time
+
+from .make_offers import (
+    load_all_previous_offers,
+    offer_applicant,
+    patch_offers_sheet,
+    update_cutoffs_in_summary,
+    write_offer_to_workbook,
+)
+from .applicant_dedupe import report_duplicates
+from .decision_log import DecisionLog
+from .incremental_offers import (
+    first_affected_position,
+    first_changed_row,
+    keep_offers,
+    load_round_state,
+    merit_order,
+    offers_from_rows,
+    prev_signature,
+    save_round_state,
+    sheet_sha256,
+    students_sha256,
+)
+from .offers_model import MASTER_FILE_ROW_START, load_students, load_summary
+from .prefix_lock import prefix_lock
+from .preflight import Preflight
+from .round_stats import RoundStats
+from .season_log import log_operation
+
+
+@dataclass
+class ProgramRound:
+    """A class for holding one program's state while offers are made"""
+
+    prefix: str
+    students: dict  # coap_id -> Student, in master file order
+    rem_offers: dict
+    pos_dict: dict = field(default_factory=dict)
+    neg_dict: dict = field(default_factory=dict)
+    prev_offers_dict: dict = field(default_factory=dict)
+    offers: dict = field(default_factory=dict)
+    stats: RoundStats = field(default_factory=RoundStats)
+    events: DecisionLog = None
+
+
+def load_preferences(pref_file, prefixes):
+    """ load the applicants' program preferences.
+
+    Parameters
+    ----------
+    pref_file : str
+        A CSV file with rows of coap_id followed by program prefixes, most
+        preferred first
+    prefixes : list of str
+        The prefixes of the programs in this run
+    returns a dict of coap_id -> list of prefixes
+    """
+    preferences = {}
+    with open(pref_file, newline="") as f:
+        for line, row in enumerate(csv.reader(f), 1):
+            row = [v.strip() for v in row if v.strip()]
+            if not row or row[0].lower() == "coap_id":
+                continue
+            unknown = [p for p in row[1:] if p not in prefixes]
+            if unknown:
+                raise ValueError(f"{pref_file}:{line}: unknown program(s) {unknown}")
+            preferences[row[0]] = row[1:]
+    return preferences
+
+
+def joint_signature(programs, preferences):
+    """ What a joint round was made with besides each program's own inputs """
+    preferences_json = json.dumps(preferences or {}, sort_keys=True)
+    return {
+        "programs": [p.prefix for p in programs],
+        "preferences_sha256": hashlib.sha256(preferences_json.encode()).hexdigest(),
+    }
+
+
+def joint_merit_order(programs):
+    """ The applicants of all programs in one merit order
+
+    Ties keep the order of the files.
+    """
+    applicants = {}
+    for p in programs:
+        for coap_id, s in p.students.items():
+            applicants.setdefault(coap_id, s)
+    return sorted(
+        applicants.values(), key=lambda x: (x.gate_score, x.btech_score), reverse=True
+    )
+
+
+def allocate_jointly(programs, preferences=None, start=0, verbose=True):
+    """ Make the offers of all programs in one pass over the merit order
+
+    Parameters
+    ----------
+    programs : list of ProgramRound objects
+        In the default order of preference
+    preferences : dict
+        Optional, coap_id -> list of prefixes, most preferred first
+    start : int
+        Position in the joint merit order to start from, the offers before
+        it are already in the programs (see remake_joint_round)
+    verbose : bool
+        Print what is done, as the scripts do
+    """
+    preferences = preferences or {}
+    by_prefix = {p.prefix: p for p in programs}
+
+    for first in joint_merit_order(programs)[start:]:
+        coap_id = first.coap_id
+        if coap_id in preferences:
+            ranked = [by_prefix[prefix] for prefix in preferences[coap_id]]
+        else:
+            ranked = programs
+        ranked = [p for p in ranked if coap_id in p.students]
+
+        # Offers from earlier rounds are made again in any case.
+        held, accepted = [], False
+        for p in programs:
+            if coap_id not in p.students or coap_id not in p.prev_offers_dict:
+                continue
+            status = offer_applicant(
+                p.offers,
+                p.students[coap_id],
+                p.rem_offers,
+                p.pos_dict,
+                p.neg_dict,
+                p.prev_offers_dict,
+                p.stats,
+                p.events,
+                verbose,
+            )
+            if status == "Accept":
+                accepted = True
+            elif status is not None:
+                held.append(p)
+        if accepted:
+            continue
+        if held:
+            if coap_id not in preferences:
+                continue
+            # Only an upgrade to a program they prefer
+            best = [p for p in ranked if p in held]
+            if best:
+                ranked = ranked[: ranked.index(best[0])]
+
+        for p in ranked:
+            if coap_id in p.prev_offers_dict:
+                continue
+            status = offer_applicant(
+                p.offers,
+                p.students[coap_id],
+                p.rem_offers,
+                p.pos_dict,
+                p.neg_dict,
+                p.prev_offers_dict,
+                p.stats,
+                p.events,
+                verbose,
+            )
+            if status is not None:
+                break
+
+
+def remake_joint_round(programs, rnd, preferences, sheets):
+    """ Redo a joint round from the first position that changed in any program
+
+    Parameters
+    ----------
+    programs : list of ProgramRound objects
+        As for allocate_jointly(), with no offers yet
+    sheets : dict
+        prefix -> the offers sheets as read now (see read_offer_sheets)
+    returns a dict of prefix -> index of the first changed offer (None if
+    nothing changed), or None when the whole round has to be redone
+    """
+    signature = joint_signature(programs, preferences)
+    order = joint_merit_order(programs)
+    position = {s.coap_id: i for i, s in enumerate(order)}
+
+    start, old_offers = len(order), {}
+    for p in programs:
+        state = load_round_state(p.prefix, rnd)
+        students = list(p.students.values())
+        rows = sheets[p.prefix].get("Round_" + str(rnd), [])
+        if state is None or state.get("joint") != signature:
+            print(
+                f"-- No state of an earlier joint run of these programs for "
+                f"{p.prefix} round {rnd}, making all offers"
+            )
+            return None
+        if state["students_sha256"] != students_sha256(students):
+            print(f"-- The applicants of {p.prefix} changed since the last run, making all offers")
+            return None
+        if state["sheet_sha256"] != sheet_sha256(rows):
+            print(f"-- {p.prefix} Round_{rnd} was changed since the last run, making all offers")
+            return None
+
+        p_order = merit_order(students)
+        old_offers[p.prefix] = offers_from_rows(rows)
+        prev_sig = prev_signature(p.pos_dict, p.neg_dict, p.prev_offers_dict)
+        first = first_affected_position(
+            state, p_order, p.rem_offers, prev_sig, old_offers[p.prefix]
+        )
+        # Ties can be in another order in the joint merit order, so from
+        # the earliest of this program's applicants from first on
+        start = min([start] + [position[s.coap_id] for s in p_order[first:]])
+    print(f"-- Recomputing from joint merit position {start} of {len(order)}")
+
+    for p in programs:
+        p.offers = keep_offers(order, start, old_offers[p.prefix], p.rem_offers)
+    allocate_jointly(programs, preferences, start)
+    return {p.prefix: first_changed_row(old_offers[p.prefix], p.offers) for p in programs}
+
+
+def main(argv=None, inputs=None):
+    """ Make the offers of a round for several programs jointly
+
+    Parameters
+    ----------
+    argv : list of str
+        The command line arguments, sys.argv[1:] by default
+    inputs : InputCache
+        Optional, parsed input files shared between runs (see preflight.py)
+    returns the exit status
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+    rnd = args.round
+
+    # -op PREFIX or -op PREFIX=APPLICANTS_FILE
+    specs = []
+    for spec in args.offers_prefix:
+        prefix, _, applicants_file = spec.partition("=")
+        applicants_file = applicants_file or args.applicants_file
+        if not applicants_file:
+            print(f"!!! ERROR: no applicants file for {prefix}, use -a or -op {prefix}=FILE")
+            return 1
+        specs.append((prefix, applicants_file))
+    prefixes = [prefix for prefix, _ in specs]
+    if len(set(prefixes)) != len(prefixes):
+        print("!!! ERROR: a prefix is given more than once")
+        return 1
+
+    preferences = {}
+    if args.preferences_file:
+        try:
+            preferences = load_preferences(args.preferences_file, prefixes)
+        except (OSError, ValueError) as e:
+            print(f"!!! ERROR: {e}")
+            return 1
+
+    # Lock every prefix, always in the same order so that two joint runs
+    # can't wait on each other.
+    with ExitStack() as cleanup:
+        for prefix in sorted(prefixes):
+            cleanup.enter_context(prefix_lock(prefix))
+
+        checks, programs = [], []
+        for prefix, applicants_file in specs:
+            c = Preflight(inputs)
+            c.check_applicants(applicants_file, MASTER_FILE_ROW_START)
+            c.check_summary(prefix + "_summary.xlsx", rnd)
+            c.check_offers(prefix + "_offers.xlsx", rnd, updating=False)
+            checks.append(c)
+        if not all([c.report() for c in checks]):
+            return 1
+
+        t0 = time.perf_counter()
+        for (prefix, applicants_file), c in zip(specs, checks):
+            rem_seats, factors, rem_offers = {}, {}, {}
+            load_summary(prefix + "_summary.xlsx", rnd, rem_seats, factors, c.summary_values)
+            for k, v in rem_seats.items():
+                rem_offers[k] = math.ceil(int(v) * float(factors[k]))
+            duplicates = []
+            students = load_students(applicants_file, c.applicant_values, duplicates)
+            report_duplicates(duplicates, prefix, rnd)
+            p = ProgramRound(prefix, {s.coap_id: s for s in students}, rem_offers)
+            p.events = cleanup.enter_context(
+                DecisionLog(prefix, "joint_offers.py", rnd, argv)
+            )
+            if rnd > 1:
+                p.prev_offers_dict = load_all_previous_offers(
+                    prefix + "_offers.xlsx", rnd, p.pos_dict, p.neg_dict, c.offer_sheets
+                )
+            programs.append(p)
+
+        # Kept with the offers, for incremental re-runs of this round
+        initial_rem_offers = {p.prefix: dict(p.rem_offers) for p in programs}
+        prev_sigs = {
+            p.prefix: prev_signature(p.pos_dict, p.neg_dict, p.prev_offers_dict)
+            for p in programs
+        }
+
+        changed = None
+        if args.incremental:
+            sheets = {p.prefix: c.offer_sheets for p, c in zip(programs, checks)}
+            changed = remake_joint_round(programs, rnd, preferences, sheets)
+        if changed is None:
+            allocate_jointly(programs, preferences)
+        print(f"-- Joint allocation done in {time.perf_counter() - t0:.2f}s")
+
+        for p in programs:
+            n_new = sum(o["status"] == "Initial_Offer" for o in p.offers.values())
+            print(f"-- {p.prefix}: {len(p.offers)} offers, {n_new} new")
+            offers_file = p.prefix + "_offers.xlsx"
+            if changed is None:
+                write_offer_to_workbook(offers_file, p.offers, rnd)
+                update_cutoffs_in_summary(p.stats, p.prefix + "_summary.xlsx", rnd)
+            elif changed[p.prefix] is None:
+                print(f"-- Nothing changed in {p.prefix} Round_{rnd}")
+            else:
+                print(f"-- Rewriting {p.prefix} Round_{rnd} from offer {changed[p.prefix] + 1} on")
+                patch_offers_sheet(offers_file, p.offers, rnd, changed[p.prefix])
+                update_cutoffs_in_summary(
+                    RoundStats.from_offers(p.offers), p.prefix + "_summary.xlsx", rnd
+                )
+            save_round_state(
+                p.prefix,
+                rnd,
+                list(p.students.values()),
+                initial_rem_offers[p.prefix],
+                prev_sigs[p.prefix],
+                offers_file,
+                joint_signature(programs, preferences),
+            )
+            log_operation(p.prefix, ["joint_offers.py"] + list(argv))
+
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--applicants_file",
+        type=str,
+        help="The master file containing all the applications, if all programs share one",
+    )
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        action="append",
+        required=True,
+        help="A program's prefix, or PREFIX=APPLICANTS_FILE for its own master file. "
+        "Give it once per program, in the default order of preference.",
+    )
+    parser.add_argument(
+        "-r",
+        "--round",
+        type=int,
+        required=True,
+        help="Current round of offers to make",
+    )
+    parser.add_argument(
+        "-pref",
+        "--preferences_file",
+        type=str,
+        help="CSV with coap_id followed by the candidate's program prefixes, most preferred first",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only redo the round from the first offer affected by changes since the last joint run",
+    )
+    return parser
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,614 @@
+# -----------------------------------------------------------------------------
+# Code to automate making offers to MTech students.
+#
+# May 2020, M. Kaul
+# -----------------------------------------------------------------------------
+import argparse
+import math
+import sys
+from time import perf_counter_ns
+
+# The rest of the package is imported where it is needed, so that --help
+# and argument errors come back without loading it (see cli.py)
+
+# Remaining seats per category dict
+# rem_seats = {"gen": 4, "obc_nc": 3, "ews": 1, "sc": 2, "st": 1, "pwd": 1}
+# Factors per category dict
+# factors = {"gen": 2, "obc_nc": 2, "ews": 2, "sc": 2, "st": 2, "pwd": 2}
+# remaining offers per category dict
+
+
+def load_all_previous_offers(offers_file, rnd, pos_dict, neg_dict, sheets=None):
+    """ load all student offers from each round
+
+    Parameters
+    ----------
+    offers_file : str
+        The name of file to load offer details from
+    rnd : int
+        The current round
+    sheets : dict
+        Optional, the sheets of the offers file if they were already read
+        (see read_offer_sheets)
+    returns a dict of offer objects
+    """
+    from .offers_ledger import read_offer_sheets, round_titles
+    from .offers_model import Offer, OfferRow
+
+    # Only the sheets of the previous rounds are read, from the
+    # memory-mapped ledger when it is up to date
+    titles = round_titles(rnd - 1)
+    if sheets is None:
+        sheets = read_offer_sheets(offers_file, titles)
+
+    # Lets iterate through the previous round sheets to build our
+    # offers dictionary
+    offers_dict = {}
+    for title in titles:
+        print(f"-- Processing previous worksheet {title}")
+
+        # Load the rows from file for particular columns of interest
+        rows = [OfferRow(*r) for r in sheets[title]]
+        # Iterate through the rows and build up the students
+        for r in rows:
+            # No need to load students who have been offered in
+            # previous round but are still at "Initial_Offer"
+            # status.
+            if r.c == "Initial_Offer":
+                continue
+
+            o = Offer(
+                coap_id=r.a,
+                status=r.b,
+                reason=r.c,
+                name=r.d,
+                gender=r.e,
+                student_category=r.f,
+                offer_seat_category=r.g,
+                appl_id=r.h,
+                gate_id=r.i,
+                disabled_flg=r.j,
+                gate_score=r.k,
+                btech_score=r.l,
+                email=r.m,
+                mobile=r.n,
+                gate_stream=r.o,
+                btech_stream=r.p,
+            )
+            offers_dict[o.coap_id] = {
+                "status": o.status,
+                "reason": o.reason,
+                "name": o.name,
+                "gender": o.gender,
+                "student_category": o.student_category,
+                "offer_seat_category": o.offer_seat_category,
+                "appl_id": o.appl_id,
+                "gate_id": o.gate_id,
+                "disabled_flg": o.disabled_flg,
+                "gate_score": o.gate_score,
+                "btech_score": o.btech_score,
+                "email": o.email,
+                "mobile": o.mobile,
+                "gate_stream": o.gate_stream,
+                "btech_stream": o.btech_stream,
+            }
+
+            # Let us just separate out the +ve and -ve COAPs
+            if o.status in ["Accept", "Retain"]:
+                pos_dict[o.coap_id] = 1
+            elif o.status == "Reject":
+                neg_dict[o.coap_id] = 1
+
+    return offers_dict
+
+
+def make_offer(offers, s, seat_category, rem_offers, status, reason, stats=None):
+    # s.status = "Offered"
+    offers[s.coap_id] = {
+        "gate_score": s.gate_score,
+        "name": s.name,
+        "gender": s.gender,
+        "student_category": s.category,
+        "disabled_flg": s.disabled_flg,
+        "btech_score": s.btech_score,
+        "status": status,
+        "reason": reason,
+        "offer_seat_category": seat_category,  # Want to keep track of seat category
+        "gate_id": s.gate_id,
+        "appl_id": s.appl_id,
+        "email": s.email,
+        "mobile": s.mobile,
+        "gate_stream": s.gate_stream,
+        "btech_stream": s.btech_stream,
+    }
+    # print(f"for (coap,gate,appl) = ({s.coap_id}, {s.gate_id}, {s.appl_id})")
+    # print(offers[(s.coap_id, s.gate_id, s.appl_id)])
+
+    # Keep the per category cutoffs and counts up to date as we go
+    if stats is not None:
+        stats.record(s.coap_id, seat_category, status, s.gate_score, s.btech_score)
+
+    # For "Accept" status, we don't reduce the number of
+    # offers.
+    if status in ["Retain", "Initial_Offer"]:
+     rem_offers[seat_category] -= 1
+
+    return offers
+
+
+def offer_applicant(
+    offers, s, rem_offers, pos_dict, neg_dict, prev_offers_dict, stats=None, events=None,
+    verbose=True,
+):
+    """ Make an offer to one applicant, the next one in merit order
+
+    Parameters
+    ----------
+    s : Student
+        The applicant
+    stats : RoundStats
+        Optional, updated with the offer if one is made
+    events : DecisionLog
+        Optional, the decision is recorded in it
+    verbose : bool
+        Print what is done, as the scripts do
+    returns the status of the offer made, None if no offer was made
+    """
+    # The clock of decision_log.timer(), it is not imported per applicant
+    if events is not None:
+        t0 = perf_counter_ns()
+        before = dict(rem_offers)
+
+    status, rule, seat_category = None, "no_seat", s.category
+    # This student was made an offer earlier...
+    if s.coap_id in prev_offers_dict:
+        if verbose:
+            print(f"--- Found coap_id in previous offers dict ...")
+        seat_category = prev_offers_dict[s.coap_id]["offer_seat_category"]
+        rule = "no_response"
+        # 0. Skip people in negative dict
+        if s.coap_id in neg_dict:
+            if verbose:
+                print(
+                    f"--- [In -ve list] Found coap_id in previous offers (in sheet) ..."
+                )
+            rule = "negative_list"
+        # Make sure to make the offer with SAME seat category and status
+        elif s.coap_id in pos_dict:
+            if verbose:
+                print(
+                    f"--- [In +ve list] Found coap_id in previous offers (in sheet), so re-offer ..."
+                )
+            prev_seat_category = prev_offers_dict[s.coap_id]["offer_seat_category"]
+            prev_status = prev_offers_dict[s.coap_id]["status"]
+            prev_reason = prev_offers_dict[s.coap_id]["reason"]
+            offers = make_offer(
+                offers,
+                s,
+                prev_seat_category,
+                rem_offers,
+                prev_status,
+                prev_reason,
+                stats,
+            )
+            status, rule = prev_status, "carried_over"
+    # This student was never made an offer by us...
+    else:
+        # print(f"--- This coap_id was not offered a seat from IITH previously ...")
+        # 1. First we fill up general category!
+        # print(f"\n---- Processing student category = {s.category}")
+        if rem_offers["gen"] > 0:
+            # print(f'[before gen offer]: rem_offers --> {rem_offers}')
+            offers = make_offer(
+                offers, s, "gen", rem_offers, "Initial_Offer", "", stats
+            )
+            # print(f'[after gen offer]: rem_offers --> {rem_offers}')
+            status, rule, seat_category = "Initial_Offer", "gen_seat", "gen"
+
+        # all offers in seat = general category are exhausted.
+        elif rem_offers["gen"] <= 0 and s.category != "gen":
+            # Check in category other than general
+            if rem_offers[s.category] > 0:
+                # print(f'[before category offer]: rem_offers --> {rem_offers}')
+                offers = make_offer(
+                    offers, s, s.category, rem_offers, "Initial_Offer", "", stats
+                )
+                # print(f'[after category offer]: rem_offers --> {rem_offers}')
+                status, rule = "Initial_Offer", "category_seat"
+
+    if events is not None:
+        events.record(
+            s.coap_id,
+            rule,
+            status,
+            seat_category,
+            before.get(seat_category),
+            rem_offers.get(seat_category),
+            perf_counter_ns() - t0,
+        )
+    return status
+
+
+def process_applicants(
+    offers, students, rem_offers, pos_dict, neg_dict, prev_offers_dict, stats=None,
+    events=None, verbose=True, in_merit_order=False,
+):
+    """ Process the list of applicants in order and make offers
+
+    Parameters
+    ----------
+    students : list of Student objects
+        The list of students, or a DataFrame or Arrow table with a column
+        per Student field (see offers_frames.py)
+    stats : RoundStats
+        Optional, updated with every offer that is made
+    events : DecisionLog
+        Optional, every decision is recorded in it
+    verbose : bool
+        Print what is done, as the scripts do
+    in_merit_order : bool
+        students is an iterator that is already in merit order (see
+        merit_order.py). It is read only as far as needed: once no seat
+        is left and every earlier offer to carry over was seen, the rest
+        can't change the offers.
+    returns
+    """
+    from .offers_frames import frame_students
+
+    # Iterate through students in desc order of GATE score then
+    # btech_score
+
+    from_frame = frame_students(students)
+    if from_frame is not None:
+        students = from_frame
+
+    if verbose:
+        print(
+            f"pos_dict, neg_dict, prev_offers_dict = {pos_dict}, {neg_dict}, {prev_offers_dict}"
+        )
+
+    if in_merit_order:
+        ordered = students
+        to_carry = set(pos_dict)
+    else:
+        ordered = sorted(
+            students, key=lambda x: (x.gate_score, x.btech_score), reverse=True
+        )
+    for s in ordered:
+        # print(f"\n-- Processing coap_id = {s.coap_id}...")
+        offer_applicant(
+            offers, s, rem_offers, pos_dict, neg_dict, prev_offers_dict, stats, events,
+            verbose,
+        )
+
+        if in_merit_order:
+            to_carry.discard(s.coap_id)
+            if not to_carry and all(v <= 0 for v in rem_offers.values()):
+                break
+
+        # If all remaining seats in all categories are
+        # down to zero then you can kick out of this
+        # iteration early!
+        total_cnt = 0
+        for category in rem_offers:
+            total_cnt += rem_offers[category]
+            if total_cnt == 0:
+                # print(f"+++ All counts went to zeros = {rem_offers}")
+                break
+
+
+def fill_offers_sheet(sh, offers, first=0):
+    """ Write the column headings and one row per offer into a round sheet
+
+    The rows after the last offer (left by an earlier run of the round) are
+    removed, as fast_save_round() and patch_offers_sheet() do.
+
+    Parameters
+    ----------
+    first : int
+        Optional, only write the offers from this one on (the rows of
+        the ones before are left as they are)
+    """
+    from .round_stats import bold_font
+
+    # Column headings
+    sh["A1"] = "coap_id"
+    sh["B1"] = "status"
+    sh["C1"] = "reason"
+    sh["D1"] = "name"
+    sh["E1"] = "gender"
+    sh["F1"] = "student_category"
+    sh["G1"] = "offer_seat_category"
+    sh["H1"] = "appl_id"
+    sh["I1"] = "gate_id"
+    sh["J1"] = "disabled_flg"
+    sh["K1"] = "gate_score"
+    sh["L1"] = "btech_score"
+    sh["M1"] = "email"
+    sh["N1"] = "mobile"
+    sh["O1"] = "gate_stream"
+    sh["P1"] = "btech_stream"
+
+    # Just bolding the column headings
+    for j in "ABCDEFGHIJKLMNOP":
+        sh[j + "1"].font = bold_font()
+
+    # Now start to dump offers dict contents into the worksheet!
+    # Note: We start to enumerate from 2 onwards, to skip the
+    # column headings.
+    for i, (k, v) in enumerate(offers.items(), 2):
+        if i - 2 < first:
+            continue
+        # print(i, k, v)
+        sh["A" + str(i)] = k
+        sh["B" + str(i)] = v["status"]
+        sh["C" + str(i)] = v["reason"]
+        sh["D" + str(i)] = v["name"]
+        sh["E" + str(i)] = v["gender"]
+        sh["F" + str(i)] = v["student_category"]
+        sh["G" + str(i)] = v["offer_seat_category"]
+        sh["H" + str(i)] = v["appl_id"]
+        sh["I" + str(i)] = v["gate_id"]
+        sh["J" + str(i)] = v["disabled_flg"]
+        sh["K" + str(i)] = v["gate_score"]
+        sh["L" + str(i)] = v["btech_score"]
+        sh["M" + str(i)] = v["email"]
+        sh["N" + str(i)] = v["mobile"]
+        sh["O" + str(i)] = v["gate_stream"]
+        sh["P" + str(i)] = v["btech_stream"]
+
+    if sh.max_row > len(offers) + 1:
+        sh.delete_rows(len(offers) + 2, sh.max_row - len(offers) - 1)
+
+
+def write_offer_to_workbook(offer_file, offers, rnd, fast=False):
+    from .fast_save import fast_save_round
+    from .offers_ledger import write_ledger
+    from .prefix_lock import atomic_save
+
+    # Only the round sheet is written, see fast_save.py
+    if fast and fast_save_round(offer_file, offers, rnd):
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(filename=offer_file)
+    # Remeber that index is off by one, they start from 0!
+    _name = "Round_" + str(rnd)
+    sh = wb[_name]
+
+    fill_offers_sheet(sh, offers)
+
+    atomic_save(wb, offer_file)
+    # Keep the columnar ledger in sync with the xlsx
+    write_ledger(offer_file, wb)
+
+
+def patch_offers_sheet(offer_file, offers, rnd, first):
+    """ Rewrite a round sheet from offer number first on.
+
+    The rows of the offers before it are not touched, the rows after the
+    last offer are removed.
+    """
+    import openpyxl
+
+    from .offers_ledger import write_ledger
+    from .prefix_lock import atomic_save
+
+    wb = openpyxl.load_workbook(filename=offer_file)
+    sh = wb["Round_" + str(rnd)]
+    if sh.max_row >= first + 2:
+        sh.delete_rows(first + 2, sh.max_row - first - 1)
+
+    fill_offers_sheet(sh, offers, first)
+
+    atomic_save(wb, offer_file)
+    # Keep the columnar ledger in sync with the xlsx
+    write_ledger(offer_file, wb)
+
+
+def update_cutoffs_in_summary(stats, offers_summary_fname, rnd):
+    """ Write the cutoffs and per category counts to the summary sheet.
+
+    Parameters
+    ----------
+    stats : RoundStats
+        The statistics kept up to date by make_offer
+    offers_summary_fname : str
+        The summary file to write to
+    rnd : int
+        The round whose sheet is written
+    """
+    import openpyxl
+
+    from .prefix_lock import atomic_save
+    from .round_stats import write_stats_to_sheet
+
+    wb = openpyxl.load_workbook(filename=offers_summary_fname)
+    _name = "Round_" + str(rnd)
+    sh = wb[_name]
+
+    # print(f"Category cutoffs --> {stats.cutoffs()}")
+    write_stats_to_sheet(sh, stats)
+
+    atomic_save(wb, offers_summary_fname)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--applicants_file",
+        type=str,
+        required=True,
+        help="The master file containing all the applications with coap_id, gate_id, appl_id",
+    )
+    parser.add_argument(
+        "-o",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use <prefix>_offers.xlsx and <prefix>_summary.xlsx files.",
+    )
+    parser.add_argument(
+        "-r",
+        "--round",
+        type=int,
+        required=True,
+        default=1,
+        help="Current round of offers to make",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only redo the round from the first offer affected by changes since the last run",
+    )
+    parser.add_argument(
+        "--fast_save",
+        action="store_true",
+        help="Save only the round sheet of the offers workbook, leaving the other sheets as they are",
+    )
+    return parser
+
+
+def main(argv=None, inputs=None):
+    """ Make the offers of a round, as run from the command line
+
+    Parameters
+    ----------
+    argv : list of str
+        The command line arguments, sys.argv[1:] by default
+    inputs : InputCache
+        Optional, parsed input files shared between runs (see preflight.py)
+    returns the exit status
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+
+    from contextlib import ExitStack
+    from functools import partial
+    from pprint import pprint
+
+    from .applicant_dedupe import report_duplicates
+    from .decision_log import DecisionLog
+    from .incremental_offers import prev_signature, remake_round, save_round_state
+    from .offers_model import MASTER_FILE_ROW_START, load_students, load_summary
+    from .prefix_lock import prefix_lock
+    from .preflight import Preflight
+    from .round_stats import RoundStats
+    from .season_log import log_operation
+
+    students_file = args.applicants_file
+    offers_prefix = args.offers_prefix
+    rnd = args.round
+
+    offers_detail_fname = offers_prefix + "_offers.xlsx"
+    offers_summary_fname = offers_prefix + "_summary.xlsx"
+
+    # Only one run at a time on this prefix's files, so that two runs can't
+    # overwrite each other's saves. Other prefixes are not held up.
+    with prefix_lock(offers_prefix), ExitStack() as cleanup:
+        # Check all the input files before doing anything, and report all the
+        # problems at once. What was read is reused below.
+        checks = Preflight(inputs)
+        checks.check_applicants(students_file, MASTER_FILE_ROW_START)
+        checks.check_summary(offers_summary_fname, rnd)
+        checks.check_offers(offers_detail_fname, rnd, updating=False)
+        if not checks.report():
+            return 1
+
+        # Why each applicant was or wasn't made an offer
+        events = cleanup.enter_context(
+            DecisionLog(offers_prefix, "make_offers.py", rnd, argv)
+        )
+
+        # Dicts we need!
+        rem_seats, factors, rem_offers = {}, {}, {}
+
+        load_summary(offers_summary_fname, rnd, rem_seats, factors, checks.summary_values)
+        # Populate rem_offers now!
+        for k, v in rem_seats.items():
+            #rem_offers[k] = int(v) * int(factors[k])
+            rem_offers[k] =  math.ceil( int(v) * float(factors[k]))
+
+        pprint(rem_offers)
+
+        # This will have details of students we made offers to
+        offers, prev_offers_dict = {}, {}
+        pos_dict, neg_dict = {}, {}
+        students, duplicates = [], []
+        students = load_students(students_file, checks.applicant_values, duplicates)
+        report_duplicates(duplicates, offers_prefix, rnd)
+
+        pprint(students)
+
+        if rnd > 1:
+            prev_offers_dict = load_all_previous_offers(
+                offers_detail_fname, rnd, pos_dict, neg_dict, checks.offer_sheets
+            )
+        # pprint(prev_offers_dict)
+
+        # Kept with the offers, for incremental re-runs of this round
+        initial_rem_offers = dict(rem_offers)
+        prev_sig = prev_signature(pos_dict, neg_dict, prev_offers_dict)
+
+        stats = None
+        if args.incremental:
+            result = remake_round(
+                offers_prefix,
+                rnd,
+                students,
+                rem_offers,
+                pos_dict,
+                neg_dict,
+                prev_offers_dict,
+                checks.offer_sheets,
+                partial(offer_applicant, events=events),
+            )
+            if result is not None:
+                offers, first = result
+                stats = RoundStats.from_offers(offers)
+                pprint(offers)
+                if first is None:
+                    print(f"-- Nothing changed in Round_{rnd}")
+                else:
+                    print(f"-- Rewriting Round_{rnd} from offer {first + 1} on")
+                    patch_offers_sheet(offers_detail_fname, offers, rnd, first)
+                    update_cutoffs_in_summary(stats, offers_summary_fname, rnd)
+
+        if stats is None:
+            # Process all applications
+            stats = RoundStats()
+            process_applicants(
+                offers, students, rem_offers, pos_dict, neg_dict, prev_offers_dict, stats,
+                events,
+            )
+            pprint(offers)
+
+            # Write out the offers to an Excel spreadsheet
+            write_offer_to_workbook(offers_detail_fname, offers, rnd, args.fast_save)
+
+            # Update cutoffs
+            update_cutoffs_in_summary(stats, offers_summary_fname, rnd)
+
+        save_round_state(
+            offers_prefix,
+            rnd,
+            students,
+            initial_rem_offers,
+            prev_sig,
+            offers_detail_fname,
+        )
+
+        # Keep a log of the runs, so the season can be replayed
+        log_operation(offers_prefix, ["make_offers.py"] + list(argv))
+
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,248 @@
+# -----------------------------------------------------------------------------
+# Merit order of applicant pools that don't fit in memory.
+#
+#   python3 merit_order.py -a "CSE_2023.xlsx" "CSE_2024.xlsx" "EE_2024.xlsx" \
+#       -s "SAMPLE_TA_summary.xlsx" -r 1 -o "pooled_offers.csv" --memory_budget 64
+#
+# process_applicants() sorts the whole list of Students in memory. For
+# analysis over pooled master files (several departments or years) that is
+# too much, so here the merit order, descending (gate_score, btech_score)
+# with ties kept in the order the applicants were read, comes from an
+# external merge sort:
+#
+#   * applicants are read one at a time and collected until the memory
+#     budget is used up, then sorted and spilled to a run file, each record
+#     a length and the marshal bytes of (keys, Student fields);
+#   * the runs are merged with a heap, reading ahead a slice of the budget
+#     from each; with more runs than the budget can read ahead from at once
+#     they are first merged into fewer, longer runs;
+#   * a pool that fits in the budget is sorted in memory, nothing is spilled.
+#
+# The Students come out of a generator, so the allocation reads only as far
+# as it needs to (see process_applicants(in_merit_order=True)) and the run
+# files are removed once the generator is closed.
+# -----------------------------------------------------------------------------
+from contextlib import closing
+from itertools import chain
+import argparse
+import csv
+import heapq
+import marshal
+import math
+import os
+import struct
+import sys
+import tempfile
+
+from .make_offers import process_applicants
+from .offers_ledger import OFFER_COLUMNS
+from .offers_model import MASTER_FILE_ROW_START, Student, load_summary, students_from_rows
+from .round_stats import RoundStats
+
+DEFAULT_BUDGET_MB = 256
+
+# Bytes read ahead from every run while merging, at most
+READ_BUFFER = 1 << 20
+# Runs are not merged with less read ahead than this each
+MIN_READ_BUFFER = 1 << 14
+
+# How often the size of a Student in memory is measured again
+_MEASURE_EVERY = 1024
+
+_LENGTH = struct.Struct("<I")
+
+
+def _size(s):
+    # A Student in memory, with its fields and the sort record around it
+    fields = vars(s)
+    return (
+        sys.getsizeof(s)
+        + sys.getsizeof(fields)
+        + sum(sys.getsizeof(v) for v in fields.values())
+        + 120
+    )
+
+
+def _write_run(records, fname):
+    """ Spill (keys..., fields) records, already in order, to a run file """
+    with open(fname, "wb", buffering=READ_BUFFER) as f:
+        for record in records:
+            data = marshal.dumps(record)
+            f.write(_LENGTH.pack(len(data)))
+            f.write(data)
+    return fname
+
+
+def _read_run(fname, buffering):
+    with open(fname, "rb", buffering=buffering) as f:
+        while True:
+            head = f.read(_LENGTH.size)
+            if not head:
+                return
+            yield marshal.loads(f.read(_LENGTH.unpack(head)[0]))
+
+
+def merit_order(students, budget_mb=DEFAULT_BUDGET_MB, tmp_dir=None):
+    """ The students in merit order, sorted within a memory budget
+
+    Same order as sorted(students, key=(gate_score, btech_score),
+    reverse=True), for any number of students.
+
+    Parameters
+    ----------
+    students : iterable of Student objects
+        Read once, one at a time
+    budget_mb : float
+        About how much memory the sort may use, in MB
+    tmp_dir : str
+        Where the run files go, the system's temporary directory by default
+    returns an iterator over student objects
+    """
+    budget = int(budget_mb * (1 << 20))
+    chunk, size, runs = [], None, []
+    with tempfile.TemporaryDirectory(prefix="merit_", dir=tmp_dir) as d:
+        for seq, s in enumerate(students):
+            if seq % _MEASURE_EVERY == 0:
+                size = max(size or 0, _size(s))
+            # seq keeps ties in the order they were read, and is never equal
+            # between two records, so the Students are never compared.
+            chunk.append((-s.gate_score, -s.btech_score, seq, s))
+            if len(chunk) * size >= budget:
+                chunk.sort()
+                runs.append(
+                    _write_run(
+                        ((g, b, i, tuple(vars(s).values())) for g, b, i, s in chunk),
+                        os.path.join(d, f"run_{len(runs)}"),
+                    )
+                )
+                chunk = []
+        chunk.sort()
+        if not runs:
+            for *_, s in chunk:
+                yield s
+            return
+        runs.append(
+            _write_run(
+                ((g, b, i, tuple(vars(s).values())) for g, b, i, s in chunk),
+                os.path.join(d, f"run_{len(runs)}"),
+            )
+        )
+        chunk = None
+
+        # Merge into fewer runs until each can be read ahead from within
+        # the budget
+        fan_in = max(2, budget // MIN_READ_BUFFER)
+        n = len(runs)
+        while len(runs) > fan_in:
+            merged = []
+            for k in range(0, len(runs), fan_in):
+                group = runs[k : k + fan_in]
+                buffering = min(READ_BUFFER, budget // len(group))
+                merged.append(
+                    _write_run(
+                        heapq.merge(*(_read_run(r, buffering) for r in group)),
+                        os.path.join(d, f"run_{n}"),
+                    )
+                )
+                n += 1
+                for r in group:
+                    os.remove(r)
+            runs = merged
+
+        buffering = max(MIN_READ_BUFFER, min(READ_BUFFER, budget // len(runs)))
+        for _, _, _, fields in heapq.merge(*(_read_run(r, buffering) for r in runs)):
+            yield Student(*fields)
+
+
+def iter_master_rows(students_file):
+    """ Columns A..N of a master file's rows, streamed """
+    import openpyxl
+
+    wb = openpyxl.load_workbook(filename=students_file, read_only=True)
+    try:
+        worksheet = wb[wb.sheetnames[0]]
+        yield from worksheet.iter_rows(
+            min_row=MASTER_FILE_ROW_START, max_col=14, values_only=True
+        )
+    finally:
+        wb.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--applicants_files",
+        type=str,
+        nargs="+",
+        required=True,
+        help="The master files to pool, read in this order",
+    )
+    parser.add_argument(
+        "-s",
+        "--summary_file",
+        type=str,
+        required=True,
+        help="The summary file with the seats and factors of the round",
+    )
+    parser.add_argument("-r", "--round", type=int, default=1, help="The round of the summary file")
+    parser.add_argument(
+        "-o", "--output", type=str, required=True, help="CSV file for the offers made"
+    )
+    parser.add_argument(
+        "--memory_budget",
+        type=float,
+        default=DEFAULT_BUDGET_MB,
+        help=f"About how much memory the merit order may use, in MB (default {DEFAULT_BUDGET_MB})",
+    )
+    parser.add_argument("--tmp_dir", type=str, help="Where to spill the sorted runs")
+    return parser
+
+
+def main(argv=None):
+    """ Make one round's offers over pooled master files, returns the exit status """
+    args = build_parser().parse_args(argv)
+    for fname in args.applicants_files + [args.summary_file]:
+        if not os.path.exists(fname):
+            print(f"!!! ERROR: {fname} not found")
+            return 1
+
+    rem_seats, factors, rem_offers = {}, {}, {}
+    load_summary(args.summary_file, args.round, rem_seats, factors)
+    for k, v in rem_seats.items():
+        rem_offers[k] = math.ceil(int(v) * float(factors[k]))
+
+    n_read = 0
+
+    def pooled():
+        nonlocal n_read
+        rows = chain.from_iterable(iter_master_rows(f) for f in args.applicants_files)
+        for s in students_from_rows(rows):
+            n_read += 1
+            yield s
+
+    offers, stats = {}, RoundStats()
+    with closing(merit_order(pooled(), args.memory_budget, args.tmp_dir)) as ordered:
+        process_applicants(
+            offers, ordered, rem_offers, {}, {}, {}, stats, verbose=False, in_merit_order=True
+        )
+
+    with open(args.output, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(OFFER_COLUMNS)
+        for coap_id, o in offers.items():
+            writer.writerow([coap_id] + [o[c] for c in OFFER_COLUMNS[1:]])
+
+    print(
+        f"-- {len(offers)} offers made from {n_read} applicants read, "
+        f"written to {args.output}"
+    )
+    print(f"-- Cutoffs: {stats.cutoffs()}")
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,432 @@
+# -----------------------------------------------------------------------------
+# Mail every candidate whose offer is new, or whose status changed, in a
+# round's offers sheet.
+#
+# Messages are rendered from templates (one per status) and sent through a
+# small pool of persistent SMTP connections, with a limit on how many
+# messages go out per second and retries on temporary failures. Every
+# message that was sent is appended to <prefix>_notifications.jsonl, and a
+# candidate is never mailed twice about the same status.
+#
+# To try it out against a local SMTP stand-in that just prints the mails:
+#   python3 -m aiosmtpd -n -l localhost:1025
+#   python3 notify_offers.py -op SAMPLE_TA -r 1 -prg "M.Tech CSE" \
+#       --from_addr "admissions@example.org" --smtp_host localhost --smtp_port 1025
+# -----------------------------------------------------------------------------
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from email.message import EmailMessage
+from string import Template
+import argparse
+import datetime
+import json
+import os
+import queue
+import smtplib
+import sys
+import threading
+import time
+
+from .offers_ledger import OFFER_COLUMNS, read_offer_sheets
+
+# Used when there is no <status>.txt in the templates directory. The first
+# line is the subject, the body starts after the blank line.
+DEFAULT_TEMPLATES = {
+    "Initial_Offer": """Subject: Offer of admission to $program (Round $round)
+
+Dear $name,
+
+We are happy to offer you a seat in $program in round $round of COAP
+(COAP ID $coap_id, seat category $offer_seat_category).
+
+Please accept, retain or reject this offer on the COAP portal before the
+round closes.
+""",
+    "Accept": """Subject: Your acceptance of our offer for $program
+
+Dear $name,
+
+We have recorded that you accepted and froze our offer for $program
+(COAP ID $coap_id). We look forward to seeing you.
+""",
+    "Retain": """Subject: Your offer for $program is retained
+
+Dear $name,
+
+We have recorded that you retained our offer for $program (COAP ID
+$coap_id). Your seat is held for you in the next round.
+""",
+    "Reject": """Subject: Your offer for $program
+
+Dear $name,
+
+We have recorded that our offer for $program (COAP ID $coap_id) was not
+taken up ($reason). We wish you all the best.
+""",
+}
+
+
+@dataclass
+class Notification:
+    """A class for holding a message to be sent"""
+
+    coap_id: str
+    status: str
+    email: str
+    subject: str
+    body: str
+
+
+def notifications_log_fname(offers_prefix):
+    return offers_prefix + "_notifications.jsonl"
+
+
+def load_templates(templates_dir=None):
+    """ load the templates, once, as (subject, body) Template pairs
+
+    Parameters
+    ----------
+    templates_dir : str
+        Optional, a directory with <status>.txt files that replace the
+        default template of that status
+    returns a dict of status -> (Template, Template)
+    """
+    texts = dict(DEFAULT_TEMPLATES)
+    if templates_dir:
+        for status in DEFAULT_TEMPLATES:
+            fname = os.path.join(templates_dir, status + ".txt")
+            if os.path.exists(fname):
+                with open(fname) as f:
+                    texts[status] = f.read()
+
+    templates = {}
+    for status, text in texts.items():
+        head, _, body = text.partition("\n\n")
+        subject = head.strip()
+        if subject.lower().startswith("subject:"):
+            subject = subject[len("subject:") :].strip()
+        templates[status] = (Template(subject), Template(body))
+    return templates
+
+
+def load_sent_log(offers_prefix):
+    """ returns the set of (coap_id, status) that were already mailed """
+    sent = set()
+    fname = notifications_log_fname(offers_prefix)
+    if os.path.exists(fname):
+        with open(fname) as f:
+            for line in f:
+                if line.strip():
+                    r = json.loads(line)
+                    sent.add((r["coap_id"], r["status"]))
+    return sent
+
+
+def pending_notifications(offers, rnd, program, templates, sent):
+    """ Render a message for every offer whose status was not mailed yet
+
+    Parameters
+    ----------
+    offers : list of dicts
+        The rows of the round's offers sheet
+    sent : set
+        (coap_id, status) pairs already mailed (see load_sent_log)
+    returns a list of Notification objects
+    """
+    pending = []
+    for o in offers:
+        # Rows for candidates we never made an offer to have no seat
+        # category, and there is no one to mail without an address.
+        if not o["offer_seat_category"] or not o["email"]:
+            continue
+        if o["status"] not in templates or (str(o["coap_id"]), o["status"]) in sent:
+            continue
+        fields = {k: "" if v is None else v for k, v in o.items()}
+        fields.update(program=program, round=rnd)
+        subject, body = templates[o["status"]]
+        pending.append(
+            Notification(
+                coap_id=str(o["coap_id"]),
+                status=o["status"],
+                email=str(o["email"]),
+                subject=subject.safe_substitute(fields),
+                body=body.safe_substitute(fields),
+            )
+        )
+    return pending
+
+
+class RateLimiter:
+    """ Lets at most `rate` callers through per second, across threads """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SMTPPool:
+    """ A small pool of logged in, persistent SMTP connections """
+
+    def __init__(self, host, port, size, use_ssl=False, starttls=False, user=None,
+                 password=None, timeout=30):
+        self.host, self.port, self.size = host, port, size
+        self.use_ssl, self.starttls = use_ssl, starttls
+        self.user, self.password, self.timeout = user, password, timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self.use_ssl:
+            conn = smtplib.SMTP_SSL(self.host, self.port, timeout=self.timeout)
+        else:
+            conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+            if self.starttls:
+                conn.starttls()
+        if self.user:
+            conn.login(self.user, self.password)
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            create = self._created < self.size
+            if create:
+                self._created += 1
+        if not create:
+            return self._idle.get()
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def release(self, conn, broken=False):
+        if not broken:
+            self._idle.put(conn)
+            return
+        with self._lock:
+            self._created -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def close(self):
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.quit()
+            except Exception:
+                conn.close()
+
+
+class Dispatcher:
+    """ Sends notifications through an SMTPPool and keeps the sent-log """
+
+    def __init__(self, pool, from_addr, offers_prefix, rnd, rate=10, retries=3):
+        self.pool = pool
+        self.from_addr = from_addr
+        self.rnd = rnd
+        self.retries = retries
+        self.limiter = RateLimiter(rate)
+        self._log = open(notifications_log_fname(offers_prefix), "a")
+        self._log_lock = threading.Lock()
+
+    def _record(self, n):
+        line = json.dumps(
+            {
+                "coap_id": n.coap_id,
+                "status": n.status,
+                "email": n.email,
+                "round": self.rnd,
+                "sent_at": datetime.datetime.now().isoformat(timespec="seconds"),
+            }
+        )
+        with self._log_lock:
+            self._log.write(line + "\n")
+            self._log.flush()
+
+    def send(self, n):
+        """ returns None if n was sent, else the reason it was not """
+        try:
+            msg = EmailMessage()
+            msg["From"] = self.from_addr
+            msg["To"] = n.email
+            msg["Subject"] = n.subject
+            msg.set_content(n.body)
+        except ValueError as e:
+            # e.g. a line break in the email cell (Alt+Enter in Excel)
+            return f"bad message: {e}"
+
+        error = "not tried, retries is less than 1"
+        for attempt in range(1, self.retries + 1):
+            self.limiter.wait()
+            try:
+                conn = self.pool.acquire()
+            except (smtplib.SMTPException, OSError) as e:
+                error = f"cannot connect: {e}"
+                time.sleep(2 ** attempt * 0.1)
+                continue
+            try:
+                conn.send_message(msg)
+            except smtplib.SMTPRecipientsRefused as e:
+                # The address is bad, trying again will not help.
+                self.pool.release(conn)
+                return f"refused: {e}"
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code >= 500:
+                    # Permanent failure, the connection is still fine.
+                    self.pool.release(conn)
+                    return f"refused: {e}"
+                self.pool.release(conn, broken=True)
+                error = str(e)
+                time.sleep(2 ** attempt * 0.1)
+                continue
+            except (smtplib.SMTPException, OSError) as e:
+                self.pool.release(conn, broken=True)
+                error = str(e)
+                time.sleep(2 ** attempt * 0.1)
+                continue
+            self.pool.release(conn)
+            self._record(n)
+            return None
+        return error
+
+    def send_all(self, notifications):
+        """ returns a list of (Notification, reason) that could not be sent """
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.pool.size) as ex:
+            for n, error in zip(notifications, ex.map(self.send, notifications)):
+                if error is not None:
+                    failed.append((n, error))
+        return failed
+
+    def close(self):
+        self._log.close()
+        self.pool.close()
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use the <prefix>_offers.xlsx file.",
+    )
+    parser.add_argument(
+        "-r", "--round", type=int, required=True, help="Round of offers to mail about"
+    )
+    parser.add_argument(
+        "-prg",
+        "--program",
+        type=str,
+        required=True,
+        help="The program name used in the messages (e.g. M.Tech CSE)",
+    )
+    parser.add_argument(
+        "-t",
+        "--templates_dir",
+        type=str,
+        help="Directory with Initial_Offer.txt, Accept.txt, Retain.txt, Reject.txt templates",
+    )
+    parser.add_argument("--from_addr", type=str, required=True, help="Sender address")
+    parser.add_argument("--smtp_host", type=str, default="localhost")
+    parser.add_argument("--smtp_port", type=int, default=25)
+    parser.add_argument("--smtp_user", type=str, help="Password is read from $SMTP_PASSWORD")
+    parser.add_argument("--ssl", action="store_true", help="Use SMTP over SSL")
+    parser.add_argument("--starttls", action="store_true", help="Use STARTTLS")
+    parser.add_argument(
+        "--connections", type=int, default=4, help="Number of SMTP connections"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=10, help="At most this many messages per second"
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3, help="How many times to try each message (at least 1)"
+    )
+    parser.add_argument(
+        "--dry_run", action="store_true", help="Print the messages instead of sending"
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Mail the candidates of a round, returns the exit status """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.retries < 1:
+        parser.error("--retries must be at least 1")
+
+    offers_detail_fname = args.offers_prefix + "_offers.xlsx"
+    title = "Round_" + str(args.round)
+    if not os.path.exists(offers_detail_fname):
+        print(f"!!! ERROR: {offers_detail_fname} not found")
+        return 1
+    sheets = read_offer_sheets(offers_detail_fname, [title])
+    if title not in sheets:
+        print(f"!!! ERROR: {offers_detail_fname}: no {title} sheet")
+        return 1
+    offers = [dict(zip(OFFER_COLUMNS, r)) for r in sheets[title] if r[0] is not None]
+
+    templates = load_templates(args.templates_dir)
+    sent = load_sent_log(args.offers_prefix)
+    pending = pending_notifications(offers, args.round, args.program, templates, sent)
+    print(f"-- {len(pending)} message(s) to send, {len(sent)} sent before")
+
+    if args.dry_run:
+        for n in pending:
+            print(f"\nTo: {n.email}\nSubject: {n.subject}\n\n{n.body}")
+        return 0
+
+    pool = SMTPPool(
+        args.smtp_host,
+        args.smtp_port,
+        args.connections,
+        use_ssl=args.ssl,
+        starttls=args.starttls,
+        user=args.smtp_user,
+        password=os.environ.get("SMTP_PASSWORD"),
+    )
+    dispatcher = Dispatcher(
+        pool, args.from_addr, args.offers_prefix, args.round, args.rate, args.retries
+    )
+    t0 = time.perf_counter()
+    try:
+        failed = dispatcher.send_all(pending)
+    finally:
+        dispatcher.close()
+    print(
+        f"-- sent {len(pending) - len(failed)} message(s) in "
+        f"{time.perf_counter() - t0:.2f}s"
+    )
+    for n, error in failed:
+        print(f"!!! not sent to {n.coap_id} <{n.email}>: {error}")
+    if failed:
+        return 1
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
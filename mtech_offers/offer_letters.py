@@ -0,0 +1,353 @@
+# -----------------------------------------------------------------------------
+# Offer letters for every new offer (Initial_Offer) of a round.
+#
+#   python3 offer_letters.py -op SAMPLE_TA -r 1 -prg "M.Tech CSE"
+#   python3 offer_letters.py -op SAMPLE_TA -r 1 -prg "M.Tech CSE" --format pdf -t letter.txt
+#
+# A letter is rendered from a template ($name, $coap_id,
+# $offer_seat_category, $program, $round and any other column of the round
+# sheet) to <prefix>_letters/Round_<r>/<coap_id>.html or .pdf:
+#
+#   * the letters are spread over a pool of processes; each process parses
+#     the template, and builds the PDF font resources, once when it starts,
+#     and then only substitutes and writes;
+#   * <prefix>_letters/Round_<r>/manifest.json keeps a hash of what every
+#     letter was made from (template, format and the candidate's fields),
+#     so a letter whose inputs did not change is not made again. Letters of
+#     offers that are still in the round sheet but no longer new (the
+#     candidate accepted or retained since) were issued, they are left as
+#     they are; the letters of candidates who left the sheet are removed;
+#   * a handful of letters is rendered in this process, starting the pool
+#     would take longer than the letters.
+#
+# PDF letters use the standard Helvetica font of every PDF reader, so no
+# font is embedded and nothing beyond the standard library is needed; the
+# template is plain text, wrapped to the page.
+# -----------------------------------------------------------------------------
+from concurrent.futures import ProcessPoolExecutor
+from string import Template
+import argparse
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import textwrap
+import time
+
+from .offers_ledger import OFFER_COLUMNS, read_offer_sheets
+
+FORMATS = ("html", "pdf")
+
+DEFAULT_LETTERS = {
+    "html": """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Offer of admission: $coap_id</title></head>
+<body>
+<p>COAP ID: $coap_id<br>Round: $round</p>
+<p>Dear $name,</p>
+<p>We are happy to offer you admission to <b>$program</b> in round $round of COAP,
+under the <b>$offer_seat_category</b> seat category.</p>
+<p>Please accept, retain or reject this offer on the COAP portal before the round
+closes. This letter is not a confirmation of admission until the offer is accepted
+and the documents are verified.</p>
+<p>Chair, PG Admissions</p>
+</body></html>
+""",
+    "pdf": """COAP ID: $coap_id
+Round: $round
+
+Dear $name,
+
+We are happy to offer you admission to $program in round $round of COAP, under the $offer_seat_category seat category.
+
+Please accept, retain or reject this offer on the COAP portal before the round closes. This letter is not a confirmation of admission until the offer is accepted and the documents are verified.
+
+Chair, PG Admissions
+""",
+}
+
+# Fewer letters than this are rendered without a pool
+MIN_POOL_LETTERS = 64
+
+# A4 in points, with 1 inch margins
+_PAGE_WIDTH, _PAGE_HEIGHT, _MARGIN = 595, 842, 72
+_FONT_SIZE, _LEADING = 11, 15
+# Helvetica averages about half its size in width
+_WRAP = int((_PAGE_WIDTH - 2 * _MARGIN) / (_FONT_SIZE * 0.5))
+_LINES_PER_PAGE = (_PAGE_HEIGHT - 2 * _MARGIN) // _LEADING
+
+
+def letters_dir(offers_prefix, rnd):
+    return os.path.join(offers_prefix + "_letters", "Round_" + str(rnd))
+
+
+def load_letter_template(fmt, template_file=None):
+    """ returns the text of the letter template """
+    if template_file:
+        with open(template_file) as f:
+            return f.read()
+    return DEFAULT_LETTERS[fmt]
+
+
+def _safe_name(coap_id):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(coap_id))
+
+
+def letter_statuses(offers):
+    """ The status of every row of the round's offers sheet, keyed on the
+    name its letter has (without the .html or .pdf) """
+    return {_safe_name(o["coap_id"]): o["status"] for o in offers}
+
+
+def letter_jobs(offers, rnd, program, fmt, template_text, out_dir):
+    """ A (fname, fields, digest) job for every new offer of the round
+
+    Parameters
+    ----------
+    offers : list of dicts
+        The rows of the round's offers sheet
+    returns a list of jobs, in sheet order
+    """
+    template_sha = hashlib.sha256(template_text.encode()).hexdigest()
+    jobs = []
+    for o in offers:
+        if o["status"] != "Initial_Offer" or not o["offer_seat_category"]:
+            continue
+        fields = {k: "" if v is None else str(v) for k, v in o.items()}
+        fields.update(program=program, round=str(rnd))
+        digest = hashlib.sha256(
+            json.dumps([fmt, template_sha, fields], sort_keys=True).encode()
+        ).hexdigest()
+        fname = os.path.join(out_dir, f"{_safe_name(o['coap_id'])}.{fmt}")
+        jobs.append((fname, fields, digest))
+    return jobs
+
+
+# The template and font of this process, set up once by _init_renderer
+_renderer = {}
+
+
+def _pdf_string(line):
+    data = line.encode("latin-1", "replace")
+    return b"(" + data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _init_renderer(fmt, template_text):
+    _renderer["fmt"] = fmt
+    _renderer["template"] = Template(template_text)
+    if fmt == "pdf":
+        _renderer["font"] = (
+            b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+            b"/Encoding /WinAnsiEncoding >>"
+        )
+
+
+def pdf_document(text):
+    """ A PDF of plain text, wrapped and split over A4 pages """
+    lines = []
+    for paragraph in text.split("\n"):
+        lines.extend(textwrap.wrap(paragraph, _WRAP) or [""])
+    pages = [
+        lines[k : k + _LINES_PER_PAGE] for k in range(0, len(lines), _LINES_PER_PAGE)
+    ] or [[]]
+
+    # Objects 1 catalog, 2 page tree, 3 font, then a page and its
+    # content stream per page
+    n_pages = len(pages)
+    kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(n_pages))
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {n_pages} >>".encode(),
+        _renderer["font"],
+    ]
+    for i, page in enumerate(pages):
+        stream = b"BT /F1 %d Tf %d TL %d %d Td\n" % (
+            _FONT_SIZE, _LEADING, _MARGIN, _PAGE_HEIGHT - _MARGIN
+        )
+        stream += b"".join(_pdf_string(line) + b" Tj T*\n" for line in page) + b"ET"
+        objects.append(
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {_PAGE_WIDTH} {_PAGE_HEIGHT}] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>".encode()
+        )
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % i + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref,
+    )
+    return bytes(out)
+
+
+def render_letter(job):
+    """ Render and write one letter, returns its file name """
+    fname, fields, _ = job
+    if _renderer["fmt"] == "html":
+        escaped = {k: html.escape(v) for k, v in fields.items()}
+        data = _renderer["template"].safe_substitute(escaped).encode()
+    else:
+        data = pdf_document(_renderer["template"].safe_substitute(fields))
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "wb") as f:
+        f.write(data)
+    os.replace(tmp_fname, fname)
+    return fname
+
+
+def _load_manifest(fname):
+    if not os.path.exists(fname):
+        return {}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def make_letters(jobs, fmt, template_text, out_dir, workers=None, statuses=None):
+    """ Render the letters whose inputs changed since the last run
+
+    Parameters
+    ----------
+    jobs : list
+        See letter_jobs()
+    workers : int
+        Processes to render with, one per CPU by default
+    statuses : dict
+        Optional, see letter_statuses(). Letters of earlier runs whose
+        candidate is not in it are removed; without it none is removed.
+    returns (number of letters made, number left as they were, number of
+    fmt letters of offers that are no longer new, kept as they were issued,
+    number of letters removed)
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest_fname = os.path.join(out_dir, "manifest.json")
+    manifest = _load_manifest(manifest_fname)
+
+    # Keyed on the letter's file name in out_dir
+    todo = [
+        job
+        for job in jobs
+        if manifest.get(os.path.basename(job[0])) != job[2] or not os.path.exists(job[0])
+    ]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(todo) < MIN_POOL_LETTERS:
+        _init_renderer(fmt, template_text)
+        for job in todo:
+            render_letter(job)
+    else:
+        chunksize = max(1, len(todo) // (workers * 4))
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_renderer,
+            initargs=(fmt, template_text),
+        ) as ex:
+            for _ in ex.map(render_letter, todo, chunksize=chunksize):
+                pass
+
+    # Letters of earlier runs: those of candidates still in the round sheet
+    # were issued (or are of the other format) and stay, with their manifest
+    # entries; those of candidates who left the sheet are removed
+    current = {os.path.basename(job[0]): job[2] for job in jobs}
+    kept, issued, removed = {}, 0, 0
+    for name, h in manifest.items():
+        fname = os.path.join(out_dir, name)
+        if name in current or not os.path.exists(fname):
+            continue
+        stem, ext = os.path.splitext(name)
+        if statuses is not None and stem not in statuses:
+            os.remove(fname)
+            removed += 1
+            continue
+        kept[name] = h
+        if ext == "." + fmt and statuses is not None and statuses[stem] != "Initial_Offer":
+            issued += 1
+
+    tmp_fname = manifest_fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump({**kept, **current}, f, indent=1)
+    os.replace(tmp_fname, manifest_fname)
+    return len(todo), len(jobs) - len(todo), issued, removed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use the <prefix>_offers.xlsx file.",
+    )
+    parser.add_argument(
+        "-r", "--round", type=int, required=True, help="Round of the new offers"
+    )
+    parser.add_argument(
+        "-prg",
+        "--program",
+        type=str,
+        required=True,
+        help="The program name used in the letters (e.g. M.Tech CSE)",
+    )
+    parser.add_argument(
+        "-t",
+        "--template",
+        type=str,
+        help="Letter template, HTML for --format html and plain text for --format pdf",
+    )
+    parser.add_argument("--format", choices=FORMATS, default="html")
+    parser.add_argument(
+        "-out",
+        "--output_dir",
+        type=str,
+        help="Where the letters go, <prefix>_letters/Round_<r> by default",
+    )
+    parser.add_argument(
+        "--workers", type=int, help="Processes to render with, one per CPU by default"
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Make the offer letters of a round, returns the exit status """
+    args = build_parser().parse_args(argv)
+    offers_detail_fname = args.offers_prefix + "_offers.xlsx"
+    title = "Round_" + str(args.round)
+    if not os.path.exists(offers_detail_fname):
+        print(f"!!! ERROR: {offers_detail_fname} not found")
+        return 1
+    if args.template and not os.path.exists(args.template):
+        print(f"!!! ERROR: {args.template} not found")
+        return 1
+    sheets = read_offer_sheets(offers_detail_fname, [title])
+    if title not in sheets:
+        print(f"!!! ERROR: {offers_detail_fname}: no {title} sheet")
+        return 1
+
+    offers = [dict(zip(OFFER_COLUMNS, r)) for r in sheets[title] if r[0] is not None]
+    template_text = load_letter_template(args.format, args.template)
+    out_dir = args.output_dir or letters_dir(args.offers_prefix, args.round)
+    jobs = letter_jobs(offers, args.round, args.program, args.format, template_text, out_dir)
+
+    t0 = time.perf_counter()
+    made, unchanged, issued, removed = make_letters(
+        jobs, args.format, template_text, out_dir, args.workers, letter_statuses(offers)
+    )
+    print(
+        f"-- {made} letter(s) made in {time.perf_counter() - t0:.2f}s, "
+        f"{unchanged} unchanged, {issued} of offers no longer new kept, "
+        f"{removed} of candidates no longer in {title} removed, in {out_dir}"
+    )
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,266 @@
+# -----------------------------------------------------------------------------
+# The offers of a season as a library, without any files.
+#
+#   season = Season(load_students("sample_app_file.xlsx"))
+#   season.rounds[1] = make_round(season, 1, rem_seats, factors)
+#   season.rounds[1], conflicts = apply_updates(
+#       season, 1, [("COAP2000134281", "Accept and Freeze", None)], "our"
+#   )
+#
+# Everything a round depends on is passed in as an object: the applicants
+# (Season), the state of the earlier rounds (RoundState), the seats and
+# factors, and the updates. Nothing is read from or written to disk and
+# nothing is printed, and the inputs are never changed: make_round() and
+# apply_updates() return a new RoundState, which the caller keeps or throws
+# away. So several seasons (other programs, what-ifs) can be worked on in one
+# process, side by side or from several threads.
+#
+# The functions are the ones make_offers.py and update_offers.py use, and
+# the offers come out as those scripts would write and read them back.
+# replay_season.py is built on this module.
+# -----------------------------------------------------------------------------
+from dataclasses import astuple, dataclass, field
+import copy
+import math
+
+from .joint_offers import ProgramRound, allocate_jointly
+from .make_offers import process_applicants
+from .round_stats import RoundStats
+from .update_ingest import ingest_updates, offers_sha256
+from .update_offers import (
+    STATUS_MAP,
+    UpdateRow,
+    process_updates,
+    students_by_id,
+    update_rows,
+)
+from .waitlist import DEFAULT_DEPTH, Waitlist
+
+
+@dataclass
+class RoundState:
+    """ A round's offers and seats, as they stand after its last update """
+
+    round: int
+    # coap_id -> offer, as in the round's sheet
+    offers: dict
+    # seat category -> seats left, and the factors of the round
+    rem_seats: dict
+    factors: dict
+    stats: RoundStats
+    # coap_id -> (flg, status, source) of the updates applied so far
+    applied: dict = field(default_factory=dict)
+    # One entry per update file applied, as in <prefix>_updates.json
+    history: list = field(default_factory=list)
+
+
+@dataclass
+class Season:
+    """ The applicants of a season and the rounds made so far """
+
+    # Student objects, as load_students() gives them
+    applicants: list
+    # round number -> RoundState
+    rounds: dict = field(default_factory=dict)
+    students_dict: dict = field(init=False, repr=False)
+
+    def __post_init__(self):
+        self.students_dict = students_by_id(self.applicants)
+
+    def offers_until(self, rnd):
+        """ The offers of rounds 1..rnd, as the scripts load them
+
+        Same as loading the round sheets from the offers file, later rounds
+        taking over from earlier ones.
+        returns a new dict of coap_id -> offer
+        """
+        offers_dict = {}
+        for r in sorted(self.rounds):
+            if r > rnd:
+                break
+            for coap_id, o in self.rounds[r].offers.items():
+                if o["reason"] == "Initial_Offer":
+                    continue
+                offers_dict[coap_id] = dict(o)
+        return offers_dict
+
+
+def _read_back(offers):
+    # What the offers look like once written to and read back from a sheet:
+    # empty strings come back as empty cells.
+    return {
+        coap_id: {k: None if v == "" else v for k, v in o.items()}
+        for coap_id, o in offers.items()
+    }
+
+
+def _rem_offers(rem_seats, factors):
+    return {k: math.ceil(int(v) * float(factors[k])) for k, v in rem_seats.items()}
+
+
+def _previous_offers(season, rnd):
+    # pos_dict, neg_dict and prev_offers_dict, as make_offers.py loads them
+    pos_dict, neg_dict, prev_offers_dict = {}, {}, {}
+    if rnd > 1:
+        prev_offers_dict = season.offers_until(rnd - 1)
+        for coap_id, o in prev_offers_dict.items():
+            if o["status"] in ["Accept", "Retain"]:
+                pos_dict[coap_id] = 1
+            elif o["status"] == "Reject":
+                neg_dict[coap_id] = 1
+    return pos_dict, neg_dict, prev_offers_dict
+
+
+def make_round(season, rnd, rem_seats, factors, events=None):
+    """ Make the offers of a round, as make_offers.py would
+
+    Parameters
+    ----------
+    season : Season
+        The applicants and the earlier rounds
+    rnd : int
+        The round, 1 onwards
+    rem_seats, factors : dict
+        Seats left and the factor per seat category, as in the summary
+    events : DecisionLog
+        Optional, every decision is recorded in it
+    returns a new RoundState
+    """
+    rem_offers = _rem_offers(rem_seats, factors)
+    pos_dict, neg_dict, prev_offers_dict = _previous_offers(season, rnd)
+
+    offers, stats = {}, RoundStats()
+    process_applicants(
+        offers,
+        season.applicants,
+        rem_offers,
+        pos_dict,
+        neg_dict,
+        prev_offers_dict,
+        stats,
+        events,
+        verbose=False,
+    )
+    return RoundState(rnd, _read_back(offers), dict(rem_seats), dict(factors), stats)
+
+
+def make_joint_round(seasons, rnd, seats, preferences=None):
+    """ Make the offers of a round for several programs, as joint_offers.py would
+
+    Parameters
+    ----------
+    seasons : dict
+        prefix -> Season of each program, in the default order of preference
+    seats : dict
+        prefix -> (rem_seats, factors) of each program
+    preferences : dict
+        Optional, coap_id -> list of prefixes, most preferred first
+    returns a dict of prefix -> new RoundState
+    """
+    programs = []
+    for prefix, season in seasons.items():
+        rem_seats, factors = seats[prefix]
+        p = ProgramRound(
+            prefix,
+            {s.coap_id: s for s in season.applicants},
+            _rem_offers(rem_seats, factors),
+        )
+        p.pos_dict, p.neg_dict, p.prev_offers_dict = _previous_offers(season, rnd)
+        programs.append(p)
+
+    allocate_jointly(programs, preferences, verbose=False)
+    return {
+        p.prefix: RoundState(
+            rnd,
+            _read_back(p.offers),
+            dict(seats[p.prefix][0]),
+            dict(seats[p.prefix][1]),
+            p.stats,
+        )
+        for p in programs
+    }
+
+
+def apply_updates(
+    season, rnd, updates, our_other_flg, program="NA", source="", events=None
+):
+    """ Apply the updates of one file to a round, as update_offers.py would
+
+    Parameters
+    ----------
+    season : Season
+        The applicants and the rounds, rnd must be one of them
+    updates : list of UpdateRow objects or (coap_id, status, program) tuples
+        In file order, statuses as in the COAP file
+    our_other_flg : str
+        "our" or "oth", which status column the updates are from
+    program : str
+        Our program, updates for other programs are skipped
+    source : str
+        Where the updates are from, e.g. the update file's name
+    events : DecisionLog
+        Optional, what was done with every update is recorded in it
+    returns (new RoundState, list of UpdateConflict objects)
+    """
+    if rnd not in season.rounds:
+        raise ValueError(f"Round {rnd} is updated before its offers were made")
+    st = season.rounds[rnd]
+
+    updates = update_rows(
+        astuple(up) if isinstance(up, UpdateRow) else tuple(up) for up in updates
+    )
+    updates, conflicts = ingest_updates(
+        updates, our_other_flg, source, program, st.applied
+    )
+
+    offers_dict = copy.deepcopy(st.offers)
+    rem_seats = dict(st.rem_seats)
+    stats = RoundStats.from_offers(offers_dict)
+    done = []
+    process_updates(
+        updates,
+        season.students_dict,
+        offers_dict,
+        STATUS_MAP,
+        our_other_flg,
+        rem_seats,
+        program,
+        stats,
+        season.offers_until(rnd),
+        events,
+        verbose=False,
+        applied=done,
+    )
+
+    # Only what was applied is remembered, as update_offers.py does
+    applied = dict(st.applied)
+    for up in done:
+        applied[str(up.coap_id)] = (our_other_flg, up.status, source)
+    history = st.history + [
+        {
+            "source": source,
+            "flg": our_other_flg,
+            "updates": {str(up.coap_id): up.status for up in done},
+            "offers_sha256": offers_sha256(offers_dict),
+        }
+    ]
+    return (
+        RoundState(
+            rnd, _read_back(offers_dict), rem_seats, dict(st.factors), stats,
+            applied, history,
+        ),
+        conflicts,
+    )
+
+
+def next_round_waitlist(season, rnd, depth=DEFAULT_DEPTH):
+    """ Who round rnd + 1 reaches with the seats left after round rnd
+
+    returns a Waitlist, see waitlist.py
+    """
+    if rnd not in season.rounds:
+        raise ValueError(f"Round {rnd} has no offers yet")
+    st = season.rounds[rnd]
+    return Waitlist(
+        season.students_dict, season.offers_until(rnd), st.rem_seats, st.factors, depth
+    )
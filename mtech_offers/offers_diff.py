@@ -0,0 +1,214 @@
+# -----------------------------------------------------------------------------
+# What changed between the offers of two rounds, for the COAP upload.
+#
+# The offers of Round_N-1 are put in a dict on coap_id, then the rows of
+# Round_N are streamed past it and classified one by one:
+#
+#   new_offer         offered in Round_N, not offered in Round_N-1
+#   carried_retain    offered in both rounds, retained
+#   carried_accept    offered in both rounds, accepted
+#   category_changed  offered in both rounds, under another seat category
+#   dropped           holding an offer in Round_N-1 but not any more,
+#                     either rejected in Round_N or left out of it
+#
+# The result is written out as CSV while the rows are classified, so the
+# time taken grows linearly with the size of the sheets.
+# -----------------------------------------------------------------------------
+import argparse
+import csv
+import sys
+
+from .offers_ledger import OFFER_COLUMNS, iter_offer_rows, open_ledger
+
+CHANGES = (
+    "new_offer",
+    "carried_retain",
+    "carried_accept",
+    "category_changed",
+    "dropped",
+)
+
+DIFF_COLUMNS = (
+    "coap_id",
+    "appl_id",
+    "gate_id",
+    "name",
+    "change",
+    "status",
+    "offer_seat_category",
+    "previous_status",
+    "previous_seat_category",
+)
+
+_COL = {c: i for i, c in enumerate(OFFER_COLUMNS)}
+
+
+def _offered(r):
+    # Rows for candidates we never made an offer to have no seat category
+    return r[0] is not None and r[_COL["offer_seat_category"]] not in (None, "")
+
+
+def classify(prev, cur):
+    """ The change between a candidate's rows of two rounds.
+
+    Parameters
+    ----------
+    prev : tuple
+        The Round_N-1 row, None if not offered then
+    cur : tuple
+        The Round_N row, None if not in the sheet
+    returns one of CHANGES, or None if there is nothing to report
+    """
+    if cur is None:
+        # Only offers that were still held can be withdrawn
+        if prev[_COL["status"]] == "Reject":
+            return None
+        return "dropped"
+    if prev is None:
+        return "new_offer"
+    if cur[_COL["offer_seat_category"]] != prev[_COL["offer_seat_category"]]:
+        return "category_changed"
+    status = cur[_COL["status"]]
+    if status == "Reject":
+        return "dropped"
+    if status == "Retain":
+        return "carried_retain"
+    if status == "Accept":
+        return "carried_accept"
+    return "new_offer"
+
+
+def _diff_row(change, prev, cur):
+    r = cur if cur is not None else prev
+    return [
+        r[_COL["coap_id"]],
+        r[_COL["appl_id"]],
+        r[_COL["gate_id"]],
+        r[_COL["name"]],
+        change,
+        cur[_COL["status"]] if cur is not None else None,
+        cur[_COL["offer_seat_category"]] if cur is not None else None,
+        prev[_COL["status"]] if prev is not None else None,
+        prev[_COL["offer_seat_category"]] if prev is not None else None,
+    ]
+
+
+def diff_rounds(offers_file, rnd, changes=CHANGES):
+    """ Hash join Round_rnd against Round_rnd-1 on coap_id.
+
+    Parameters
+    ----------
+    offers_file : str
+        The offers workbook
+    rnd : int
+        The round to compare with the one before it
+    changes : collection of str
+        Only these kinds of change are returned
+    returns an iterator over rows in DIFF_COLUMNS order
+    """
+    # Build side: the previous round
+    prev_rows = {}
+    for r in iter_offer_rows(offers_file, "Round_" + str(rnd - 1)):
+        if _offered(r):
+            prev_rows[r[0]] = r
+
+    # Probe side: stream the current round
+    for cur in iter_offer_rows(offers_file, "Round_" + str(rnd)):
+        if not _offered(cur):
+            continue
+        prev = prev_rows.pop(cur[0], None)
+        change = classify(prev, cur)
+        if change in changes:
+            yield _diff_row(change, prev, cur)
+
+    # Whatever was not matched was left out of this round
+    for prev in prev_rows.values():
+        change = classify(prev, None)
+        if change in changes:
+            yield _diff_row(change, prev, None)
+
+
+def _sheetnames(offers_file):
+    ledger = open_ledger(offers_file)
+    if ledger is not None:
+        names = ledger.sheetnames
+        ledger.close()
+        return names
+    import openpyxl
+
+    wb = openpyxl.load_workbook(filename=offers_file, read_only=True)
+    names = wb.sheetnames
+    wb.close()
+    return names
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use the <prefix>_offers.xlsx file.",
+    )
+    parser.add_argument(
+        "-r",
+        "--round",
+        type=int,
+        required=True,
+        help="Compare this round's offers with the previous round's",
+    )
+    parser.add_argument(
+        "-k",
+        "--changes",
+        type=str,
+        default=",".join(CHANGES),
+        help="Comma separated kinds of change to write, e.g. new_offer,dropped "
+        "for the COAP upload. All by default.",
+    )
+    parser.add_argument(
+        "-out",
+        "--output_file",
+        type=str,
+        help="CSV file to write, <prefix>_Round_<r>_diff.csv by default ('-' for stdout)",
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Write the changes of a round, returns the exit status """
+    args = build_parser().parse_args(argv)
+
+    offers_detail_fname = args.offers_prefix + "_offers.xlsx"
+    changes = [c.strip() for c in args.changes.split(",") if c.strip()]
+    unknown = [c for c in changes if c not in CHANGES]
+    if unknown:
+        print(f"!!! ERROR: unknown change(s) {unknown}, use {', '.join(CHANGES)}")
+        return 1
+    names = _sheetnames(offers_detail_fname)
+    for title in ("Round_" + str(args.round - 1), "Round_" + str(args.round)):
+        if title not in names:
+            print(f"!!! ERROR: {offers_detail_fname}: no {title} sheet")
+            return 1
+
+    out_fname = args.output_file or f"{args.offers_prefix}_Round_{args.round}_diff.csv"
+    f = sys.stdout if out_fname == "-" else open(out_fname, "w", newline="")
+    writer = csv.writer(f)
+    writer.writerow(DIFF_COLUMNS)
+    counts = dict.fromkeys(changes, 0)
+    for row in diff_rounds(offers_detail_fname, args.round, changes):
+        writer.writerow(row)
+        counts[row[4]] += 1
+    if f is not sys.stdout:
+        f.close()
+        print(f"-- Wrote {out_fname}")
+        for change, n in counts.items():
+            print(f"   {change}: {n}")
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,234 @@
+# -----------------------------------------------------------------------------
+# The applicants, the offers of every round and the summary as Arrow tables
+# or pandas DataFrames, for analysis outside the scripts.
+#
+#   from mtech_offers.offers_frames import offers_tables, to_frame
+#   rounds = offers_tables("SAMPLE_TA_offers.xlsx")
+#   df = to_frame(rounds["Round_2"])
+#
+# The offers tables are built on the ledger's columns, no row is decoded:
+#
+#   * gate_score and btech_score are the ledger's float64 arrays as they are
+#     (an empty cell is NaN);
+#   * every other column is a dictionary array over the values that column
+#     uses, with the ledger's int32 value codes remapped onto it (-1, an
+#     empty cell, is null). A column holding values of more than one type
+#     (e.g. ints and strings) gets them as strings;
+#   * a round is a slice of the season's table.
+#
+# The tables keep the ledger's memory map open for as long as they live.
+# When the ledger is out of date the xlsx is read and a ledger is built in
+# memory, and the tables are made from that in the same way. to_frame()
+# keeps the float64 columns as they are and makes the dictionary columns
+# categoricals.
+#
+# The other way round, process_applicants() and process_updates() take a
+# DataFrame or an Arrow table wherever they take a list of students or
+# updates, see frame_records().
+#
+# pyarrow (and pandas for to_frame()) are needed here only, see
+# "pip install .[arrow]" or ".[pandas]".
+# -----------------------------------------------------------------------------
+from dataclasses import astuple, fields
+import math
+
+from .offers_ledger import (
+    OFFER_COLUMNS,
+    OffersLedger,
+    build_ledger,
+    ledger_fname,
+    open_ledger,
+    read_offer_sheets,
+)
+from .offers_model import Student
+from .sheet_reader import read_sheets
+
+STUDENT_COLUMNS = tuple(f.name for f in fields(Student))
+UPDATE_COLUMNS = ("coap_id", "status", "program")
+
+# Columns A..D of a summary sheet, the headings are in row 1
+SUMMARY_MAX_COL = 4
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.compute
+    except ImportError:
+        raise ImportError(
+            "Arrow tables need pyarrow, install it with: pip install pyarrow"
+        ) from None
+    return pyarrow
+
+
+def _column_array(pa, values):
+    """ An Arrow array of python values, as strings if their types are mixed """
+    try:
+        return pa.array(values)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.array([None if v is None else str(v) for v in values], pa.string())
+
+
+def _dictionary_column(pa, ledger, indices):
+    """ A dictionary array of the value codes of a column
+
+    The dictionary has only the values the column uses, without nulls or
+    repeats, and the codes are remapped onto it.
+    """
+    pc = pa.compute
+    used = pc.unique(indices).drop_null().sort()
+    values = [ledger.value(c) for c in used.to_pylist()]
+    if len({type(v) for v in values}) > 1:
+        values = [str(v) for v in values]
+    # Codes of values that are the same once made strings (700 and "700")
+    # point at the same entry
+    slots = {}
+    remap = [slots.setdefault(v, len(slots)) for v in values]
+    positions = pc.index_in(indices, value_set=used)
+    if len(slots) < len(values):
+        positions = pc.take(pa.array(remap, pa.int32()), positions)
+    dictionary = _column_array(pa, list(slots)) if slots else pa.array([], pa.string())
+    return pa.DictionaryArray.from_arrays(positions.cast(pa.int32()), dictionary)
+
+
+def _ledger_table(ledger):
+    pa = _pyarrow()
+    pc = pa.compute
+    n = ledger.header["nrows"]
+    arrays = []
+    for name in OFFER_COLUMNS:
+        data = pa.py_buffer(ledger.column(name))
+        if ledger.column_kind(name) == "f8":
+            arrays.append(pa.Array.from_buffers(pa.float64(), n, [None, data]))
+            continue
+        indices = pa.Array.from_buffers(pa.int32(), n, [None, data])
+        if n and pc.min(indices).as_py() < 0:
+            valid = pc.greater_equal(indices, 0).buffers()[1]
+            indices = pa.Array.from_buffers(pa.int32(), n, [valid, data])
+        arrays.append(_dictionary_column(pa, ledger, indices))
+    return pa.Table.from_arrays(arrays, names=list(OFFER_COLUMNS))
+
+
+def offers_tables(offers_file, titles=None):
+    """ The sheets of an offers workbook as Arrow tables
+
+    Parameters
+    ----------
+    titles : list of str
+        Optional, only these sheets (e.g. round_titles(rnd))
+    returns a dict of sheet title -> pyarrow.Table, in sheet order
+    """
+    ledger = open_ledger(offers_file)
+    if ledger is None:
+        sheets = read_offer_sheets(offers_file, titles)
+        ledger = OffersLedger(
+            ledger_fname(offers_file), build_ledger(list(sheets.items()), {})
+        )
+    # Not closed, the tables are views of it
+    table = _ledger_table(ledger)
+    return {
+        s["title"]: table.slice(s["start"], s["nrows"])
+        for s in ledger.header["sheets"]
+        if titles is None or s["title"] in titles
+    }
+
+
+def applicants_table(students):
+    """ A list of Student objects as an Arrow table, a column per field """
+    pa = _pyarrow()
+    columns = list(zip(*(astuple(s) for s in students))) or [()] * len(STUDENT_COLUMNS)
+    return pa.Table.from_arrays(
+        [_column_array(pa, list(c)) for c in columns], names=list(STUDENT_COLUMNS)
+    )
+
+
+def summary_table(summary_file, rnd):
+    """ The Round_<rnd> sheet of a summary workbook as an Arrow table
+
+    returns a pyarrow.Table with the headings of row 1 as column names
+    """
+    pa = _pyarrow()
+    title = "Round_" + str(rnd)
+    rows = read_sheets(summary_file, SUMMARY_MAX_COL, [title]).get(title)
+    if not rows:
+        raise KeyError(f"{summary_file}: no {title} sheet")
+    headings = [str(h) for h in rows[0]]
+    rows = [r for r in rows[1:] if r[0] is not None]
+    columns = list(zip(*rows)) or [()] * len(headings)
+    return pa.Table.from_arrays(
+        [_column_array(pa, list(c)) for c in columns], names=headings
+    )
+
+
+def to_frame(table):
+    """ A pandas DataFrame of an Arrow table
+
+    float64 columns without nulls are not copied, dictionary columns become
+    categoricals of the values they hold.
+    """
+    try:
+        import pandas  # noqa: F401
+    except ImportError:
+        raise ImportError(
+            "DataFrames need pandas, install it with: pip install pandas"
+        ) from None
+    return table.to_pandas(split_blocks=True)
+
+
+def _python_value(v):
+    # numpy scalars and NaN, as a DataFrame gives them, to what the xlsx gives
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float) and math.isnan(v):
+        return None
+    return v
+
+
+def frame_records(obj, columns, defaults=None):
+    """ The rows of a DataFrame or Arrow table as tuples
+
+    Parameters
+    ----------
+    columns : tuple of str
+        The columns to take, in this order
+    defaults : dict
+        Optional, column -> value for columns obj may not have
+    returns a list of tuples, or None when obj is neither a DataFrame nor
+    an Arrow table (a list of students or updates is taken as it is)
+    """
+    if hasattr(obj, "schema") and hasattr(obj, "column_names"):
+        names = obj.column_names
+        n = obj.num_rows
+
+        def take(c):
+            return obj.column(c).to_pylist()
+
+    elif hasattr(obj, "columns") and hasattr(obj, "itertuples"):
+        names = list(obj.columns)
+        n = len(obj)
+
+        def take(c):
+            return obj[c].tolist()
+
+    else:
+        return None
+
+    defaults = defaults or {}
+    data = []
+    for c in columns:
+        if c in names:
+            data.append([_python_value(v) for v in take(c)])
+        elif c in defaults:
+            data.append([defaults[c]] * n)
+        else:
+            raise ValueError(f"no {c} column, the columns are {names}")
+    return list(zip(*data)) if data else []
+
+
+def frame_students(obj):
+    """ Student objects of a DataFrame or Arrow table of applicants, None if
+    obj is neither """
+    rows = frame_records(obj, STUDENT_COLUMNS)
+    if rows is None:
+        return None
+    return [Student(*r) for r in rows]
@@ -0,0 +1,439 @@
+# -----------------------------------------------------------------------------
+# Memory-mapped columnar copy of the <prefix>_offers.xlsx workbook.
+#
+# The xlsx stays the human facing file. Every time the offers workbook is
+# saved we also write <prefix>_offers.ledger next to it, which holds the same
+# rows (columns A..P of every sheet, from row 2 onwards) as flat columns:
+#
+#   * numeric columns (gate_score, btech_score) as float64 arrays,
+#   * every other column as int32 codes into a de-duplicated value table.
+#
+# Loaders mmap the file instead of parsing the xlsx. The rows of a sheet are
+# still built as python tuples when they are read (read_offer_sheets() makes
+# one per row), but each distinct value is decoded only once. The ledger
+# remembers the size and mtime of the xlsx it was built from; if the xlsx
+# was changed by hand afterwards the ledger is treated as stale and we fall
+# back to reading the xlsx itself (see sheet_reader.py).
+# -----------------------------------------------------------------------------
+from array import array
+from datetime import datetime
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+
+from .sheet_reader import read_sheets, sheets_with_rows
+
+LEDGER_MAGIC = b"MTOLDG1\0"
+LEDGER_VERSION = 1
+
+# Columns A..P of a round sheet, in sheet order.
+OFFER_COLUMNS = (
+    "coap_id",
+    "status",
+    "reason",
+    "name",
+    "gender",
+    "student_category",
+    "offer_seat_category",
+    "appl_id",
+    "gate_id",
+    "disabled_flg",
+    "gate_score",
+    "btech_score",
+    "email",
+    "mobile",
+    "gate_stream",
+    "btech_stream",
+)
+
+# Columns we try to keep as float64 arrays.
+NUMERIC_COLUMNS = ("gate_score", "btech_score")
+
+
+def ledger_fname(offers_file):
+    """ <prefix>_offers.xlsx -> <prefix>_offers.ledger """
+    return os.path.splitext(offers_file)[0] + ".ledger"
+
+
+def _source_stamp(fname):
+    st = os.stat(fname)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+def _encode_value(v):
+    # Keep the python type of the cell so that a round trip through the
+    # ledger gives back the same values openpyxl would have given us.
+    if isinstance(v, bool):
+        return b"b" + (b"1" if v else b"0")
+    if isinstance(v, int):
+        return b"i" + str(v).encode()
+    if isinstance(v, float):
+        return b"f" + repr(v).encode()
+    if isinstance(v, datetime):
+        return b"d" + v.isoformat().encode()
+    return b"s" + str(v).encode("utf-8")
+
+
+def _decode_value(raw):
+    tag, payload = raw[:1], raw[1:]
+    if tag == b"b":
+        return payload == b"1"
+    if tag == b"i":
+        return int(payload)
+    if tag == b"f":
+        return float(payload)
+    if tag == b"d":
+        return datetime.fromisoformat(payload.decode())
+    return payload.decode("utf-8")
+
+
+def _is_number(v):
+    return v is None or (isinstance(v, (int, float)) and not isinstance(v, bool))
+
+
+def _pad(buf, fill=b"\0"):
+    # Keep every section 8 byte aligned so that memoryview.cast() works.
+    buf.extend(fill * (-len(buf) % 8))
+
+
+def build_ledger(sheets, source_stamp):
+    """ Build the ledger file contents.
+
+    Parameters
+    ----------
+    sheets : list of (title, rows)
+        rows is a list of 16-tuples, one per sheet row starting at row 2
+    source_stamp : dict
+        size and mtime_ns of the xlsx the rows were read from
+    returns the ledger as bytes
+    """
+    all_rows = []
+    sheet_meta = []
+    for title, rows in sheets:
+        sheet_meta.append({"title": title, "start": len(all_rows), "nrows": len(rows)})
+        all_rows.extend(rows)
+
+    columns = {}
+    for j, name in enumerate(OFFER_COLUMNS):
+        columns[name] = [r[j] for r in all_rows]
+
+    kinds = {}
+    for name in OFFER_COLUMNS:
+        if name in NUMERIC_COLUMNS and all(_is_number(v) for v in columns[name]):
+            kinds[name] = "f8"
+        else:
+            kinds[name] = "code"
+
+    # The value (string) table shared by all coded columns
+    value_codes, values = {}, []
+    coded = {}
+    for name in OFFER_COLUMNS:
+        if kinds[name] != "code":
+            continue
+        codes = array("i")
+        for v in columns[name]:
+            if v is None:
+                codes.append(-1)
+                continue
+            raw = _encode_value(v)
+            code = value_codes.get(raw)
+            if code is None:
+                code = value_codes[raw] = len(values)
+                values.append(raw)
+            codes.append(code)
+        coded[name] = codes
+
+    body = bytearray()
+    sections = {}
+
+    def add_section(name, data):
+        sections[name] = [len(body), len(data)]
+        body.extend(data)
+        _pad(body)
+
+    offsets = array("q", [0])
+    for raw in values:
+        offsets.append(offsets[-1] + len(raw))
+    add_section("value_offsets", offsets.tobytes())
+    add_section("value_blob", b"".join(values))
+    for name in OFFER_COLUMNS:
+        if kinds[name] == "f8":
+            nums = array(
+                "d", (math.nan if v is None else float(v) for v in columns[name])
+            )
+            add_section("col:" + name, nums.tobytes())
+        else:
+            add_section("col:" + name, coded[name].tobytes())
+
+    header = {
+        "version": LEDGER_VERSION,
+        "byteorder": sys.byteorder,
+        "source": source_stamp,
+        "columns": list(OFFER_COLUMNS),
+        "kinds": kinds,
+        "sheets": sheet_meta,
+        "nrows": len(all_rows),
+        "nvalues": len(values),
+        "sections": sections,
+    }
+    head = bytearray(json.dumps(header).encode())
+    _pad(head, b" ")
+    prefix = LEDGER_MAGIC + struct.pack("<Q", len(head))
+    return prefix + bytes(head) + bytes(body)
+
+
+def write_ledger(offers_file, wb):
+    """ Write the ledger for an (already saved) offers workbook.
+
+    Parameters
+    ----------
+    offers_file : str
+        The offers xlsx that was just saved from wb
+    wb : openpyxl.Workbook
+        The workbook in memory, so we don't have to parse the xlsx again
+    """
+    sheets = []
+    for worksheet in wb.worksheets:
+        # openpyxl does not write out empty strings, so the xlsx gives
+        # them back as empty cells. Do the same here.
+        rows = [
+            tuple(
+                None if v == "" else v
+                for v in (
+                    worksheet[f"{column}{row}"].value
+                    for column in "ABCDEFGHIJKLMNOP"
+                )
+            )
+            for row in range(2, worksheet.max_row + 1)
+        ]
+        sheets.append((worksheet.title, rows))
+    write_ledger_sheets(offers_file, sheets)
+
+
+def write_ledger_sheets(offers_file, sheets):
+    """ Write the ledger for an (already saved) offers workbook from its rows.
+
+    Parameters
+    ----------
+    offers_file : str
+        The offers xlsx that was just saved
+    sheets : list of (title, rows)
+        See build_ledger
+    """
+    data = build_ledger(sheets, _source_stamp(offers_file))
+    fname = ledger_fname(offers_file)
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "wb") as f:
+        f.write(data)
+    os.replace(tmp_fname, fname)
+
+
+class OffersLedger:
+    """ Read only, memory mapped view over a ledger file.
+
+    With data, a view over a ledger built in memory (see build_ledger)
+    instead, fname is then only used in messages.
+    """
+
+    def __init__(self, fname, data=None):
+        self.fname = fname
+        self._mm = None
+        if data is None:
+            with open(fname, "rb") as f:
+                self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._mm
+        buf = memoryview(data)
+        if bytes(buf[:8]) != LEDGER_MAGIC:
+            buf.release()
+            if self._mm is not None:
+                self._mm.close()
+            raise ValueError(f"{fname} is not an offers ledger")
+        (head_len,) = struct.unpack("<Q", buf[8:16])
+        self.header = json.loads(bytes(buf[16 : 16 + head_len]))
+        self._body = buf[16 + head_len :]
+        self._sheets = {s["title"]: s for s in self.header["sheets"]}
+        self._cols = {}
+        for name, kind in self.header["kinds"].items():
+            self._cols[name] = self._section("col:" + name).cast(
+                "d" if kind == "f8" else "i"
+            )
+        self._value_offsets = self._section("value_offsets").cast("q")
+        self._value_blob = self._section("value_blob")
+        self._values = [None] * self.header["nvalues"]
+
+    def _section(self, name):
+        off, n = self.header["sections"][name]
+        return self._body[off : off + n]
+
+    def close(self):
+        # All memoryviews must go before the mmap can be closed.
+        for col in self._cols.values():
+            col.release()
+        for view in (self._value_offsets, self._value_blob, self._body):
+            view.release()
+        if self._mm is not None:
+            self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def sheetnames(self):
+        return [s["title"] for s in self.header["sheets"]]
+
+    def nrows(self, title):
+        return self._sheets[title]["nrows"]
+
+    def column(self, name):
+        """ The raw column buffer: float64 values or int32 value codes """
+        return self._cols[name]
+
+    def column_kind(self, name):
+        return self.header["kinds"][name]
+
+    def value(self, code):
+        """ Decode an entry of the value table (-1 is an empty cell) """
+        if code < 0:
+            return None
+        v = self._values[code]
+        if v is None:
+            raw = self._value_blob[
+                self._value_offsets[code] : self._value_offsets[code + 1]
+            ]
+            v = self._values[code] = _decode_value(bytes(raw))
+        return v
+
+    def _cell(self, name, i):
+        if self.header["kinds"][name] == "f8":
+            x = self._cols[name][i]
+            if math.isnan(x):
+                return None
+            return int(x) if x.is_integer() else x
+        return self.value(self._cols[name][i])
+
+    def row(self, i):
+        """ Row i (over the whole ledger) as a 16-tuple, in sheet column order """
+        return tuple(self._cell(name, i) for name in OFFER_COLUMNS)
+
+    def rows(self, title):
+        """ All rows of a sheet, the same as reading A..P from row 2 """
+        meta = self._sheets[title]
+        start = meta["start"]
+        return [self.row(start + i) for i in range(meta["nrows"])]
+
+    def iter_rows(self, title):
+        """ The rows of a sheet one at a time, without building a list """
+        meta = self._sheets[title]
+        start = meta["start"]
+        for i in range(meta["nrows"]):
+            yield self.row(start + i)
+
+
+def open_ledger(offers_file):
+    """ Open the ledger for an offers workbook.
+
+    returns an OffersLedger, or None when there is no ledger or it is
+    out of date with respect to the xlsx (e.g. the xlsx was edited by hand)
+    """
+    fname = ledger_fname(offers_file)
+    if not os.path.exists(fname) or not os.path.exists(offers_file):
+        return None
+    try:
+        ledger = OffersLedger(fname)
+    except (ValueError, OSError, KeyError):
+        return None
+    header = ledger.header
+    if (
+        header.get("version") != LEDGER_VERSION
+        or header.get("byteorder") != sys.byteorder
+        or header.get("source") != _source_stamp(offers_file)
+    ):
+        ledger.close()
+        return None
+    return ledger
+
+
+def round_titles(last):
+    """ The titles of the round sheets 1..last """
+    return ["Round_" + str(k) for k in range(1, last + 1)]
+
+
+def read_offer_sheets(offers_file, titles=None):
+    """ load the rows of the sheets of an offers workbook.
+
+    Uses the ledger when it is up to date, otherwise reads the xlsx archive,
+    parsing only the sheets asked for (see sheet_reader.py).
+
+    Parameters
+    ----------
+    titles : list of str
+        Optional, only these sheets (e.g. round_titles(rnd)). Titles the
+        workbook does not have are left out.
+    returns a dict of sheet title -> list of 16-tuples (columns A..P from
+    row 2 onwards), in sheet order
+    """
+    ledger = open_ledger(offers_file)
+    if ledger is not None:
+        sheets = {
+            title: ledger.rows(title)
+            for title in ledger.sheetnames
+            if titles is None or title in titles
+        }
+        ledger.close()
+        return sheets
+
+    return read_sheets(offers_file, len(OFFER_COLUMNS), titles, min_row=2)
+
+
+def filled_offer_sheets(offers_file, titles=None):
+    """ Which sheets of an offers workbook have offers in them.
+
+    Only the coap_id column is looked at, up to the first row that has one.
+
+    returns a dict of sheet title -> bool, in sheet order
+    """
+    ledger = open_ledger(offers_file)
+    if ledger is not None:
+        filled = {
+            title: any(r[0] is not None for r in ledger.iter_rows(title))
+            for title in ledger.sheetnames
+            if titles is None or title in titles
+        }
+        ledger.close()
+        return filled
+
+    return sheets_with_rows(offers_file, titles, min_row=2)
+
+
+def iter_offer_rows(offers_file, title):
+    """ Stream the rows of one sheet of an offers workbook.
+
+    Like read_offer_sheets, but for a single sheet and one row at a time,
+    so a large sheet is never held in memory as a whole.
+
+    returns an iterator over 16-tuples (columns A..P from row 2 onwards)
+    """
+    ledger = open_ledger(offers_file)
+    if ledger is not None:
+        try:
+            yield from ledger.iter_rows(title)
+        finally:
+            ledger.close()
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(filename=offers_file, read_only=True)
+    try:
+        for r in wb[title].iter_rows(
+            min_row=2, max_col=len(OFFER_COLUMNS), values_only=True
+        ):
+            yield tuple(r)
+    finally:
+        wb.close()
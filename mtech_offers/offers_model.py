@@ -0,0 +1,242 @@
+# -----------------------------------------------------------------------------
+# The loader and model layer shared by make_offers.py and update_offers.py:
+# the rows of the master, summary and offers files, the Student and Offer
+# records, and the loaders of the master and summary files.
+#
+# openpyxl is only imported when a file actually has to be read, so the
+# scripts start (and answer --help) without it.
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+
+from .applicant_dedupe import dedupe_students
+
+# The row from which data starts in master file,
+# to skip headers.
+MASTER_FILE_ROW_START = 3
+
+
+@dataclass
+class ApplicantRow:
+    """A class for holding applicant file row content"""
+
+    a: str
+    b: float
+    c: str
+    d: str
+    e: str
+    f: str
+    g: str
+    h: str
+    i: float
+    j: float
+    k: str
+    l: str
+    m: str
+    n: str
+
+
+@dataclass
+class SummaryRow:
+    """A class for holding summary file row content"""
+
+    a: str
+    b: int
+    c: float
+    d: float
+
+
+@dataclass
+class OfferRow:
+    """A class for holding offer file row content"""
+
+    a: str
+    b: str
+    c: str
+    d: str
+    e: str
+    f: str
+    g: str
+    h: str
+    i: str
+    j: str
+    k: float
+    l: float
+    m: str
+    n: str
+    o: str
+    p: str
+
+
+@dataclass
+class Student:
+    """A class for holding Student content"""
+
+    coap_id: str
+    gate_score: float
+    appl_id: str
+    name: str
+    gender: str
+    category: str
+    disabled_flg: str
+    gate_id: str
+    btech_score: float
+    email: str
+    mobile: str
+    gate_stream: str
+    btech_stream: str
+    # status: str
+
+
+@dataclass
+class Offer:
+    """A class for holding offer content"""
+
+    coap_id: str
+    status: str
+    reason: str
+    name: str
+    gender: str
+    student_category: str
+    offer_seat_category: str
+    appl_id: str
+    gate_id: str
+    disabled_flg: str
+    gate_score: float
+    btech_score: float
+    email: str
+    mobile: str
+    gate_stream: str
+    btech_stream: str
+
+
+def load_summary(offers_summary_fname, rnd, rem_seats, factors, values=None):
+    # wb = openpyxl.load_workbook(filename=offers_summary_fname)
+    # sheet = wb.sheetnames[rnd - 1]
+    # worksheet = wb[sheet]
+
+    # values are columns A..D from row 2, if they were already read
+    # (see preflight.py)
+    if values is None:
+        import openpyxl
+
+        wb = openpyxl.load_workbook(filename=offers_summary_fname)
+        # Remeber that index is off by one, they start from 0!
+        _name = "Round_" + str(rnd)
+        worksheet = wb[_name]
+
+        # Load the rows from file for particular columns of interest
+        cols_of_interest = "ABCD"
+        values = [
+            tuple(worksheet[f"{column}{row}"].value for column in cols_of_interest)
+            for row in range(2, worksheet.max_row + 1)
+        ]
+    rows = [SummaryRow(*v) for v in values]
+    print(rows)
+
+    for r in rows:
+        rem_seats[r.a] = r.b
+        factors[r.a] = r.c
+
+
+def load_students(students_file, values=None, duplicates=None):
+    """ load all student details from this file.
+
+    Rows of the same person are merged down to the one with the best
+    merit (see applicant_dedupe.py).
+
+    Parameters
+    ----------
+    students_file : str
+        The name of file to load applicant details from
+    values : list of tuples
+        Optional, columns A..N from MASTER_FILE_ROW_START onwards if they
+        were already read (see preflight.py)
+    duplicates : list
+        Optional, the rows merged or flagged as duplicates are appended to it
+    returns a list of student objects
+    """
+    if values is None:
+        import openpyxl
+
+        wb = openpyxl.load_workbook(filename=students_file)
+        first_sheet = wb.sheetnames[0]
+        worksheet = wb[first_sheet]
+
+        # Load the rows from file for particular columns of interest
+        # cols_of_interest = ["A", "B", "C", "D", "E", "G", "K", "BM", "BP", "EC"]
+        cols_of_interest = "ABCDEFGHIJKLMN"
+        values = [
+            tuple(worksheet[f"{column}{row}"].value for column in cols_of_interest)
+            for row in range(MASTER_FILE_ROW_START, worksheet.max_row + 1)
+        ]
+    students, found = dedupe_students(list(students_from_rows(values)))
+    if duplicates is not None:
+        duplicates.extend(found)
+
+    # pprint(students)
+    return students
+
+
+def students_from_rows(values):
+    """ The Students of master file rows, one at a time
+
+    Parameters
+    ----------
+    values : iterable of tuples
+        Columns A..N of the rows, BTech applications are left out
+    returns an iterator over student objects
+    """
+    # Iterate through the rows and build up the students
+    for v in values:
+        r = ApplicantRow(*v)
+        # if coap_id == 0, or other single digit strings
+        # then lets skip this as its a BTech Application!
+        if len(str(r.a)) < 4:
+            # print(f'Type of coap_id is = {type(r.a)} and coap_id = {r.a}')
+            continue
+
+        # We have to check and merge results from two cols to get
+        # btech score
+        btech_score = 0.0
+        if r.i:
+            btech_score = r.i
+        else:
+            btech_score = r.j
+
+        category = ""
+        if r.f == "General/OBC(Creamy layer)":
+            category = "gen"
+        elif r.f == "OBC(Non Creamy)":
+            category = "obc_nc"
+        elif r.f == "Economically Weaker Section":
+            category = "ews"
+        elif r.f == "Scheduled Castes":
+            category = "sc"
+        elif r.f == "Scheduled Tribes":
+            category = "st"
+
+        # This is a PWD
+        if r.g == "Yes":
+            category = "pwd"
+
+        s = Student(
+            coap_id=r.a,
+            gate_score=r.b,
+            appl_id=r.c,
+            name=r.d,
+            gender=r.e,
+            category=category,
+            disabled_flg=r.g,
+            gate_id=r.h,
+            btech_score=btech_score,
+            email=r.k,
+            mobile=r.l,
+            gate_stream=r.m,
+            btech_stream=r.n,
+        )
+        yield s
+        # print(asdict(s))
+
+
+def silent(*args, **kwargs):
+    """ Stands in for print() when the caller asked for no output """
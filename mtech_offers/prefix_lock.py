@@ -0,0 +1,104 @@
+# -----------------------------------------------------------------------------
+# Concurrency control for the files of a prefix.
+#
+# make_offers.py and update_offers.py load, change and save the
+# <prefix>_offers.xlsx and <prefix>_summary.xlsx files. Two runs on the same
+# prefix must not interleave, or the last save silently drops the changes of
+# the other run. Each run therefore holds an advisory lock on <prefix>.lock
+# for its whole load-modify-save cycle. Runs on other prefixes (other
+# programs) take other locks and are not held up.
+#
+# Workbooks are saved to a temporary file next to the target and renamed
+# over it, so a crash or a reader never sees a half written file.
+# -----------------------------------------------------------------------------
+from contextlib import contextmanager
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def lock_fname(offers_prefix):
+    return offers_prefix + ".lock"
+
+
+def _try_lock(fd):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+    except OSError:
+        return False
+    return True
+
+
+def _unlock(fd):
+    if fcntl is not None:
+        fcntl.flock(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+@contextmanager
+def prefix_lock(offers_prefix, timeout=None, poll=0.2):
+    """ Hold the lock of a prefix for the duration of the with block
+
+    Parameters
+    ----------
+    offers_prefix : str
+        The prefix of the offers and summary files
+    timeout : float
+        Give up with a TimeoutError after this many seconds, by default wait
+        for as long as it takes
+    """
+    fname = lock_fname(offers_prefix)
+    fd = os.open(fname, os.O_RDWR | os.O_CREAT, 0o666)
+    try:
+        start = time.monotonic()
+        waiting = False
+        while not _try_lock(fd):
+            if not waiting:
+                print(f"-- Waiting for another run on {offers_prefix} to finish ...")
+                waiting = True
+            if timeout is not None and time.monotonic() - start > timeout:
+                raise TimeoutError(f"{fname} is still locked after {timeout}s")
+            time.sleep(poll)
+        try:
+            yield
+        finally:
+            _unlock(fd)
+    finally:
+        os.close(fd)
+
+
+def atomic_replace(fname, write):
+    """ Replace fname by a file written to a temporary file and renamed over it
+
+    Parameters
+    ----------
+    write : function
+        Called with the name of the temporary file to write
+    """
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    try:
+        write(tmp_fname)
+        with open(tmp_fname, "rb") as f:
+            os.fsync(f.fileno())
+        if os.path.exists(fname):
+            # Keep the permissions of the shared file
+            os.chmod(tmp_fname, os.stat(fname).st_mode & 0o7777)
+        os.replace(tmp_fname, fname)
+    finally:
+        if os.path.exists(tmp_fname):
+            os.remove(tmp_fname)
+
+
+def atomic_save(wb, fname):
+    """ Save a workbook by writing a temporary file and renaming it over fname """
+    atomic_replace(fname, lambda tmp_fname: wb.save(filename=tmp_fname))
@@ -0,0 +1,354 @@
+# -----------------------------------------------------------------------------
+# Pre-flight checks of the input files, run before any offers are made or
+# updated and before anything is saved.
+#
+# Every file is streamed once (openpyxl read-only mode; for the offers
+# workbook its ledger, or only the round sheets that are needed, see
+# sheet_reader.py) and every problem found is collected, so they can all be reported
+# at once. The rows that were read are kept on the Preflight object and
+# handed to the loaders, so the real run does not read the files again.
+# Runs that share an InputCache (see season_jobs.py) also share the rows of
+# the master file and the update files. openpyxl is only imported once a
+# file is read.
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+import os
+
+from .offers_ledger import filled_offer_sheets, read_offer_sheets, round_titles
+from .round_stats import CATEGORIES, STATUSES
+from .update_cache import cached_update_rows
+
+# Category names used in the master file, see load_students()
+CATEGORY_NAMES = {
+    "General/OBC(Creamy layer)": "gen",
+    "OBC(Non Creamy)": "obc_nc",
+    "Economically Weaker Section": "ews",
+    "Scheduled Castes": "sc",
+    "Scheduled Tribes": "st",
+}
+
+
+@dataclass
+class Problem:
+    """A class for holding a problem found in an input file"""
+
+    severity: str  # error | warning
+    fname: str
+    where: str
+    message: str
+
+
+def _is_number(v):
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+
+def _is_blank(values):
+    return all(v is None or v == "" for v in values)
+
+
+def _read_rows(wb, min_row, max_col=None, columns=None):
+    # The first sheet's rows from min_row on, either the first max_col
+    # columns or just the given (1 based) columns.
+    worksheet = wb.worksheets[0]
+    if columns is not None:
+        max_col = max(columns)
+    values = []
+    for r in worksheet.iter_rows(min_row=min_row, max_col=max_col, values_only=True):
+        r = tuple(r)
+        if columns is not None:
+            r += (None,) * (max_col - len(r))
+            r = tuple(r[c - 1] for c in columns)
+        values.append(r)
+    return worksheet.title, values
+
+
+class InputCache:
+    """ Rows read from the input files that don't change during a season
+    (the master file and the COAP update files), shared between runs.
+
+    Entries are keyed on the file's size and modification time too, so a
+    file that is replaced is read again.
+    """
+
+    def __init__(self):
+        self.rows = {}
+
+    def get(self, fname, key, read):
+        st = os.stat(fname)
+        key = (os.path.abspath(fname), st.st_size, st.st_mtime_ns) + key
+        if key not in self.rows:
+            self.rows[key] = read()
+        return self.rows[key]
+
+
+class Preflight:
+    """ Collects the problems of all input files of a run """
+
+    def __init__(self, inputs=None):
+        self.inputs = inputs
+        self.problems = []
+        # What was read, for the loaders to reuse
+        self.applicant_values = None
+        self.summary_values = None
+        self.offer_sheets = None
+        self.update_values = None
+
+    def error(self, fname, where, message):
+        self.problems.append(Problem("error", fname, where, message))
+
+    def warning(self, fname, where, message):
+        self.problems.append(Problem("warning", fname, where, message))
+
+    def ok(self):
+        return all(p.severity != "error" for p in self.problems)
+
+    def report(self):
+        """ Print all problems, returns True if there were no errors """
+        for p in self.problems:
+            where = f" [{p.where}]" if p.where else ""
+            print(f"!!! {p.severity.upper()}: {p.fname}{where}: {p.message}")
+        if not self.ok():
+            n = sum(p.severity == "error" for p in self.problems)
+            print(f"!!! {n} error(s) found, nothing was changed.")
+        return self.ok()
+
+    def _open(self, fname):
+        if not os.path.exists(fname):
+            self.error(fname, "", "file not found")
+            return None
+        import openpyxl
+
+        try:
+            return openpyxl.load_workbook(filename=fname, read_only=True)
+        except Exception as e:
+            self.error(fname, "", f"cannot be opened as an xlsx file ({e})")
+            return None
+
+    def _read(self, fname, key, read, on_disk=None):
+        # read(wb) the file, or take its rows from the shared InputCache.
+        # on_disk(read_file) can add an on-disk cache below that.
+        def read_wb():
+            import openpyxl
+
+            wb = openpyxl.load_workbook(filename=fname, read_only=True)
+            try:
+                return read(wb)
+            finally:
+                wb.close()
+
+        read_file = read_wb
+        if on_disk is not None:
+            read_file = lambda: on_disk(read_wb)
+
+        if not os.path.exists(fname):
+            self.error(fname, "", "file not found")
+            return None
+        try:
+            if self.inputs is None:
+                return read_file()
+            return self.inputs.get(fname, key, read_file)
+        except Exception as e:
+            self.error(fname, "", f"cannot be opened as an xlsx file ({e})")
+            return None
+
+    def check_applicants(self, students_file, row_start):
+        """ The master file: coap_id, scores and category of every row """
+        rows = self._read(
+            students_file,
+            ("applicants", row_start),
+            lambda wb: _read_rows(wb, min_row=row_start, max_col=14),
+        )
+        if rows is None:
+            return
+        title, values = rows
+        self.applicant_values = values
+
+        fname = students_file
+        seen = set()
+        for row, v in enumerate(values, row_start):
+            where = f"{title}!{row}"
+            if _is_blank(v):
+                self.error(fname, where, "empty row, delete the rows below the data")
+                continue
+            coap_id = v[0]
+            if coap_id is None:
+                self.error(fname, where, "no coap_id")
+                continue
+            # BTech applications, the loaders skip these.
+            if len(str(coap_id)) < 4:
+                continue
+            if coap_id in seen:
+                self.warning(
+                    fname, where, f"coap_id {coap_id} appears more than once, the rows are merged"
+                )
+            seen.add(coap_id)
+            if not _is_number(v[1]):
+                self.error(fname, where, f"gate_score {v[1]!r} is not a number")
+            btech_score = v[8] if v[8] else v[9]
+            if not _is_number(btech_score):
+                self.error(fname, where, f"btech_score {btech_score!r} is not a number")
+            if v[6] != "Yes" and v[5] not in CATEGORY_NAMES:
+                self.error(fname, where, f"unknown category {v[5]!r}")
+
+    def check_summary(self, summary_file, rnd):
+        """ The round's summary sheet: seats and factors per category """
+        wb = self._open(summary_file)
+        if wb is None:
+            return
+        name = "Round_" + str(rnd)
+        if name not in wb.sheetnames:
+            wb.close()
+            self.error(summary_file, "", f"no {name} sheet")
+            return
+        values = [
+            tuple(r)
+            for r in wb[name].iter_rows(min_row=2, max_col=4, values_only=True)
+        ]
+        wb.close()
+        self.summary_values = values
+
+        seen = set()
+        for row, (a, b, c, d) in enumerate(values, 2):
+            where = f"{name}!{row}"
+            if _is_blank((a, b, c)):
+                self.error(summary_file, where, "empty row, delete the rows below the data")
+                continue
+            if a not in CATEGORIES:
+                self.error(summary_file, where, f"unknown seat category {a!r}")
+            elif a in seen:
+                self.error(summary_file, where, f"seat category {a} appears twice")
+            seen.add(a)
+            if not _is_number(b) or b < 0:
+                self.error(summary_file, where, f"remaining_seats {b!r} is not a count")
+            if not _is_number(c) or c <= 0:
+                self.error(summary_file, where, f"offers_multiply_by {c!r} is not > 0")
+        for cat in CATEGORIES:
+            if cat not in seen:
+                self.error(summary_file, name, f"seat category {cat} is missing")
+
+    def check_offers(self, offers_file, rnd, updating):
+        """ The offers sheets, and whether -r fits the rounds filled so far
+
+        Parameters
+        ----------
+        updating : bool
+            False before making offers for round rnd, True before updating
+            them
+        """
+        if not os.path.exists(offers_file):
+            self.error(offers_file, "", "file not found")
+            return
+        try:
+            filled_sheets = filled_offer_sheets(offers_file)
+            # Only the sheets up to this round are read, the loaders
+            # pick them out by name.
+            sheets = read_offer_sheets(offers_file, round_titles(rnd))
+        except Exception as e:
+            self.error(offers_file, "", f"cannot be opened as an xlsx file ({e})")
+            return
+        self.offer_sheets = sheets
+
+        last = rnd if updating else rnd - 1
+        for expected in round_titles(max(last, rnd)):
+            if expected not in filled_sheets:
+                self.error(offers_file, "", f"no {expected} sheet")
+
+        filled = [t for t, has_rows in filled_sheets.items() if has_rows]
+        for title in filled:
+            k = int(title[6:]) if title[6:].isdigit() else 0
+            if k > rnd:
+                self.error(
+                    offers_file,
+                    title,
+                    f"{title} already has offers, is -r {rnd} the right round?",
+                )
+        for k in range(1, last + 1):
+            title = "Round_" + str(k)
+            if title in filled_sheets and title not in filled:
+                self.error(
+                    offers_file,
+                    title,
+                    f"{title} has no offers, were offers made for round {k}?",
+                )
+        current = "Round_" + str(rnd)
+        if not updating and current in filled:
+            # Every way of saving the round rewrites the whole sheet (see
+            # make_offers.fill_offers_sheet()), no row of the old offers stays
+            self.warning(
+                offers_file,
+                current,
+                f"{current} already has offers, all of its rows are replaced by this run's offers",
+            )
+
+        # The rows of the sheets this run reads
+        for k in range(1, last + 1):
+            title = "Round_" + str(k)
+            for row, r in enumerate(sheets.get(title, []), 2):
+                self._check_offer_row(offers_file, f"{title}!{row}", r)
+
+    def _check_offer_row(self, fname, where, r):
+        if _is_blank(r):
+            self.warning(fname, where, "empty row")
+            return
+        coap_id, status, seat_category, gate_score = r[0], r[1], r[6], r[10]
+        if coap_id is None:
+            self.error(fname, where, "no coap_id")
+        if status not in STATUSES:
+            self.error(fname, where, f"unknown status {status!r}")
+        if seat_category not in CATEGORIES and not (
+            status == "Reject" and seat_category in (None, "")
+        ):
+            self.error(fname, where, f"unknown offer_seat_category {seat_category!r}")
+        if not _is_number(gate_score):
+            self.error(fname, where, f"gate_score {gate_score!r} is not a number")
+
+    def check_updates(
+        self, update_file, rnd, coap_id_col, status_col, prog_col, flg, program, status_map
+    ):
+        """ A COAP update file: every status must be one we know about """
+        if not status_col:
+            self.error(update_file, "", "one of -our or -oth must be given")
+            return
+        from openpyxl.utils import column_index_from_string
+
+        try:
+            cols = [column_index_from_string(c) for c in (coap_id_col, status_col, prog_col)]
+        except ValueError as e:
+            self.error(update_file, "", str(e))
+            return
+        rows = self._read(
+            update_file,
+            ("updates", tuple(cols)),
+            lambda wb: _read_rows(wb, min_row=2, columns=cols),
+            lambda read_file: cached_update_rows(update_file, cols, read_file),
+        )
+        if rows is None:
+            return
+        title, values = rows
+        self.update_values = values
+
+        # Statuses only have to be known for the candidates in the round's
+        # offers, the others are never looked up.
+        offered = set()
+        if self.offer_sheets is not None:
+            offered = {r[0] for r in self.offer_sheets.get("Round_" + str(rnd), [])}
+
+        for row, (coap_id, status, prog) in enumerate(values, 2):
+            where = f"{title}!{row}"
+            if status is None:
+                if coap_id is None:
+                    self.error(update_file, where, "empty row, delete the rows below the data")
+                else:
+                    self.error(update_file, where, f"no status for {coap_id}")
+                continue
+            if not isinstance(status, str):
+                self.error(update_file, where, f"status {status!r} is not text")
+                continue
+            ours = prog is None or prog in program
+            normalized = "".join(status.split()).lower()
+            if ours and coap_id in offered and (flg, normalized) not in status_map:
+                self.error(
+                    update_file,
+                    where,
+                    f"unknown status {status!r} for {coap_id} with -{flg}",
+                )
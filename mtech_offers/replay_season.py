@@ -0,0 +1,331 @@
+# -----------------------------------------------------------------------------
+# Replay a whole season of make_offers.py / update_offers.py runs in memory.
+#
+# Takes the master file, the summary file as it was before the season
+# started, and a season log (see season_log.py) of the runs in order. All
+# rounds are recomputed in memory with offers_api.py (the same functions the
+# scripts use), the master file and every update file are parsed only once, and the
+# <output_prefix>_offers.xlsx and <output_prefix>_summary.xlsx files are
+# written once at the end.
+#
+# The seats and factors for a round come from its sheet in the initial
+# summary file if it was filled in there. Otherwise they are carried over
+# from the previous round, as they stand after its updates.
+#
+# A joint_offers.py run is in the log of every program it made offers for.
+# To replay it, the logs of all those programs are replayed together (see
+# replay_logs()): each log runs up to its next joint run, and the joint run
+# is made once all of its programs got there.
+# -----------------------------------------------------------------------------
+import argparse
+import json
+import os
+import sys
+import time
+
+from . import joint_offers
+from . import make_offers
+from . import offers_model
+from . import update_offers
+from .offers_api import Season, apply_updates, make_joint_round, make_round
+from .offers_ledger import write_ledger
+from .offers_model import SummaryRow
+from .prefix_lock import atomic_save, prefix_lock
+from .round_stats import write_stats_to_sheet
+from .season_log import read_operations, season_log_fname
+from .update_ingest import report_conflicts, updates_history_fname
+
+
+class SeasonReplay:
+    """ The state of every round of a season, kept in memory """
+
+    def __init__(
+        self, students_file, summary_file, output_prefix, base_dir=".", source_prefix=None
+    ):
+        import openpyxl
+
+        self.output_prefix = output_prefix
+        # The prefix the log was written for, as joint runs name it
+        self.source_prefix = source_prefix
+        self.base_dir = base_dir
+        self.summary_file = summary_file
+
+        # Parse the master file once, for both kinds of runs.
+        self.season = Season(offers_model.load_students(students_file))
+        self.rounds = self.season.rounds
+
+        # Seats and factors filled in on the initial summary file
+        self.summary_inputs = {}
+        wb = openpyxl.load_workbook(filename=summary_file)
+        for worksheet in wb.worksheets:
+            rem_seats, factors = {}, {}
+            for row in range(2, worksheet.max_row + 1):
+                r = SummaryRow(
+                    *(worksheet[f"{column}{row}"].value for column in "ABCD")
+                )
+                if r.a is None:
+                    continue
+                rem_seats[r.a] = r.b
+                factors[r.a] = r.c
+            if rem_seats:
+                self.summary_inputs[worksheet.title] = (rem_seats, factors)
+        self.sheetnames = wb.sheetnames
+
+        self._updates_cache = {}
+
+    def _path(self, fname):
+        if os.path.isabs(fname) or os.path.exists(fname):
+            return fname
+        return os.path.join(self.base_dir, fname)
+
+    def _round_inputs(self, rnd):
+        # What load_summary would read for this round
+        if rnd in self.rounds:
+            st = self.rounds[rnd]
+            return dict(st.rem_seats), dict(st.factors)
+        name = "Round_" + str(rnd)
+        if name in self.summary_inputs:
+            rem_seats, factors = self.summary_inputs[name]
+            return dict(rem_seats), dict(factors)
+        if rnd - 1 in self.rounds:
+            st = self.rounds[rnd - 1]
+            print(f"-- [replay] carrying seats and factors over to {name}")
+            return dict(st.rem_seats), dict(st.factors)
+        raise ValueError(f"No seats and factors for {name} in {self.summary_file}")
+
+    def make(self, rnd):
+        """ The equivalent of a make_offers.py run for a round """
+        rem_seats, factors = self._round_inputs(rnd)
+        self.rounds[rnd] = make_round(self.season, rnd, rem_seats, factors)
+
+    def _load_updates(self, update_file, coap_id_col, status_col, prog_col):
+        key = (update_file, coap_id_col, status_col, prog_col)
+        if key not in self._updates_cache:
+            self._updates_cache[key] = update_offers.load_updates(
+                self._path(update_file), coap_id_col, status_col, prog_col
+            )
+        return self._updates_cache[key]
+
+    def update(self, args):
+        """ The equivalent of an update_offers.py run """
+        if args.our_status_col:
+            our_other_flg, status_col = "our", args.our_status_col
+        else:
+            our_other_flg, status_col = "oth", args.other_status_col
+
+        updates_list = self._load_updates(
+            args.update_file, args.coap_id_col, status_col, args.program_col
+        )
+        self.rounds[args.round], conflicts = apply_updates(
+            self.season,
+            args.round,
+            updates_list,
+            our_other_flg,
+            args.program,
+            os.path.basename(args.update_file),
+        )
+        report_conflicts(conflicts, self.output_prefix, args.round)
+
+    def run(self, operations):
+        """ Replay (script name, arguments) operations in order """
+        make_parser = make_offers.build_parser()
+        update_parser = update_offers.build_parser()
+        for i, (script, argv) in enumerate(operations, 1):
+            t0 = time.perf_counter()
+            if script.startswith("make_offers"):
+                args = make_parser.parse_args(argv)
+                self.make(args.round)
+            elif script.startswith("update_offers"):
+                args = update_parser.parse_args(argv)
+                self.update(args)
+            elif script.startswith("joint_offers"):
+                raise ValueError(
+                    f"{script} {' '.join(argv)} was made jointly with other programs, "
+                    "replay their logs together (see replay_logs)"
+                )
+            else:
+                raise ValueError(f"Don't know how to replay {script}")
+            print(
+                f"-- [replay] {i}: {script} round {args.round} "
+                f"({time.perf_counter() - t0:.3f}s)"
+            )
+
+    def write(self):
+        """ Write every replayed round out, one save per file """
+        import openpyxl
+
+        offers_fname = self.output_prefix + "_offers.xlsx"
+        summary_fname = self.output_prefix + "_summary.xlsx"
+
+        # A fresh offers file with the same round sheets as the summary
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+        for name in self.sheetnames:
+            wb.create_sheet(name)
+        for rnd, st in self.rounds.items():
+            make_offers.fill_offers_sheet(wb["Round_" + str(rnd)], st.offers)
+        atomic_save(wb, offers_fname)
+        write_ledger(offers_fname, wb)
+
+        wb = openpyxl.load_workbook(filename=self.summary_file)
+        for rnd, st in self.rounds.items():
+            sh = wb["Round_" + str(rnd)]
+            sh.delete_rows(1, sh.max_row)
+            update_offers.fill_summary_sheet(sh, st.rem_seats, st.factors)
+            write_stats_to_sheet(sh, st.stats)
+        atomic_save(wb, summary_fname)
+
+        # So that update files already applied are not applied again
+        history = {
+            "Round_" + str(rnd): st.history
+            for rnd, st in self.rounds.items()
+            if st.history
+        }
+        with open(updates_history_fname(self.output_prefix), "w") as f:
+            json.dump(history, f, indent=1)
+
+
+def _joint_prefixes(args):
+    # -op PREFIX or -op PREFIX=APPLICANTS_FILE
+    return [spec.partition("=")[0] for spec in args.offers_prefix]
+
+
+def replay_logs(replays, operations):
+    """ Replay the logs of programs that made some of their rounds jointly
+
+    Parameters
+    ----------
+    replays : dict
+        source prefix -> SeasonReplay of each program
+    operations : dict
+        source prefix -> the (script name, arguments) of its log
+    """
+    joint_parser = joint_offers.build_parser()
+    at = dict.fromkeys(replays, 0)
+    while True:
+        # Every log up to its next joint run
+        for prefix, replay in replays.items():
+            ops = operations[prefix]
+            while at[prefix] < len(ops) and not ops[at[prefix]][0].startswith("joint_offers"):
+                replay.run([ops[at[prefix]]])
+                at[prefix] += 1
+        waiting = [p for p in replays if at[p] < len(operations[p])]
+        if not waiting:
+            return
+
+        script, argv = operations[waiting[0]][at[waiting[0]]]
+        args = joint_parser.parse_args(argv)
+        prefixes = _joint_prefixes(args)
+        stuck = [
+            p
+            for p in prefixes
+            if p not in replays
+            or at[p] >= len(operations[p])
+            or operations[p][at[p]][1] != argv
+        ]
+        if stuck:
+            raise ValueError(
+                f"{script} {' '.join(argv)}: the logs of {', '.join(stuck)} are not "
+                "replayed with it, or do not get to this run"
+            )
+
+        t0 = time.perf_counter()
+        seasons = {p: replays[p].season for p in prefixes}
+        seats = {p: replays[p]._round_inputs(args.round) for p in prefixes}
+        preferences = {}
+        if args.preferences_file:
+            preferences = joint_offers.load_preferences(
+                replays[prefixes[0]]._path(args.preferences_file), prefixes
+            )
+        for p, st in make_joint_round(seasons, args.round, seats, preferences).items():
+            replays[p].rounds[args.round] = st
+            at[p] += 1
+        print(
+            f"-- [replay] {script} round {args.round} for {', '.join(prefixes)} "
+            f"({time.perf_counter() - t0:.3f}s)"
+        )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-a",
+        "--applicants_file",
+        type=str,
+        required=True,
+        help="The master file containing all the applications with coap_id, gate_id, appl_id",
+    )
+    parser.add_argument(
+        "-s",
+        "--summary_file",
+        type=str,
+        required=True,
+        help="The summary file as it was before the first round, with Round_1 filled in.",
+    )
+    parser.add_argument(
+        "-l",
+        "--log_file",
+        type=str,
+        required=True,
+        help="The season log with the make_offers.py/update_offers.py runs, in order.",
+    )
+    parser.add_argument(
+        "-op",
+        "--output_prefix",
+        type=str,
+        required=True,
+        help="Write <prefix>_offers.xlsx and <prefix>_summary.xlsx files.",
+    )
+    parser.add_argument(
+        "-j",
+        "--joint",
+        nargs=4,
+        action="append",
+        default=[],
+        metavar=("PREFIX", "APPLICANTS_FILE", "SUMMARY_FILE", "OUTPUT_PREFIX"),
+        help="Another program of the joint_offers.py runs in the log: its prefix, master file, "
+        "summary file before the first round and output prefix. Its log is <PREFIX>_season.log "
+        "next to the -l log. Give it once per program.",
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Replay the season logs, returns the exit status """
+    args = build_parser().parse_args(argv)
+
+    t0 = time.perf_counter()
+    base_dir = os.path.dirname(os.path.abspath(args.log_file))
+    # The -l log's own prefix, as the joint runs name it
+    source_prefix = os.path.basename(args.log_file)
+    if source_prefix.endswith(season_log_fname("")):
+        source_prefix = source_prefix[: -len(season_log_fname(""))]
+    programs = [
+        (source_prefix, args.applicants_file, args.summary_file, args.output_prefix, args.log_file)
+    ] + [
+        (prefix, applicants_file, summary_file, output_prefix,
+         os.path.join(base_dir, season_log_fname(prefix)))
+        for prefix, applicants_file, summary_file, output_prefix in args.joint
+    ]
+    replays, operations = {}, {}
+    for prefix, applicants_file, summary_file, output_prefix, log_file in programs:
+        operations[prefix] = read_operations(log_file)
+        replays[prefix] = SeasonReplay(
+            applicants_file, summary_file, output_prefix, base_dir, prefix
+        )
+    replay_logs(replays, operations)
+    for replay in replays.values():
+        with prefix_lock(replay.output_prefix):
+            replay.write()
+    print(
+        f"-- [replay] {sum(len(ops) for ops in operations.values())} operations replayed in "
+        f"{time.perf_counter() - t0:.2f}s"
+    )
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,195 @@
+# -----------------------------------------------------------------------------
+# Per seat category statistics of a round of offers.
+#
+# make_offer() and process_updates() record every offer and status change
+# here as it happens, so the cutoffs and counts are always up to date and
+# can be written to the summary sheet in one go, without another pass over
+# the offers.
+# -----------------------------------------------------------------------------
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+import heapq
+import itertools
+
+
+# Seat categories, in the order of rows 2..7 of a summary sheet.
+CATEGORIES = ("gen", "obc_nc", "ews", "sc", "st", "pwd")
+
+# Offer statuses used in the offers sheets.
+STATUSES = ("Initial_Offer", "Accept", "Retain", "Reject")
+
+# Written in the post_round_cutoff column when a category has no offers.
+NO_CUTOFF = 99999
+
+# Summary sheet columns filled in from the statistics (A..C are the
+# seat_category, remaining_seats and offers_multiply_by columns).
+STATS_COLUMNS = (
+    ("D", "post_round_cutoff"),
+    ("E", "max_gate_score"),
+    ("F", "closing_btech_score"),
+    ("G", "offers"),
+    ("H", "initial_offer"),
+    ("I", "accept"),
+    ("J", "retain"),
+    ("K", "reject"),
+    ("L", "accept_retain_cutoff"),
+)
+
+
+@dataclass
+class OfferEntry:
+    """A class for holding the part of an offer the statistics need"""
+
+    coap_id: str
+    seat_category: str
+    status: str
+    gate_score: float
+    btech_score: float
+
+
+@dataclass
+class CategoryStats:
+    """A class for holding the aggregates of one seat category"""
+
+    counts: Counter = field(default_factory=Counter)
+    # Heaps with lazy deletion, entries are checked against the live
+    # OfferEntry before they are trusted.
+    _lowest: list = field(default_factory=list)
+    _highest: list = field(default_factory=list)
+    _lowest_ar: list = field(default_factory=list)
+
+
+class RoundStats:
+    """ Incrementally maintained statistics of a round of offers.
+
+    The cutoff of a seat category is the lowest (gate_score, btech_score)
+    amongst its offers; btech_score is what breaks ties on gate_score.
+    """
+
+    def __init__(self):
+        self.categories = {cat: CategoryStats() for cat in CATEGORIES}
+        self._entries = {}
+        self._seq = itertools.count()
+
+    @classmethod
+    def from_offers(cls, offers_dict):
+        """ Start from a dict of offers as loaded from an offers sheet """
+        stats = cls()
+        for coap_id, o in offers_dict.items():
+            stats.record(
+                coap_id,
+                o["offer_seat_category"],
+                o["status"],
+                o["gate_score"],
+                o["btech_score"],
+            )
+        return stats
+
+    def record(self, coap_id, seat_category, status, gate_score, btech_score):
+        """ Record an offer (or replace an earlier one for this coap_id) """
+        self.remove(coap_id)
+        # Empty rows, and rejects of students we never offered a seat to,
+        # have no seat category.
+        if coap_id is None or seat_category not in self.categories:
+            return
+        e = OfferEntry(coap_id, seat_category, status, gate_score, btech_score)
+        self._entries[coap_id] = e
+        cs = self.categories[seat_category]
+        cs.counts[status] += 1
+        if gate_score is None:
+            return
+        seq = next(self._seq)
+        heapq.heappush(cs._lowest, (gate_score, btech_score or 0, seq, e))
+        heapq.heappush(cs._highest, (-gate_score, seq, e))
+        if status in ["Accept", "Retain"]:
+            heapq.heappush(cs._lowest_ar, (gate_score, btech_score or 0, seq, e))
+
+    def remove(self, coap_id):
+        e = self._entries.pop(coap_id, None)
+        if e is not None:
+            self.categories[e.seat_category].counts[e.status] -= 1
+
+    def set_status(self, coap_id, status):
+        """ A status change of an offer we are tracking """
+        e = self._entries.get(coap_id)
+        if e is None or e.status == status:
+            return
+        cs = self.categories[e.seat_category]
+        cs.counts[e.status] -= 1
+        cs.counts[status] += 1
+        e.status = status
+        if status in ["Accept", "Retain"] and e.gate_score is not None:
+            heapq.heappush(
+                cs._lowest_ar, (e.gate_score, e.btech_score or 0, next(self._seq), e)
+            )
+
+    def _top(self, heap, accept_retain=False):
+        # Drop stale entries until the top of the heap is a live offer.
+        while heap:
+            e = heap[0][-1]
+            live = self._entries.get(e.coap_id) is e
+            if live and (not accept_retain or e.status in ["Accept", "Retain"]):
+                return e
+            heapq.heappop(heap)
+        return None
+
+    def closing_offer(self, seat_category):
+        """ The last offer made in merit order in a seat category """
+        return self._top(self.categories[seat_category]._lowest)
+
+    def cutoff(self, seat_category):
+        e = self.closing_offer(seat_category)
+        return NO_CUTOFF if e is None else e.gate_score
+
+    def cutoffs(self):
+        return {cat: self.cutoff(cat) for cat in CATEGORIES}
+
+    def summary(self, seat_category):
+        """ returns a dict with an entry per STATS_COLUMNS heading """
+        cs = self.categories[seat_category]
+        closing = self.closing_offer(seat_category)
+        highest = self._top(cs._highest)
+        closing_ar = self._top(cs._lowest_ar, accept_retain=True)
+        return {
+            "post_round_cutoff": NO_CUTOFF if closing is None else closing.gate_score,
+            "max_gate_score": None if highest is None else highest.gate_score,
+            "closing_btech_score": None if closing is None else closing.btech_score,
+            "offers": sum(cs.counts.values()),
+            "initial_offer": cs.counts["Initial_Offer"],
+            "accept": cs.counts["Accept"],
+            "retain": cs.counts["Retain"],
+            "reject": cs.counts["Reject"],
+            "accept_retain_cutoff": None if closing_ar is None else closing_ar.gate_score,
+        }
+
+
+@lru_cache(maxsize=None)
+def bold_font():
+    """ The one font of every column heading, openpyxl shares it between the cells """
+    # Imported here, so that loading this module does not need openpyxl
+    from openpyxl.styles import Font
+
+    return Font(bold=True)
+
+
+def write_stats_to_sheet(sh, stats):
+    """ Write the statistics into columns D..L of a summary sheet.
+
+    Rows are matched on the seat_category in column A. A category that is
+    not in the sheet goes to its usual row (gen in row 2, ..., pwd in row 7).
+    """
+    rows = {}
+    for row in range(2, sh.max_row + 1):
+        if sh["A" + str(row)].value in CATEGORIES:
+            rows[sh["A" + str(row)].value] = row
+
+    for column, heading in STATS_COLUMNS:
+        sh[column + "1"] = heading
+        sh[column + "1"].font = bold_font()
+
+    for i, cat in enumerate(CATEGORIES, 2):
+        row = str(rows.get(cat, i))
+        summary = stats.summary(cat)
+        for column, heading in STATS_COLUMNS:
+            sh[column + row] = summary[heading]
@@ -0,0 +1,387 @@
+# -----------------------------------------------------------------------------
+# Run the make_offers.py / update_offers.py jobs of a season from a job
+# manifest, instead of typing the commands from the README by hand.
+#
+# The manifest (TOML, or YAML if PyYAML is installed) lists the programs
+# with their prefixes, the rounds to make offers for and the COAP update
+# files of each round, e.g.
+#
+#   applicants_file = "sample_app_file.xlsx"
+#
+#   [[programs]]
+#   prefix = "SAMPLE_TA"
+#   program = "CSE"
+#   rounds = [1]
+#
+#   [[programs.updates]]
+#   round = 1
+#   file = "./coapround1decision/Round 1 IIT Hyderabad Candidate Decision Report.xlsx"
+#   coap_id_col = "A"
+#   our_status_col = "J"
+#   program_col = "H"
+#
+# The jobs of a prefix depend on each other in order: the offers of a round
+# are made before its updates, the updates are applied in the order they
+# are listed, and round N is finished before offers are made for round
+# N + 1. Jobs of different prefixes are independent and run in parallel
+# worker processes. The master file and the update files are parsed once,
+# before the workers start, and shared by all jobs.
+#
+# The output of each job goes to <manifest>_logs/<job>.log. Finished jobs
+# are recorded in <manifest>.state.json, and running the manifest again
+# resumes after the last job that finished, e.g. after fixing a bad
+# update file.
+# -----------------------------------------------------------------------------
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import dataclass, field
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+import traceback
+
+from . import make_offers
+from . import offers_model
+from . import update_offers
+from .preflight import InputCache, Preflight
+
+PROGRAM_KEYS = {"prefix", "program", "rounds", "updates", "applicants_file"}
+UPDATE_KEYS = {
+    "round",
+    "file",
+    "coap_id_col",
+    "our_status_col",
+    "other_status_col",
+    "program_col",
+}
+
+
+@dataclass
+class Job:
+    """A class for holding a make_offers.py or update_offers.py run"""
+
+    id: str
+    prefix: str
+    kind: str  # make | update
+    round: int
+    argv: list
+    deps: list = field(default_factory=list)
+
+
+def load_manifest(fname):
+    """ load a TOML or YAML job manifest into a dict """
+    if fname.endswith((".yaml", ".yml")):
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError("PyYAML is needed for YAML manifests, use TOML instead")
+        with open(fname) as f:
+            return yaml.safe_load(f) or {}
+    try:
+        import tomllib
+    except ImportError:  # Python < 3.11
+        import tomli as tomllib
+    with open(fname, "rb") as f:
+        return tomllib.load(f)
+
+
+def build_jobs(manifest, base_dir=""):
+    """ Turn a manifest into jobs, in an order that respects their deps
+
+    Parameters
+    ----------
+    manifest : dict
+        The manifest, as load_manifest() gives it
+    base_dir : str
+        The manifest's directory, the file names and prefixes in the
+        manifest are relative to it
+    returns a list of Job objects
+    """
+    if not manifest.get("programs"):
+        raise ValueError("the manifest has no [[programs]]")
+
+    # Entries of the same prefix share files, so they form one chain
+    # whichever [[programs]] entry they came from.
+    steps = {}
+    for p in manifest["programs"]:
+        unknown = set(p) - PROGRAM_KEYS
+        if unknown:
+            raise ValueError(f"unknown program key(s) {sorted(unknown)}")
+        if "prefix" not in p:
+            raise ValueError("a program has no prefix")
+        prefix = p["prefix"]
+        applicants_file = p.get("applicants_file", manifest.get("applicants_file"))
+        if not applicants_file:
+            raise ValueError(f"{prefix}: no applicants_file")
+        chain = steps.setdefault(prefix, [])
+        applicants_file = os.path.join(base_dir, applicants_file)
+        prefix_path = os.path.join(base_dir, prefix)
+
+        for rnd in p.get("rounds", []):
+            argv = ["-a", applicants_file, "-o", prefix_path, "-r", str(rnd)]
+            chain.append((int(rnd), 0, "make", argv))
+
+        for u in p.get("updates", []):
+            unknown = set(u) - UPDATE_KEYS
+            if unknown:
+                raise ValueError(f"{prefix}: unknown update key(s) {sorted(unknown)}")
+            for key in ("round", "file", "coap_id_col"):
+                if key not in u:
+                    raise ValueError(f"{prefix}: an update has no {key}")
+            if ("our_status_col" in u) == ("other_status_col" in u):
+                raise ValueError(
+                    f"{prefix}: {u['file']} needs one of our_status_col or other_status_col"
+                )
+            argv = [
+                "-a", applicants_file,
+                "-u", os.path.join(base_dir, u["file"]),
+                "-c", u["coap_id_col"],
+                "-op", prefix_path,
+                "-r", str(u["round"]),
+            ]
+            if "our_status_col" in u:
+                argv += ["-our", u["our_status_col"]]
+            else:
+                argv += ["-oth", u["other_status_col"]]
+            if "program" in p:
+                argv += ["-prg", p["program"]]
+            if "program_col" in u:
+                argv += ["-pcol", u["program_col"]]
+            chain.append((int(u["round"]), 1, "update", argv))
+
+    jobs = []
+    for prefix, chain in steps.items():
+        # Offers before updates within a round, updates in listed order
+        chain.sort(key=lambda step: step[:2])
+        prev, n = None, 0
+        for rnd, _, kind, argv in chain:
+            if kind == "make":
+                job_id = f"{prefix}:make:{rnd}"
+                n = 0
+            else:
+                n += 1
+                job_id = f"{prefix}:update:{rnd}.{n}"
+            jobs.append(
+                Job(job_id, prefix, kind, rnd, argv, [prev.id] if prev else [])
+            )
+            prev = jobs[-1]
+    return jobs
+
+
+def preload_inputs(jobs):
+    """ Parse the master and update files of all jobs once, for sharing """
+    inputs = InputCache()
+    checks = Preflight(inputs)
+    for job in jobs:
+        if job.kind == "make":
+            args = make_offers.build_parser().parse_args(job.argv)
+            checks.check_applicants(args.applicants_file, offers_model.MASTER_FILE_ROW_START)
+            continue
+        args = update_offers.build_parser().parse_args(job.argv)
+        checks.check_applicants(args.applicants_file, offers_model.MASTER_FILE_ROW_START)
+        # Update files of later rounds may not be out yet, their jobs
+        # report that themselves.
+        if os.path.exists(args.update_file):
+            flg = "our" if args.our_status_col else "oth"
+            checks.check_updates(
+                args.update_file,
+                args.round,
+                args.coap_id_col,
+                args.our_status_col or args.other_status_col,
+                args.program_col,
+                flg,
+                args.program,
+                update_offers.STATUS_MAP,
+            )
+    return inputs
+
+
+# Set in each worker process by _init_worker
+_inputs = None
+
+
+def _init_worker(inputs):
+    global _inputs
+    _inputs = inputs
+
+
+def _run_job(job, log_fname):
+    # Runs in a worker process, returns (exit status, seconds)
+    script = make_offers if job.kind == "make" else update_offers
+    t0 = time.perf_counter()
+    with open(log_fname, "w") as f, redirect_stdout(f), redirect_stderr(f):
+        try:
+            status = script.main(job.argv, _inputs)
+        except SystemExit as e:  # bad arguments
+            status = e.code if isinstance(e.code, int) else 1
+        except Exception:
+            traceback.print_exc()
+            status = 1
+    return status, time.perf_counter() - t0
+
+
+class Scheduler:
+    """ Runs the jobs of a manifest, as far as their deps allow in parallel """
+
+    def __init__(self, manifest_fname, jobs, workers=4, restart=False):
+        self.jobs = jobs
+        self.workers = workers
+        base = os.path.splitext(manifest_fname)[0]
+        self.state_fname = base + ".state.json"
+        self.logs_dir = base + "_logs"
+        self.state = {}
+        if not restart and os.path.exists(self.state_fname):
+            with open(self.state_fname) as f:
+                self.state = json.load(f)
+        self.results = {}  # job id -> (status, seconds)
+
+    def _log_fname(self, job):
+        return os.path.join(self.logs_dir, job.id.replace(":", "_") + ".log")
+
+    def _save_state(self):
+        tmp_fname = self.state_fname + ".tmp"
+        with open(tmp_fname, "w") as f:
+            json.dump(self.state, f, indent=1)
+        os.replace(tmp_fname, self.state_fname)
+
+    def _finished_before(self, job, ran):
+        # A job that finished in an earlier run is skipped, unless it was
+        # changed in the manifest or something it depends on ran again.
+        entry = self.state.get(job.id)
+        return (
+            entry is not None
+            and entry["argv"] == job.argv
+            and not any(d in ran for d in job.deps)
+        )
+
+    def run(self, inputs):
+        """ returns True if every job finished """
+        os.makedirs(self.logs_dir, exist_ok=True)
+        pending = list(self.jobs)
+        done, ran, running = set(), set(), {}
+
+        with ProcessPoolExecutor(
+            max_workers=self.workers, initializer=_init_worker, initargs=(inputs,)
+        ) as ex:
+            while True:
+                # Jobs are in dependency order, so one pass is enough to
+                # start, skip or block everything that can be now.
+                waiting = []
+                for job in pending:
+                    failed = [d for d in job.deps if d in self.results and d not in done]
+                    if failed:
+                        self.results[job.id] = ("blocked", 0.0)
+                        print(f"-- [jobs] {job.id} blocked by {failed[0]}")
+                    elif not all(d in done for d in job.deps):
+                        waiting.append(job)
+                    elif self._finished_before(job, ran):
+                        done.add(job.id)
+                        self.results[job.id] = ("skipped", 0.0)
+                        print(f"-- [jobs] {job.id} finished in an earlier run, skipped")
+                    else:
+                        self.state.pop(job.id, None)
+                        fut = ex.submit(_run_job, job, self._log_fname(job))
+                        running[fut] = job
+                        ran.add(job.id)
+                        print(f"-- [jobs] {job.id} started")
+                pending = waiting
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    job = running.pop(fut)
+                    try:
+                        status, seconds = fut.result()
+                    except Exception as e:  # the worker died
+                        status, seconds = f"crashed ({e})", 0.0
+                    if status == 0:
+                        done.add(job.id)
+                        self.results[job.id] = ("done", seconds)
+                        self.state[job.id] = {
+                            "argv": job.argv,
+                            "seconds": round(seconds, 3),
+                            "finished": datetime.datetime.now().isoformat(
+                                timespec="seconds"
+                            ),
+                        }
+                        self._save_state()
+                        print(f"-- [jobs] {job.id} done ({seconds:.2f}s)")
+                    else:
+                        self.results[job.id] = ("failed", seconds)
+                        print(
+                            f"!!! [jobs] {job.id} failed with status {status}, "
+                            f"see {self._log_fname(job)}"
+                        )
+
+        return all(self.results.get(j.id, ("",))[0] in ("done", "skipped") for j in self.jobs)
+
+    def report(self):
+        """ Print how each job went and how long it took """
+        width = max(len(j.id) for j in self.jobs)
+        print(f"\n{'job':<{width}}  {'result':<8}  seconds")
+        for job in self.jobs:
+            result, seconds = self.results.get(job.id, ("not run", 0.0))
+            print(f"{job.id:<{width}}  {result:<8}  {seconds:7.2f}")
+
+
+def main(argv=None):
+    """ Run the jobs of a manifest, as run from the command line
+
+    returns the exit status
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-m",
+        "--manifest",
+        type=str,
+        required=True,
+        help="The job manifest (.toml, or .yaml/.yml)",
+    )
+    parser.add_argument(
+        "-w", "--workers", type=int, default=4, help="Number of jobs run at once"
+    )
+    parser.add_argument(
+        "--restart",
+        action="store_true",
+        help="Run every job again, instead of resuming after the last finished job",
+    )
+    parser.add_argument(
+        "--dry_run", action="store_true", help="Only print the jobs and their order"
+    )
+    args = parser.parse_args(argv)
+
+    # File names in the manifest are relative to it, the working directory
+    # is left as it is
+    manifest_fname = args.manifest
+    try:
+        jobs = build_jobs(load_manifest(manifest_fname), os.path.dirname(manifest_fname))
+    except (OSError, ValueError) as e:
+        print(f"!!! ERROR: {args.manifest}: {e}")
+        return 1
+
+    if args.dry_run:
+        for job in jobs:
+            after = f" (after {job.deps[0]})" if job.deps else ""
+            script = "make_offers.py" if job.kind == "make" else "update_offers.py"
+            print(f"{job.id}{after}: {script} {' '.join(job.argv)}")
+        return 0
+
+    t0 = time.perf_counter()
+    inputs = preload_inputs(jobs)
+    print(f"-- [jobs] input files parsed in {time.perf_counter() - t0:.2f}s")
+    scheduler = Scheduler(manifest_fname, jobs, args.workers, args.restart)
+    ok = scheduler.run(inputs)
+    scheduler.report()
+    print(f"-- [jobs] {len(jobs)} jobs in {time.perf_counter() - t0:.2f}s")
+    return 0 if ok else 1
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,40 @@
+# -----------------------------------------------------------------------------
+# The season log: every successful make_offers.py / update_offers.py run is
+# appended to <prefix>_season.log as the command line that was used. The
+# log can be corrected by hand (e.g. a wrong -r flag) and replayed with
+# replay_season.py.
+# -----------------------------------------------------------------------------
+import os
+import shlex
+
+
+def season_log_fname(offers_prefix):
+    return offers_prefix + "_season.log"
+
+
+def log_operation(offers_prefix, argv):
+    """ Append a command line (sys.argv) to the prefix's season log """
+    line = shlex.join([os.path.basename(argv[0])] + list(argv[1:]))
+    with open(season_log_fname(offers_prefix), "a") as f:
+        f.write(line + "\n")
+
+
+def read_operations(log_fname):
+    """ load the operations from a season log.
+
+    Blank lines and lines starting with # are skipped, and so is a leading
+    "python"/"python3" on a line.
+
+    returns a list of (script name, list of arguments)
+    """
+    operations = []
+    with open(log_fname) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            argv = shlex.split(line)
+            if os.path.basename(argv[0]).startswith("python"):
+                argv = argv[1:]
+            operations.append((os.path.basename(argv[0]), argv[1:]))
+    return operations
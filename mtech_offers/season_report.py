@@ -0,0 +1,366 @@
+# -----------------------------------------------------------------------------
+# Analytics of a whole season, from the Round_N sheets and the summary.
+#
+#   python3 season_report.py -op "SAMPLE_TA"
+#   python3 season_report.py -op "SAMPLE_TA" -o "season.html"
+#
+# The offers of every round are taken as flat columns, once: straight out
+# of the memory-mapped ledger when it is up to date (the int32 value codes
+# and float64 scores are used as they are, nothing is decoded per row),
+# otherwise built the same way from the xlsx. Then the whole season is
+# aggregated in two passes over the columns:
+#
+#   * the rows are counted on (round, seat category, gate_stream,
+#     btech_stream, status) codes with a Counter over the zipped columns;
+#   * the lowest (gate_score, btech_score) and the highest gate_score are
+#     kept for every (round, seat category, gate_stream, btech_stream).
+#
+# Per round and seat category, gate_stream or btech_stream, the offers,
+# statuses and rates, cutoffs and how they moved from the round before
+# then come from these few groups, not from the rows. The seats left and
+# the cutoffs in the summary sheets are added per seat category.
+#
+# Only rows with a seat category are offers, the rejects of candidates we
+# never made an offer to are left out. The report is one workbook with a
+# sheet per grouping, or one HTML file with a table per grouping.
+# -----------------------------------------------------------------------------
+from array import array
+from collections import Counter
+import argparse
+import html
+import math
+import os
+import sys
+import time
+
+from .offers_ledger import OFFER_COLUMNS, open_ledger, read_offer_sheets
+from .round_stats import NO_CUTOFF
+from .sheet_reader import read_sheets
+
+# The groupings reported, each on its own sheet
+GROUPINGS = ("offer_seat_category", "gate_stream", "btech_stream")
+
+# Columns of every grouping, the seat categories also get SEAT_COLUMNS
+REPORT_COLUMNS = (
+    "round",
+    "group",
+    "offers",
+    "initial_offer",
+    "accept",
+    "retain",
+    "reject",
+    "accept_rate",
+    "retain_rate",
+    "reject_rate",
+    "cutoff",
+    "closing_btech_score",
+    "max_gate_score",
+    "cutoff_change",
+)
+SEAT_COLUMNS = ("remaining_seats", "summary_cutoff")
+
+_KEY_COLUMNS = ("offer_seat_category", "gate_stream", "btech_stream", "status")
+
+_COL = {c: i for i, c in enumerate(OFFER_COLUMNS)}
+
+
+def _round_number(title):
+    if title.startswith("Round_") and title[6:].isdigit():
+        return int(title[6:])
+    return None
+
+
+class SeasonColumns:
+    """ The rows of every Round_N sheet as flat columns
+
+    round is the round of each row, the KEY_COLUMNS are int codes (-1 for
+    an empty cell, value() decodes them), gate_score and btech_score are
+    floats (nan for an empty cell).
+    """
+
+    def __init__(self, rounds, codes, value, gate_score, btech_score):
+        self.round = rounds
+        self.codes = codes
+        self.value = value
+        self.gate_score = gate_score
+        self.btech_score = btech_score
+
+
+def _scores(values):
+    return array("d", (math.nan if v is None else float(v) for v in values))
+
+
+def _ledger_columns(ledger):
+    rounds = array("i")
+    for title in ledger.sheetnames:
+        rounds.extend([_round_number(title) or 0] * ledger.nrows(title))
+    codes = {name: ledger.column(name) for name in _KEY_COLUMNS}
+    scores = []
+    for name in ("gate_score", "btech_score"):
+        if ledger.column_kind(name) == "f8":
+            scores.append(ledger.column(name))
+        else:
+            col = ledger.column(name)
+            scores.append(_scores(ledger.value(c) for c in col))
+    return SeasonColumns(rounds, codes, ledger.value, *scores)
+
+
+def _sheet_columns(sheets):
+    rounds = array("i")
+    codes = {name: array("i") for name in _KEY_COLUMNS}
+    value_codes = {}
+    gate, btech = [], []
+    for title, rows in sheets.items():
+        rounds.extend([_round_number(title) or 0] * len(rows))
+        for name in _KEY_COLUMNS:
+            j = _COL[name]
+            codes[name].extend(
+                -1 if r[j] is None else value_codes.setdefault(r[j], len(value_codes))
+                for r in rows
+            )
+        gate.extend(r[_COL["gate_score"]] for r in rows)
+        btech.extend(r[_COL["btech_score"]] for r in rows)
+    values = list(value_codes)
+    return SeasonColumns(
+        rounds,
+        codes,
+        lambda c: None if c < 0 else values[c],
+        _scores(gate),
+        _scores(btech),
+    )
+
+
+def aggregate(columns):
+    """ The two passes over the columns
+
+    returns (Counter of (round, seat, gate_stream, btech_stream, status)
+    codes, dict of (round, seat, gate_stream, btech_stream) codes ->
+    [lowest (gate_score, btech_score), highest gate_score])
+    """
+    seat = columns.codes["offer_seat_category"]
+    gate_stream = columns.codes["gate_stream"]
+    btech_stream = columns.codes["btech_stream"]
+    counts = Counter(
+        zip(columns.round, seat, gate_stream, btech_stream, columns.codes["status"])
+    )
+
+    scores = {}
+    rows = zip(
+        columns.round, seat, gate_stream, btech_stream, columns.gate_score, columns.btech_score
+    )
+    for rnd, s, gs, bs, g, b in rows:
+        if g != g:  # nan, an empty cell
+            continue
+        if b != b:
+            b = 0
+        key = (rnd, s, gs, bs)
+        entry = scores.get(key)
+        if entry is None:
+            scores[key] = [(g, b), g]
+            continue
+        if (g, b) < entry[0]:
+            entry[0] = (g, b)
+        if g > entry[1]:
+            entry[1] = g
+    return counts, scores
+
+
+def _number(x):
+    return int(x) if float(x).is_integer() else x
+
+
+def grouped_report(columns, counts, scores, grouping):
+    """ The rows of one grouping, in round and group order
+
+    returns a list of dicts with an entry per REPORT_COLUMNS heading
+    """
+    at = 1 + _KEY_COLUMNS.index(grouping)
+    value = columns.value
+
+    # Fold the groups into (round, group); only rows with a seat category
+    # are offers.
+    status_counts = {}
+    for key, n in counts.items():
+        rnd, seat = key[0], key[1]
+        if rnd == 0 or value(seat) in (None, ""):
+            continue
+        group = value(key[at])
+        c = status_counts.setdefault((rnd, group), Counter())
+        c[value(key[4])] += n
+    lowest = {}
+    for key, (low, high) in scores.items():
+        rnd, seat = key[0], key[1]
+        if rnd == 0 or value(seat) in (None, ""):
+            continue
+        k = (rnd, value(key[at]))
+        s = lowest.get(k)
+        if s is None:
+            lowest[k] = [low, high]
+            continue
+        s[0] = min(s[0], low)
+        s[1] = max(s[1], high)
+
+    rows, previous = [], {}
+    for rnd, group in sorted(status_counts, key=lambda k: (k[0], str(k[1]))):
+        c = status_counts[(rnd, group)]
+        offers = sum(c.values())
+        low, high = lowest.get((rnd, group), [None, None])
+        cutoff = NO_CUTOFF if low is None else _number(low[0])
+        row = {
+            "round": rnd,
+            "group": group,
+            "offers": offers,
+            "initial_offer": c["Initial_Offer"],
+            "accept": c["Accept"],
+            "retain": c["Retain"],
+            "reject": c["Reject"],
+            "accept_rate": round(c["Accept"] / offers, 3),
+            "retain_rate": round(c["Retain"] / offers, 3),
+            "reject_rate": round(c["Reject"] / offers, 3),
+            "cutoff": cutoff,
+            "closing_btech_score": None if low is None else _number(low[1]),
+            "max_gate_score": None if high is None else _number(high),
+            "cutoff_change": None,
+        }
+        before = previous.get(group)
+        if before is not None and NO_CUTOFF not in (before, cutoff):
+            row["cutoff_change"] = _number(cutoff - before)
+        previous[group] = cutoff
+        rows.append(row)
+    return rows
+
+
+def load_summary_seats(summary_file):
+    """ (round, seat category) -> (remaining_seats, post_round_cutoff) """
+    seats = {}
+    if not os.path.exists(summary_file):
+        return seats
+    for title, rows in read_sheets(summary_file, 4, min_row=2).items():
+        rnd = _round_number(title)
+        if rnd is None:
+            continue
+        for cat, remaining, _, cutoff in rows:
+            if cat is not None:
+                seats[(rnd, cat)] = (remaining, cutoff)
+    return seats
+
+
+def season_report(offers_file, summary_file):
+    """ The report of a season
+
+    returns a dict of grouping -> (column headings, list of row lists)
+    """
+    ledger = open_ledger(offers_file)
+    try:
+        if ledger is not None:
+            columns = _ledger_columns(ledger)
+        else:
+            columns = _sheet_columns(read_offer_sheets(offers_file))
+        counts, scores = aggregate(columns)
+        report = {g: grouped_report(columns, counts, scores, g) for g in GROUPINGS}
+    finally:
+        # The ledger's columns are views of it, and go with it
+        if ledger is not None:
+            ledger.close()
+
+    seats = load_summary_seats(summary_file)
+    tables = {}
+    for grouping, rows in report.items():
+        headings = list(REPORT_COLUMNS)
+        if grouping == "offer_seat_category":
+            headings += SEAT_COLUMNS
+            for row in rows:
+                remaining, cutoff = seats.get((row["round"], row["group"]), (None, None))
+                row["remaining_seats"], row["summary_cutoff"] = remaining, cutoff
+        tables[grouping] = (headings, [[row[h] for h in headings] for row in rows])
+    return tables
+
+
+def write_report_workbook(fname, tables):
+    import openpyxl
+
+    from .prefix_lock import atomic_save
+    from .round_stats import bold_font
+
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for grouping, (headings, rows) in tables.items():
+        sh = wb.create_sheet(grouping)
+        sh.append(headings)
+        for j in range(1, len(headings) + 1):
+            sh.cell(row=1, column=j).font = bold_font()
+        for row in rows:
+            sh.append(row)
+    atomic_save(wb, fname)
+
+
+def write_report_html(fname, tables, title):
+    out = [
+        "<!DOCTYPE html>",
+        f"<html><head><meta charset=\"utf-8\"><title>{html.escape(title)}</title></head><body>",
+        f"<h1>{html.escape(title)}</h1>",
+    ]
+    for grouping, (headings, rows) in tables.items():
+        out.append(f"<h2>{html.escape(grouping)}</h2>")
+        out.append("<table border=\"1\">")
+        out.append("<tr>" + "".join(f"<th>{html.escape(h)}</th>" for h in headings) + "</tr>")
+        for row in rows:
+            cells = ("" if v is None else html.escape(str(v)) for v in row)
+            out.append("<tr>" + "".join(f"<td>{v}</td>" for v in cells) + "</tr>")
+        out.append("</table>")
+    out.append("</body></html>")
+    with open(fname, "w") as f:
+        f.write("\n".join(out) + "\n")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use <prefix>_offers.xlsx and <prefix>_summary.xlsx files.",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="The report, a .xlsx or .html file, <prefix>_season_report.xlsx by default",
+    )
+    return parser
+
+
+def main(argv=None):
+    """ Write the analytics report of a season, returns the exit status """
+    args = build_parser().parse_args(argv)
+    offers_file = args.offers_prefix + "_offers.xlsx"
+    summary_file = args.offers_prefix + "_summary.xlsx"
+    out_fname = args.output or args.offers_prefix + "_season_report.xlsx"
+    if not os.path.exists(offers_file):
+        print(f"!!! ERROR: {offers_file} not found")
+        return 1
+    if not out_fname.endswith((".xlsx", ".html", ".htm")):
+        print(f"!!! ERROR: {out_fname} is neither a .xlsx nor a .html file")
+        return 1
+
+    t0 = time.perf_counter()
+    tables = season_report(offers_file, summary_file)
+    t1 = time.perf_counter()
+    if out_fname.endswith(".xlsx"):
+        write_report_workbook(out_fname, tables)
+    else:
+        write_report_html(out_fname, tables, f"{args.offers_prefix} season report")
+    n_rounds = len({row[0] for row in tables["offer_seat_category"][1]})
+    print(
+        f"-- {n_rounds} round(s) analysed in {t1 - t0:.2f}s, "
+        f"written to {out_fname} in {time.perf_counter() - t1:.2f}s"
+    )
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
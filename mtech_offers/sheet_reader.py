@@ -0,0 +1,213 @@
+# -----------------------------------------------------------------------------
+# Read chosen sheets of an xlsx straight out of the zip archive.
+#
+# openpyxl.load_workbook() parses every sheet and the whole shared string
+# table, even in read-only mode it works through the workbook as a whole.
+# A run only needs the Round_k sheets up to its own round, so here:
+#
+#   * workbook.xml and its rels map sheet titles to their zip members, and
+#     only the members of the sheets asked for are parsed;
+#   * the shared string table is parsed only up to the last string those
+#     sheets use (openpyxl adds strings in the order it writes them, so the
+#     strings of the early rounds come first);
+#   * whether a sheet has any rows is found out without its strings, and
+#     stops at the first filled row.
+#
+# The rows come out as openpyxl gives them from iter_rows(values_only=True)
+# in read-only mode: missing rows and cells are None, numbers are int or
+# float as written, and nothing past the sheet's <dimension> is read. It is
+# meant for the workbooks these scripts write: cell styles are not looked
+# at, so numbers formatted as dates stay numbers, and shared formulas are
+# not expanded, neither of which the offers workbooks have.
+# -----------------------------------------------------------------------------
+import posixpath
+import re
+import xml.etree.ElementTree as ET
+
+MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+NS = {
+    "main": MAIN,
+    "rel": "http://schemas.openxmlformats.org/package/2006/relationships",
+}
+R_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+
+_ROW = f"{{{MAIN}}}row"
+_CELL = f"{{{MAIN}}}c"
+_VALUE = f"{{{MAIN}}}v"
+_FORMULA = f"{{{MAIN}}}f"
+_INLINE = f"{{{MAIN}}}is"
+_TEXT = f"{{{MAIN}}}t"
+_RUN = f"{{{MAIN}}}r"
+_SI = f"{{{MAIN}}}si"
+_DIMENSION = f"{{{MAIN}}}dimension"
+
+_COLUMN = re.compile(r"[A-Z]+")
+
+
+def sheet_parts(zin):
+    """ The zip member of every sheet, a dict of title -> name in sheet order """
+    workbook = ET.fromstring(zin.read("xl/workbook.xml"))
+    rels = ET.fromstring(zin.read("xl/_rels/workbook.xml.rels"))
+    targets = {rel.get("Id"): rel.get("Target") for rel in rels.iterfind("rel:Relationship", NS)}
+    parts = {}
+    for sheet in workbook.iterfind("main:sheets/main:sheet", NS):
+        target = targets.get(sheet.get(R_ID))
+        if target is None:
+            continue
+        if target.startswith("/"):
+            parts[sheet.get("name")] = target[1:]
+        else:
+            parts[sheet.get("name")] = posixpath.normpath(posixpath.join("xl", target))
+    return parts
+
+
+def _column(ref):
+    n = 0
+    for ch in _COLUMN.match(ref).group():
+        n = n * 26 + ord(ch) - 64
+    return n
+
+
+def _text(el):
+    # Plain and rich text, without phonetic runs, as openpyxl reads it
+    t = el.find(_TEXT)
+    if t is not None:
+        return t.text or ""
+    return "".join(r.findtext(_TEXT) or "" for r in el.iterfind(_RUN))
+
+
+def _number(v):
+    if "." in v or "E" in v or "e" in v:
+        return float(v)
+    return int(v)
+
+
+def _max_row(ref):
+    # "A1:P23" -> 23, None when the sheet doesn't say
+    m = re.search(r"(\d+)$", ref or "")
+    return int(m.group(1)) if m else None
+
+
+def _iter_rows(source, min_row, max_col, shared):
+    """ The rows of a sheet part, one list at a time
+
+    Shared strings are left as their index, and (row, column, index) is
+    appended to shared for the caller to fill in.
+    """
+    counter = min_row
+    row_number = 0
+    max_row = None
+    for _, el in ET.iterparse(source):
+        if el.tag == _DIMENSION:
+            max_row = _max_row(el.get("ref"))
+            continue
+        if el.tag != _ROW:
+            continue
+        r = el.get("r")
+        row_number = int(r) if r else row_number + 1
+        if max_row is not None and row_number > max_row:
+            # Rows missing before the <dimension> are empty
+            while counter <= max_row:
+                yield [None] * max_col
+                counter += 1
+            return
+        if row_number < counter:
+            el.clear()
+            continue
+        while counter < row_number:
+            yield [None] * max_col
+            counter += 1
+        values = [None] * max_col
+        column = 0
+        for c in el.iterfind(_CELL):
+            ref = c.get("r")
+            column = _column(ref) if ref else column + 1
+            if column > max_col:
+                continue
+            t = c.get("t", "n")
+            f = c.find(_FORMULA)
+            v = None if t == "inlineStr" else (c.findtext(_VALUE) or None)
+            if f is not None:
+                v = "=" + (f.text or "")
+            elif v is not None:
+                if t == "n":
+                    v = _number(v)
+                elif t == "s":
+                    v = int(v)
+                    shared.append((values, column - 1, v))
+                elif t == "b":
+                    v = bool(int(v))
+            elif t == "inlineStr":
+                inline = c.find(_INLINE)
+                if inline is not None:
+                    v = _text(inline)
+            values[column - 1] = v
+        el.clear()
+        counter += 1
+        yield values
+
+
+def _shared_strings(zin, n):
+    """ The first n strings of the shared string table """
+    strings = []
+    if n == 0:
+        return strings
+    with zin.open("xl/sharedStrings.xml") as f:
+        for _, el in ET.iterparse(f):
+            if el.tag != _SI:
+                continue
+            strings.append(_text(el))
+            el.clear()
+            if len(strings) == n:
+                break
+    return strings
+
+
+def read_sheets(fname, max_col, titles=None, min_row=1):
+    """ The rows of some sheets of an xlsx.
+
+    Parameters
+    ----------
+    max_col : int
+        The number of columns to read, every row has this many
+    titles : list of str
+        The sheets to read, all of them if None. Titles the workbook does
+        not have are left out.
+    min_row : int
+        The first row to read, 1 based
+    returns a dict of sheet title -> list of tuples, in sheet order
+    """
+    import zipfile
+
+    sheets = {}
+    with zipfile.ZipFile(fname) as zin:
+        parts = sheet_parts(zin)
+        wanted = [t for t in parts if titles is None or t in titles]
+        shared = []
+        for title in wanted:
+            with zin.open(parts[title]) as f:
+                sheets[title] = list(_iter_rows(f, min_row, max_col, shared))
+        strings = _shared_strings(zin, max((i for _, _, i in shared), default=-1) + 1)
+    for values, column, i in shared:
+        values[column] = strings[i]
+    return {title: [tuple(r) for r in rows] for title, rows in sheets.items()}
+
+
+def sheets_with_rows(fname, titles=None, min_row=1):
+    """ Which sheets have a value in column A from min_row on.
+
+    returns a dict of sheet title -> bool, in sheet order
+    """
+    import zipfile
+
+    filled = {}
+    with zipfile.ZipFile(fname) as zin:
+        parts = sheet_parts(zin)
+        for title in parts:
+            if titles is not None and title not in titles:
+                continue
+            # Shared strings are left as their index, which is not None
+            # either, so the string table is not needed here.
+            with zin.open(parts[title]) as f:
+                filled[title] = any(r[0] is not None for r in _iter_rows(f, min_row, 1, []))
+    return filled
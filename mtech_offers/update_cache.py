@@ -0,0 +1,66 @@
+# -----------------------------------------------------------------------------
+# On-disk cache of the rows read from COAP update files.
+#
+# Rolling back and re-applying updates means reading the same (sometimes
+# large) update files again. The (coap_id, status, program) columns read
+# from a file are kept in UPDATE_CACHE_DIR under a key made of the sha256
+# of the file's content and the columns that were read, so a file that was
+# seen before costs a hash and a small JSON read. Changing the file or
+# picking other columns gives another key, old entries are simply not used.
+# -----------------------------------------------------------------------------
+import hashlib
+import json
+import os
+
+UPDATE_CACHE_DIR = ".update_cache"
+CACHE_VERSION = 1
+
+
+def file_sha256(fname):
+    h = hashlib.sha256()
+    with open(fname, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def cache_fname(update_file, cols, cache_dir=UPDATE_CACHE_DIR):
+    """ Where the rows of update_file read from cols (1 based) are cached """
+    key = f"v{CACHE_VERSION}:{file_sha256(update_file)}:" + ",".join(map(str, cols))
+    return os.path.join(cache_dir, hashlib.sha256(key.encode()).hexdigest() + ".json")
+
+
+def cached_update_rows(update_file, cols, read, cache_dir=UPDATE_CACHE_DIR):
+    """ The rows of an update file, from the cache if it was read before
+
+    Parameters
+    ----------
+    update_file : str
+        The COAP update file
+    cols : list of int
+        The coap_id, status and program columns (1 based)
+    read : function
+        Reads the file, returns (sheet title, list of row tuples)
+    returns (sheet title, list of row tuples)
+    """
+    fname = cache_fname(update_file, cols, cache_dir)
+    if os.path.exists(fname):
+        try:
+            with open(fname) as f:
+                entry = json.load(f)
+            return entry["title"], [tuple(r) for r in entry["values"]]
+        except (OSError, ValueError, KeyError):
+            pass  # a damaged entry, read the file again
+
+    title, values = read()
+    try:
+        data = json.dumps({"title": title, "values": values})
+    except TypeError:
+        # Cells that JSON can't hold (e.g. dates), don't cache this file
+        return title, values
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_fname = f"{fname}.{os.getpid()}.tmp"
+    with open(tmp_fname, "w") as f:
+        f.write(data)
+    os.replace(tmp_fname, fname)
+    return title, values
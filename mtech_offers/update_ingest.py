@@ -0,0 +1,254 @@
+# -----------------------------------------------------------------------------
+# Ingest stage for COAP update files.
+#
+# Before process_updates() touches any seat counts, the rows of an update
+# file are indexed on coap_id so that duplicates and contradictions are
+# found in one pass, both within the file and against the update files
+# already applied for the round. Each coap_id is left with one update,
+# chosen by UPDATE_PRECEDENCE, and everything that was dropped is reported.
+#
+# The update files applied in a round are remembered in
+# <prefix>_updates.json together with a hash of the round's offers sheet
+# after they were applied. Restoring a backup of the offers file therefore
+# also rolls back this history.
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+import csv
+import hashlib
+import json
+import os
+
+# When the same coap_id has different statuses in a round, the update with
+# the higher precedence wins. Accept and Freeze at IITH is final, accepting
+# another institute's offer comes next, and a reject beats a retain.
+UPDATE_PRECEDENCE = {
+    ("our", "acceptandfreeze"): 4,
+    ("oth", "acceptandfreeze"): 3,
+    ("our", "rejectandwait"): 2,
+    ("our", "retainandwait"): 1,
+}
+
+
+@dataclass
+class UpdateConflict:
+    """A class for holding an update that was dropped and why"""
+
+    coap_id: str
+    kind: str  # duplicate | contradiction | already_applied | overridden
+    kept: str
+    dropped: str
+
+
+def _describe(flg, status, source):
+    return f"{flg}:{status} ({source})"
+
+
+def _precedence(flg, status):
+    return UPDATE_PRECEDENCE.get((flg, status), 0)
+
+
+def updates_history_fname(offers_prefix):
+    return offers_prefix + "_updates.json"
+
+
+def conflicts_report_fname(offers_prefix, rnd):
+    return f"{offers_prefix}_Round_{rnd}_update_conflicts.csv"
+
+
+def offers_sha256(offers_dict):
+    """ Hash of a round's offers, as they are (or will be) in the sheet """
+    h = hashlib.sha256()
+    for coap_id, o in offers_dict.items():
+        # Empty strings come back from the xlsx as empty cells
+        row = [coap_id, {k: None if v == "" else v for k, v in o.items()}]
+        h.update(json.dumps(row, default=str, sort_keys=True).encode())
+    return h.hexdigest()
+
+
+def _load_history(offers_prefix):
+    fname = updates_history_fname(offers_prefix)
+    if not os.path.exists(fname):
+        return {}
+    with open(fname) as f:
+        return json.load(f)
+
+
+def _valid_history(history, round_sha256):
+    # The entries up to the one that left the offers sheet as it is now.
+    valid = 0
+    for i, entry in enumerate(history, 1):
+        if entry["offers_sha256"] == round_sha256:
+            valid = i
+    return history[:valid]
+
+
+def load_applied_updates(offers_prefix, rnd, round_sha256):
+    """ load the updates already applied in this round.
+
+    Only the history up to the current state of the offers file counts: if
+    the offers file was restored from a backup, updates applied after that
+    backup are forgotten.
+
+    Parameters
+    ----------
+    round_sha256 : str
+        Hash of the round's offers as they are now (see offers_sha256)
+    returns a dict of coap_id -> (flg, status, source)
+    """
+    history = _load_history(offers_prefix).get("Round_" + str(rnd), [])
+    valid = _valid_history(history, round_sha256)
+    if len(valid) < len(history):
+        print(
+            f"-- Offers sheet does not match the last {len(history) - len(valid)} "
+            f"applied update file(s) of round {rnd}, ignoring them"
+        )
+
+    applied = {}
+    for entry in valid:
+        for coap_id, status in entry["updates"].items():
+            applied[coap_id] = (entry["flg"], status, entry["source"])
+    return applied
+
+
+def record_applied_updates(
+    offers_prefix, rnd, round_sha256, offers_dict, updates, flg, source
+):
+    """ Remember that these updates were applied and saved
+
+    Parameters
+    ----------
+    round_sha256 : str
+        Hash of the round's offers before the updates were applied
+    offers_dict : dict
+        The round's offers as written out after the updates
+    updates : list of UpdateRow objects
+        The updates process_updates() applied, not the ones it skipped
+        (other programs, not in the master file, seen in a previous round)
+    """
+    all_history = _load_history(offers_prefix)
+
+    # Drop whatever does not lead up to the offers file we started from
+    key = "Round_" + str(rnd)
+    history = _valid_history(all_history.get(key, []), round_sha256)
+    all_history[key] = history + [
+        {
+            "source": source,
+            "flg": flg,
+            "updates": {str(up.coap_id): up.status for up in updates},
+            "offers_sha256": offers_sha256(offers_dict),
+        }
+    ]
+    fname = updates_history_fname(offers_prefix)
+    tmp_fname = fname + ".tmp"
+    with open(tmp_fname, "w") as f:
+        json.dump(all_history, f, indent=1)
+    os.replace(tmp_fname, fname)
+
+
+def ingest_updates(updates, our_other_flg, source, program, applied=None):
+    """ Resolve the updates of a file down to one per coap_id.
+
+    Parameters
+    ----------
+    updates : list of UpdateRow objects
+        As loaded from the update file, in file order
+    our_other_flg : str
+        "our" or "oth", which status column the file was read with
+    source : str
+        Name of the update file, for the report
+    program : str
+        Our program, rows for other programs are left out
+    applied : dict
+        Updates already applied this round (see load_applied_updates)
+    returns (list of UpdateRow objects, list of UpdateConflict objects)
+    """
+    applied = applied or {}
+    conflicts = []
+    index = {}
+    for up in updates:
+        # Same rule as in process_updates, other programs' rows don't count.
+        if (up.program is not None) and (up.program not in program):
+            continue
+
+        prev = index.get(up.coap_id)
+        if prev is None:
+            index[up.coap_id] = up
+            continue
+
+        if prev.status == up.status:
+            conflicts.append(
+                UpdateConflict(
+                    up.coap_id,
+                    "duplicate",
+                    _describe(our_other_flg, prev.status, source),
+                    _describe(our_other_flg, up.status, source),
+                )
+            )
+            continue
+
+        # Contradiction within the file, the later row wins a tie.
+        if _precedence(our_other_flg, up.status) >= _precedence(
+            our_other_flg, prev.status
+        ):
+            keep, drop = up, prev
+        else:
+            keep, drop = prev, up
+        index[up.coap_id] = keep
+        conflicts.append(
+            UpdateConflict(
+                up.coap_id,
+                "contradiction",
+                _describe(our_other_flg, keep.status, source),
+                _describe(our_other_flg, drop.status, source),
+            )
+        )
+
+    # Now check against what was applied earlier in the round
+    resolved = []
+    for coap_id, up in index.items():
+        if str(coap_id) in applied:
+            prev_flg, prev_status, prev_source = applied[str(coap_id)]
+            if (prev_flg, prev_status) == (our_other_flg, up.status):
+                conflicts.append(
+                    UpdateConflict(
+                        coap_id,
+                        "already_applied",
+                        _describe(prev_flg, prev_status, prev_source),
+                        _describe(our_other_flg, up.status, source),
+                    )
+                )
+                continue
+            if _precedence(prev_flg, prev_status) > _precedence(
+                our_other_flg, up.status
+            ):
+                conflicts.append(
+                    UpdateConflict(
+                        coap_id,
+                        "overridden",
+                        _describe(prev_flg, prev_status, prev_source),
+                        _describe(our_other_flg, up.status, source),
+                    )
+                )
+                continue
+        resolved.append(up)
+
+    return resolved, conflicts
+
+
+def report_conflicts(conflicts, offers_prefix, rnd):
+    """ Print the conflicts and append them to the round's conflict report """
+    if not conflicts:
+        return
+    print(f"\n!!!!! {len(conflicts)} conflicting update(s) were dropped:")
+    for c in conflicts:
+        print(f"  [{c.kind}] {c.coap_id}: kept {c.kept}, dropped {c.dropped}")
+
+    fname = conflicts_report_fname(offers_prefix, rnd)
+    new_file = not os.path.exists(fname)
+    with open(fname, "a", newline="") as f:
+        writer = csv.writer(f)
+        if new_file:
+            writer.writerow(["coap_id", "kind", "kept", "dropped"])
+        for c in conflicts:
+            writer.writerow([c.coap_id, c.kind, c.kept, c.dropped])
+    print(f"  (also written to {fname})\n")
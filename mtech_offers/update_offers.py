@@ -0,0 +1,889 @@
+# -----------------------------------------------------------------------------
+# Code to automate to update the status of offers made to MTech students.
+#
+# May 2020, M. Kaul
+#
+# File 2: IITH Offered, but accepted OTHER
+# File 3: IITH Candidate decision report
+# File 4: All IITs consolidated report
+# File 6: Coap - Not registered and not responded
+#
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+import argparse
+import math
+import os
+import sys
+
+# The rest of the package is imported where it is needed, so that --help
+# and argument errors come back without loading it (see cli.py)
+
+
+@dataclass
+class UpdateRow:
+    """A class for holding updates"""
+
+    coap_id: str
+    status: str
+    program: str = "NA"  # NA is for consolidated file with no program
+
+
+#
+# Let us make a status map, from what is in the update file to
+# our internal offer statuses and reasons
+#
+STATUS_MAP = {
+    ("our", "acceptandfreeze"): {
+        "status": "Accept",
+        "reason": "IITH offered, accepted our offer",
+    },
+    ("our", "rejectandwait"): {
+        "status": "Reject",
+        "reason": "IITH offered, rejected our offer",
+    },
+    ("our", "retainandwait"): {
+        "status": "Retain",
+        "reason": "IITH offered, retained our offer",
+    },
+    ("oth", "acceptandfreeze"): {
+        "status": "Reject",
+        "reason": "IITH offered, accepted other offer",
+    },
+}
+
+
+def fill_summary_sheet(sh, rem_seats, factors):
+    """ Write the seats that remain and the factors into a summary sheet """
+    from .round_stats import bold_font
+
+    # Column headings
+    sh["A1"] = "seat_category"
+    sh["B1"] = "remaining_seats"
+    sh["C1"] = "offers_multiply_by"
+    sh["D1"] = "post_round_cutoff"
+
+    # Just bolding the column headings
+    for j in "ABCD":
+        sh[j + "1"].font = bold_font()
+
+    # Now start to dump seats that remain
+    # Note: We start to enumerate from 2 onwards, to skip the
+    # column headings.
+    for i, (k, v) in enumerate(rem_seats.items(), 2):
+        print(i, k, v)
+        sh["A" + str(i)] = k
+        sh["B" + str(i)] = v
+        sh["C" + str(i)] = factors[k]
+
+
+def write_updated_summary(offers_summary_fname, rnd, rem_seats, factors, stats=None):
+    import openpyxl
+
+    from .prefix_lock import atomic_save
+    from .round_stats import write_stats_to_sheet
+
+    wb = openpyxl.load_workbook(filename=offers_summary_fname)
+    # _name = "Round_" + str(rnd + 1)
+    _name = "Round_" + str(rnd)
+    sh = wb[_name]
+
+    fill_summary_sheet(sh, rem_seats, factors)
+
+    # Cutoffs and counts as they stand after this update file
+    if stats is not None:
+        write_stats_to_sheet(sh, stats)
+
+    atomic_save(wb, offers_summary_fname)
+
+
+def load_updates(update_file, coap_id_col, status_col, prog_col, values=None):
+    """ load all update details from this file.
+
+    Parameters
+    ----------
+    update_file : str
+        The name of file to load applicantion updates to statuses
+    values : list of tuples
+        Optional, the (coap_id, status, program) columns from row 2 onwards
+        if they were already read (see preflight.py)
+    returns a list of student objects
+    """
+    if values is None:
+        import openpyxl
+        from openpyxl.utils import column_index_from_string
+
+        from .update_cache import cached_update_rows
+
+        # We are only interested in the coap_id and status column in
+        # the update file.
+        cols_of_interest = [coap_id_col, status_col, prog_col]
+
+        def read():
+            wb = openpyxl.load_workbook(filename=update_file)
+            first_sheet = wb.sheetnames[0]
+            worksheet = wb[first_sheet]
+
+            # Load the rows from file for particular columns of interest
+            print(
+                f"Cols of interest in updates --> {cols_of_interest}, max rows = {worksheet.max_row}"
+            )
+            return first_sheet, [
+                tuple(worksheet[f"{column}{row}"].value for column in cols_of_interest)
+                for row in range(2, worksheet.max_row + 1)
+            ]
+
+        # Files seen before (e.g. re-applied after a rollback) come from
+        # the cache, keyed on their content and these columns.
+        cols = [column_index_from_string(c) for c in cols_of_interest]
+        _, values = cached_update_rows(update_file, cols, read)
+    return update_rows(values)
+
+
+def update_rows(values):
+    """ UpdateRows from (coap_id, status, program) tuples
+
+    The statuses are brought to the form STATUS_MAP uses, e.g.
+    "Reject and Wait" -> "rejectandwait".
+    """
+    rows = [UpdateRow(*v) for v in values]
+    # pprint(rows)
+
+    for r in rows:
+        r.status = "".join(r.status.split()).lower()
+
+    return rows
+
+
+def load_students(students_file, values=None, duplicates=None):
+    """ load all student details from this file.
+
+    Parameters
+    ----------
+    students_file : str
+        The name of file to load applicant details from
+    values : list of tuples
+        Optional, columns A..N from MASTER_FILE_ROW_START onwards if they
+        were already read (see preflight.py)
+    duplicates : list
+        Optional, the rows merged or flagged as duplicates are appended to it
+    returns a dict of coap_id -> student details
+    """
+    from . import offers_model
+
+    return students_by_id(
+        offers_model.load_students(students_file, values, duplicates)
+    )
+
+
+def students_by_id(students):
+    """ The dict of coap_id -> student details of a list of Students """
+    students_dict = {}
+    for s in students:
+        students_dict[s.coap_id] = {
+            "gate_score": s.gate_score,
+            "appl_id": s.appl_id,
+            "name": s.name,
+            "gender": s.gender,
+            "category": s.category,
+            "disabled_flg": s.disabled_flg,
+            "gate_id": s.gate_id,
+            "btech_score": s.btech_score,
+            "email": s.email,
+            "mobile": s.mobile,
+            "gate_stream": s.gate_stream,
+            "btech_stream": s.btech_stream,
+        }
+    return students_dict
+
+
+def load_offers(offers_file, rnd, sheets=None):
+    """ load all student offers from this file.
+
+    Parameters
+    ----------
+    offers_file : str
+        The name of file to load offer details from
+    sheets : dict
+        Optional, the sheets of the offers file if they were already read
+        (see read_offer_sheets)
+    returns a list of offer objects
+    """
+    from .offers_ledger import read_offer_sheets
+    from .offers_model import Offer, OfferRow
+
+    # Only the round's sheet is read, from the memory-mapped ledger when it
+    # is up to date
+    title = "Round_" + str(rnd)
+    if sheets is None:
+        sheets = read_offer_sheets(offers_file, [title])
+    rows = [OfferRow(*r) for r in sheets[title]]
+    # Iterate through the rows and build up the students
+    offers_dict = {}
+    for r in rows:
+
+        o = Offer(
+            coap_id=r.a,
+            status=r.b,
+            reason=r.c,
+            name=r.d,
+            gender=r.e,
+            student_category=r.f,
+            offer_seat_category=r.g,
+            appl_id=r.h,
+            gate_id=r.i,
+            disabled_flg=r.j,
+            gate_score=r.k,
+            btech_score=r.l,
+            email=r.m,
+            mobile=r.n,
+            gate_stream=r.o,
+            btech_stream=r.p,
+        )
+        offers_dict[o.coap_id] = {
+            "gate_id": o.gate_id,
+            "appl_id": o.appl_id,
+            "name": o.name,
+            "gender": o.gender,
+            "student_category": o.student_category,
+            "disabled_flg": o.disabled_flg,
+            "gate_score": o.gate_score,
+            "btech_score": o.btech_score,
+            "offer_seat_category": o.offer_seat_category,
+            "status": o.status,
+            "reason": o.reason,
+            "email": o.email,
+            "mobile": o.mobile,
+            "gate_stream": o.gate_stream,
+            "btech_stream": o.btech_stream,
+        }
+    return offers_dict
+
+
+def load_all_previous_and_current_offers(offers_file, rnd, sheets=None):
+    """ load all student offers from each round
+
+    Parameters
+    ----------
+    offers_file : str
+        The name of file to load offer details from
+    rnd : int
+        The current round
+    sheets : dict
+        Optional, the sheets of the offers file if they were already read
+        (see read_offer_sheets)
+    returns a dict of offer objects
+    """
+    from .offers_ledger import read_offer_sheets, round_titles
+    from .offers_model import Offer, OfferRow
+
+    # Only the sheets up to this round are read, from the memory-mapped
+    # ledger when it is up to date
+    titles = round_titles(rnd)
+    if sheets is None:
+        sheets = read_offer_sheets(offers_file, titles)
+
+    # Lets iterate through the round sheets to build our
+    # offers dictionary
+    offers_dict = {}
+    for title in titles:
+        print(f"-- Processing previous worksheet {title}")
+
+        # Load the rows from file for particular columns of interest
+        rows = [OfferRow(*r) for r in sheets[title]]
+        # Iterate through the rows and build up the students
+        for r in rows:
+            # No need to load students who have been offered in
+            # previous round but are still at "Initial_Offer"
+            # status.
+            if r.c == "Initial_Offer":
+                continue
+
+            o = Offer(
+                coap_id=r.a,
+                status=r.b,
+                reason=r.c,
+                name=r.d,
+                gender=r.e,
+                student_category=r.f,
+                offer_seat_category=r.g,
+                appl_id=r.h,
+                gate_id=r.i,
+                disabled_flg=r.j,
+                gate_score=r.k,
+                btech_score=r.l,
+                email=r.m,
+                mobile=r.n,
+                gate_stream=r.o,
+                btech_stream=r.p,
+            )
+            offers_dict[o.coap_id] = {
+                "status": o.status,
+                "reason": o.reason,
+                "name": o.name,
+                "gender": o.gender,
+                "student_category": o.student_category,
+                "offer_seat_category": o.offer_seat_category,
+                "appl_id": o.appl_id,
+                "gate_id": o.gate_id,
+                "disabled_flg": o.disabled_flg,
+                "gate_score": o.gate_score,
+                "btech_score": o.btech_score,
+                "email": o.email,
+                "mobile": o.mobile,
+                "gate_stream": o.gate_stream,
+                "btech_stream": o.btech_stream,
+            }
+
+    #            # Let us just separate out the +ve and -ve COAPs
+    #            if o.status in ["Accept", "Retain"]:
+    #                pos_dict[o.coap_id] = 1
+    #            elif o.status == "Reject":
+    #                neg_dict[o.coap_id] = 1
+
+    return offers_dict
+
+
+def process_updates(
+    updates,
+    students_dict,
+    offers_dict,
+    status_map,
+    our_other_flg,
+    rem_seats,
+    program,
+    stats=None,
+    all_offers_dict=None,
+    events=None,
+    verbose=True,
+    waitlist=None,
+    applied=None,
+):
+    """ Process the list of updates here.
+    Parameters
+    ----------
+    updates : list of UpdateRow objects
+        Or a DataFrame or Arrow table with coap_id, status and (optional)
+        program columns (see offers_frames.py)
+    students_dict : dict
+        coap_id -> student details, or a DataFrame or Arrow table of the
+        applicants
+    stats : RoundStats
+        Optional, updated with every status change
+    all_offers_dict : dict
+        Offers of all rounds up to this one, consolidated file updates
+        for these candidates are skipped
+    events : DecisionLog
+        Optional, what was done with every update is recorded in it
+    waitlist : Waitlist
+        Optional, told every status and seat change (see waitlist.py)
+    verbose : bool
+        Print what is done, as the script does
+    applied : list
+        Optional, every update that was applied (not skipped) is appended
+        to it, these are the ones to remember (see update_ingest.py)
+    """
+    from .decision_log import timer
+    from .offers_frames import UPDATE_COLUMNS, frame_records, frame_students
+    from .offers_model import Offer, silent
+
+    if all_offers_dict is None:
+        all_offers_dict = {}
+    say = print if verbose else silent
+
+    rows = frame_records(updates, UPDATE_COLUMNS, {"program": None})
+    if rows is not None:
+        updates = update_rows(rows)
+    students = frame_students(students_dict)
+    if students is not None:
+        students_dict = students_by_id(students)
+
+    say(f"***** [process_updates] program = {program}")
+
+    # Iterate through all the updates
+    for up in updates:
+        if events is not None:
+            t0 = timer()
+        say(
+            f"\n--- update coap_id = {up.coap_id}, status = {up.status}, program={up.program}"
+        )
+
+        # If the update program and student program don't match we can skip!
+        # For consolidated file, the up.program will be None!
+        if (up.program is not None) and (
+            up.program not in program
+        ):  # and (program is not "NA"):
+            say(f"-- Skipped candidate because his/her program = {up.program}")
+            if events is not None:
+                events.record(up.coap_id, "other_program", ns=timer() - t0)
+            continue
+
+        # If last update file (consolidated), we shouldn't relook at
+        # previous offers
+        if up.program is None and up.coap_id in all_offers_dict:
+            say(
+                f"-- [consolidated] Skipped candidate because found in our prev offers."
+            )
+            if events is not None:
+                events.record(up.coap_id, "consolidated_seen", ns=timer() - t0)
+            continue
+
+        # Found coap_id in the list of applications in master file!
+        if up.coap_id in students_dict:
+            say(f"+++++++ Found {up.coap_id} in master applications list!")
+            # Found him in the current most round of offers
+            if up.coap_id in offers_dict:
+                say(f"****** Found {up.coap_id} in current offers list!")
+                # Which status flag is it ?
+                # If it is ours then we must check the
+                # statuses carefully to compute remaining seats
+                # Let us get what the internal status (int_status) is.
+                int_status = status_map[(our_other_flg, up.status)]["status"]
+                int_reason = status_map[(our_other_flg, up.status)]["reason"]
+                category = offers_dict[up.coap_id]["offer_seat_category"]
+                before = rem_seats.get(category)
+
+                # Lets first check that it is our status
+                if our_other_flg == "our":
+                    # If we have offered this student and he
+                    # accepts or retains then we must reduce
+                    # the number of available seats in the
+                    # seat_category.
+                    if int_status in ["Accept"]:  # , "Retain"]:
+                        say(
+                            f"\n------->>>>> [{up.coap_id}] For int_status = {int_status}, we reduce in {category} seats!\n"
+                        )
+                        rem_seats[category] -= 1
+                        if waitlist is not None:
+                            waitlist.set_seats(category, rem_seats[category])
+
+                # Stamp the right status and reason on offer
+                offers_dict[up.coap_id]["status"] = int_status
+                offers_dict[up.coap_id]["reason"] = int_reason
+                if stats is not None:
+                    stats.set_status(up.coap_id, int_status)
+                if waitlist is not None:
+                    waitlist.record(up.coap_id, int_status, category)
+                if applied is not None:
+                    applied.append(up)
+                if events is not None:
+                    events.record(
+                        up.coap_id,
+                        "status_update",
+                        int_status,
+                        category,
+                        before,
+                        rem_seats.get(category),
+                        timer() - t0,
+                    )
+
+            # coap_id is not in offers file for round, this is
+            # an applicant that we did not offer but
+            # took up some other inst. offer.
+            else:
+                # We must insert a new row in the offers dict then!
+                o = Offer(
+                    coap_id=up.coap_id,
+                    gate_id=students_dict[up.coap_id]["gate_id"],
+                    appl_id=students_dict[up.coap_id]["appl_id"],
+                    name=students_dict[up.coap_id]["name"],
+                    gender=students_dict[up.coap_id]["gender"],
+                    student_category=students_dict[up.coap_id]["category"],
+                    disabled_flg=students_dict[up.coap_id]["disabled_flg"],
+                    gate_score=students_dict[up.coap_id]["gate_score"],
+                    btech_score=students_dict[up.coap_id]["btech_score"],
+                    email=students_dict[up.coap_id]["email"],
+                    mobile=students_dict[up.coap_id]["mobile"],
+                    gate_stream=students_dict[up.coap_id]["gate_stream"],
+                    btech_stream=students_dict[up.coap_id]["btech_stream"],
+                    offer_seat_category="",
+                    status="Reject",
+                    reason="IITH never offered, accepted other offer",
+                )
+                offers_dict[o.coap_id] = {
+                    "gate_id": o.gate_id,
+                    "appl_id": o.appl_id,
+                    "name": o.name,
+                    "gender": o.gender,
+                    "student_category": o.student_category,
+                    "disabled_flg": o.disabled_flg,
+                    "gate_score": o.gate_score,
+                    "btech_score": o.btech_score,
+                    "offer_seat_category": o.offer_seat_category,
+                    "status": o.status,
+                    "reason": o.reason,
+                    "email": o.email,
+                    "mobile": o.mobile,
+                    "gate_stream": o.gate_stream,
+                    "btech_stream": o.btech_stream,
+                }
+                if waitlist is not None:
+                    waitlist.record(o.coap_id, o.status, o.offer_seat_category)
+                if applied is not None:
+                    applied.append(up)
+                if events is not None:
+                    events.record(up.coap_id, "never_offered", o.status, ns=timer() - t0)
+
+        elif events is not None:
+            events.record(up.coap_id, "not_in_master", ns=timer() - t0)
+
+    return offers_dict
+
+
+def write_updated_offers_to_workbook(offer_file, offers_dict, rnd, fast=False):
+    from .fast_save import fast_save_round
+    from .offers_ledger import write_ledger
+    from .prefix_lock import atomic_save
+    from .round_stats import bold_font
+
+    # Only the round sheet is written, see fast_save.py
+    if fast and fast_save_round(offer_file, offers_dict, rnd):
+        return
+
+    import openpyxl
+
+    wb = openpyxl.load_workbook(filename=offer_file)
+    sh = wb["Round_" + str(rnd)]
+
+    # Column headings
+    sh["A1"] = "coap_id"
+    sh["B1"] = "status"
+    sh["C1"] = "reason"
+    sh["D1"] = "name"
+    sh["E1"] = "gender"
+    sh["F1"] = "student_category"
+    sh["G1"] = "offer_seat_category"
+    sh["H1"] = "appl_id"
+    sh["I1"] = "gate_id"
+    sh["J1"] = "disabled_flg"
+    sh["K1"] = "gate_score"
+    sh["L1"] = "btech_score"
+    sh["M1"] = "email"
+    sh["N1"] = "mobile"
+    sh["O1"] = "gate_stream"
+    sh["P1"] = "btech_stream"
+
+    # Just bolding the column headings
+    for j in "ABCDEFGHIJKLMNOP":
+        sh[j + "1"].font = bold_font()
+
+    # Now start to dump offers dict contents into the worksheet!
+    # Note: We start to enumerate from 2 onwards, to skip the
+    # column headings.
+    for i, (k, v) in enumerate(offers_dict.items(), 2):
+        # print(i, k, v)
+        sh["A" + str(i)] = k
+        sh["B" + str(i)] = v["status"]
+        sh["C" + str(i)] = v["reason"]
+        sh["D" + str(i)] = v["name"]
+        sh["E" + str(i)] = v["gender"]
+        sh["F" + str(i)] = v["student_category"]
+        sh["G" + str(i)] = v["offer_seat_category"]
+        sh["H" + str(i)] = v["appl_id"]
+        sh["I" + str(i)] = v["gate_id"]
+        sh["J" + str(i)] = v["disabled_flg"]
+        sh["K" + str(i)] = v["gate_score"]
+        sh["L" + str(i)] = v["btech_score"]
+        sh["M" + str(i)] = v["email"]
+        sh["N" + str(i)] = v["mobile"]
+        sh["O" + str(i)] = v["gate_stream"]
+        sh["P" + str(i)] = v["btech_stream"]
+
+    # Rows after the last offer, as fast_save_round() leaves none either
+    if sh.max_row > len(offers_dict) + 1:
+        sh.delete_rows(len(offers_dict) + 2, sh.max_row - len(offers_dict) - 1)
+
+    atomic_save(wb, offer_file)
+    # Keep the columnar ledger in sync with the xlsx
+    write_ledger(offer_file, wb)
+
+
+def build_parser():
+    from .waitlist import DEFAULT_DEPTH
+
+    parser = argparse.ArgumentParser()
+    # This is done to ensure that you can only pass at a time either the
+    # "our_status_col" or "other_status_col" so we pick the status from
+    # there.
+    group = parser.add_mutually_exclusive_group()
+
+    parser.add_argument(
+        "-a",
+        "--applicants_file",
+        type=str,
+        required=True,
+        help="The master file containing all the applications with coap_id, gate_id, appl_id",
+    )
+    parser.add_argument(
+        "-u",
+        "--update_file",
+        type=str,
+        required=True,
+        help="The coap updates file containing all the application status changes",
+    )
+    parser.add_argument(
+        "-c",
+        "--coap_id_col",
+        type=str,
+        required=True,
+        help="The column name in updates spreadsheet where coap_id is present. E.g. A means look in column A",
+    )
+    parser.add_argument(
+        "-op",
+        "--offers_prefix",
+        type=str,
+        required=True,
+        help="This prefix will use <prefix>_offers.xlsx and <prefix>_summary.xlsx files.",
+    )
+    parser.add_argument(
+        "-prg",
+        "--program",
+        type=str,
+        default="NA",
+        required=False,
+        help="This is the program offered (e.g. CSE, NIS)",
+    )
+    parser.add_argument(
+        "-pcol",
+        "--program_col",
+        type=str,
+        required=False,
+        default="Z",
+        help="This is the column name in updates spreadsheet where program offered is present.",
+    )
+    parser.add_argument(
+        "-r",
+        "--round",
+        type=int,
+        required=True,
+        default=1,
+        help="Current round of offers to update",
+    )
+    parser.add_argument(
+        "--fast_save",
+        action="store_true",
+        help="Save only the round sheet of the offers workbook, leaving the other sheets as they are",
+    )
+    parser.add_argument(
+        "--waitlist",
+        type=int,
+        default=0,
+        metavar="K",
+        help="Write who the next round reaches, and the next K after them, to <prefix>_waitlist.xlsx "
+        f"(e.g. {DEFAULT_DEPTH}, left out by default)",
+    )
+    group.add_argument(
+        "-our",
+        "--our_status_col",
+        type=str,
+        help="The column in updates spreadsheet where iith_status is present.",
+    )
+    group.add_argument(
+        "-oth",
+        "--other_status_col",
+        type=str,
+        help="The column in updates spreadsheet where other_status is present.",
+    )
+    return parser
+
+
+def main(argv=None, inputs=None):
+    """ Apply a COAP update file to a round, as run from the command line
+
+    Parameters
+    ----------
+    argv : list of str
+        The command line arguments, sys.argv[1:] by default
+    inputs : InputCache
+        Optional, parsed input files shared between runs (see preflight.py)
+    returns the exit status
+    """
+    if argv is None:
+        argv = sys.argv[1:]
+    args = build_parser().parse_args(argv)
+
+    from contextlib import ExitStack
+    from pprint import pprint
+
+    from .applicant_dedupe import report_duplicates
+    from .decision_log import DecisionLog
+    from .offers_model import MASTER_FILE_ROW_START, load_summary
+    from .prefix_lock import prefix_lock
+    from .preflight import Preflight
+    from .round_stats import RoundStats
+    from .season_log import log_operation
+    from .update_ingest import (
+        ingest_updates,
+        load_applied_updates,
+        offers_sha256,
+        record_applied_updates,
+        report_conflicts,
+    )
+    from .waitlist import Waitlist, waitlist_fname, write_waitlist
+
+    students_file = args.applicants_file
+    update_file = args.update_file
+    offers_prefix = args.offers_prefix
+    coap_id_col = args.coap_id_col
+    our_status_col = args.our_status_col
+    other_status_col = args.other_status_col
+    program = args.program
+    prog_col = args.program_col
+
+    print(f"--- Input program, program_col = {program}, {prog_col}")
+
+    rnd = args.round
+
+    offers_detail_fname = offers_prefix + "_offers.xlsx"
+    offers_summary_fname = offers_prefix + "_summary.xlsx"
+
+    status_col = ""
+    if not our_status_col:
+        status_col = other_status_col
+    else:
+        status_col = our_status_col
+
+    our_other_flg = ""
+    if not our_status_col:
+        our_other_flg = "oth"
+    else:
+        our_other_flg = "our"
+
+    # Only one run at a time on this prefix's files, so that two runs can't
+    # overwrite each other's saves. Other prefixes are not held up.
+    with prefix_lock(offers_prefix), ExitStack() as cleanup:
+        # Check all the input files before doing anything, and report all the
+        # problems at once. What was read is reused below.
+        checks = Preflight(inputs)
+        checks.check_applicants(students_file, MASTER_FILE_ROW_START)
+        checks.check_summary(offers_summary_fname, rnd)
+        checks.check_offers(offers_detail_fname, rnd, updating=True)
+        checks.check_updates(
+            update_file,
+            rnd,
+            coap_id_col,
+            status_col,
+            prog_col,
+            our_other_flg,
+            program,
+            STATUS_MAP,
+        )
+        if not checks.report():
+            return 1
+
+        # Dicts we need!
+        rem_seats, factors, rem_offers = {}, {}, {}
+
+        load_summary(offers_summary_fname, rnd, rem_seats, factors, checks.summary_values)
+        # Populate rem_offers now!
+        for k, v in rem_seats.items():
+            # rem_offers[k] = int(v) * int(factors[k])
+            rem_offers[k] = math.ceil(int(v) * float(factors[k]))
+
+        # pprint(rem_offers)
+
+        # This will have details of students we made offers to
+        offers_dict = {}
+        all_offers_dict = {}
+        students_dict, duplicates = {}, []
+        students_dict = load_students(
+            students_file, checks.applicant_values, duplicates
+        )
+        report_duplicates(duplicates, offers_prefix, rnd)
+        # pprint(students_dict)
+
+        offers_dict = load_offers(offers_detail_fname, rnd, checks.offer_sheets)
+        # This one had to be added for "consolidated file" processing.
+        # We want that offers in all previous rounds and current offers
+        # should be ignored.
+        all_offers_dict = load_all_previous_and_current_offers(
+            offers_detail_fname, rnd, checks.offer_sheets
+        )
+        # pprint(offers_dict)
+
+        # Now let us load the updates!
+        updates = []
+        updates_list = load_updates(
+            update_file, coap_id_col, status_col, prog_col, checks.update_values
+        )
+
+        status_map = STATUS_MAP
+        # pprint(status_map)
+
+        # Resolve duplicate and contradicting updates, within this file and
+        # against the files already applied this round, before any seat
+        # arithmetic happens.
+        round_sha256 = offers_sha256(offers_dict)
+        applied_updates = load_applied_updates(offers_prefix, rnd, round_sha256)
+        updates_list, conflicts = ingest_updates(
+            updates_list,
+            our_other_flg,
+            os.path.basename(update_file),
+            program,
+            applied_updates,
+        )
+        report_conflicts(conflicts, offers_prefix, rnd)
+
+        updated_offers_dict = {}
+
+        # Cutoffs and counts of the round, kept up to date by process_updates
+        stats = RoundStats.from_offers(offers_dict)
+
+        # What was done with each update
+        events = cleanup.enter_context(
+            DecisionLog(offers_prefix, "update_offers.py", rnd, argv)
+        )
+        # Who the next round reaches, kept up to date with every update
+        waitlist = None
+        if args.waitlist > 0:
+            waitlist = Waitlist(
+                students_dict, all_offers_dict, rem_seats, factors, args.waitlist
+            )
+        applied = []
+        updated_offers_dict = process_updates(
+            updates_list,
+            students_dict,
+            offers_dict,
+            status_map,
+            our_other_flg,
+            rem_seats,
+            program,
+            stats,
+            all_offers_dict,
+            events,
+            waitlist=waitlist,
+            applied=applied,
+        )
+        # print(f'After processing updates: {updated_offers_dict}')
+        pprint(updated_offers_dict)
+        # Write out the latest offers
+        write_updated_offers_to_workbook(
+            offers_detail_fname, updated_offers_dict, rnd, args.fast_save
+        )
+        # Update the remaining seats too in the summary file
+        write_updated_summary(offers_summary_fname, rnd, rem_seats, factors, stats)
+        if waitlist is not None:
+            write_waitlist(waitlist_fname(offers_prefix), waitlist, rnd + 1)
+            print(f"-- Projected Round_{rnd + 1} cutoffs: {waitlist.cutoffs()}")
+        # Remember what was applied, so it is not applied twice; skipped
+        # updates are not, a later file may still apply to the candidate
+        record_applied_updates(
+            offers_prefix,
+            rnd,
+            round_sha256,
+            updated_offers_dict,
+            applied,
+            our_other_flg,
+            os.path.basename(update_file),
+        )
+
+        # Keep a log of the runs, so the season can be replayed
+        log_operation(offers_prefix, ["update_offers.py"] + list(argv))
+
+    return 0
+
+
+#################################################################################
+# Main Function
+#################################################################################
+if __name__ == "__main__":
+    sys.exit(main())
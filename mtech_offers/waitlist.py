@@ -0,0 +1,233 @@
+# -----------------------------------------------------------------------------
+# Who the next round will reach, per seat category, kept up to date while a
+# round's update files are applied.
+#
+# Round N+1 takes every applicant in merit order. Whoever has an offer from
+# rounds 1..N is left alone: an Accept or Retain is carried over (a Retain
+# holds one of the round's offers), anyone else is skipped. Everyone else
+# gets a general seat while there are general offers left, and after that
+# a seat of their own category while that has offers left. The offers of
+# a category are ceil(remaining seats * multiplier), as in make_offers.py.
+#
+# Waitlist works this out without making the round:
+#
+#   * the merit order and the positions of every category's applicants in
+#     it are worked out once, when the Waitlist is made;
+#   * process_updates() tells it every status change and every change of
+#     the remaining seats (record() and set_seats()), which costs nothing;
+#   * a query walks the merit order only as far as the round would reach,
+#     plus the depth of the waitlist, and is kept until the next change.
+#
+# For each seat category it gives the applicants the round is projected to
+# make an offer to, the next `depth` after them, and the projected cutoff
+# (the GATE score of the last projected offer). Offers carried over are not
+# part of the cutoff, it is how far down the round reaches.
+#
+# update_offers.py --waitlist K writes it to the Round_<N+1> sheet of
+# <prefix>_waitlist.xlsx.
+# -----------------------------------------------------------------------------
+from dataclasses import dataclass
+import heapq
+import math
+import os
+
+from .prefix_lock import atomic_save
+from .round_stats import CATEGORIES, NO_CUTOFF, bold_font
+
+# Applicants listed after the projected offers of each category
+DEFAULT_DEPTH = 10
+
+WAITLIST_COLUMNS = (
+    "seat_category",
+    "projected_offers",
+    "projected_cutoff",
+    "rank",
+    "projected",
+    "coap_id",
+    "name",
+    "student_category",
+    "gate_score",
+    "btech_score",
+)
+
+
+@dataclass
+class CategoryWaitlist:
+    """A class for holding who the next round reaches in a seat category"""
+
+    seat_category: str
+    # ceil(remaining seats * multiplier)
+    projected_offers: int
+    # coap_ids, in merit order
+    offers: list
+    waiting: list
+    cutoff: float
+
+
+def waitlist_fname(offers_prefix):
+    return offers_prefix + "_waitlist.xlsx"
+
+
+class Waitlist:
+    """ The next round's offers and waitlist, as the updates come in
+
+    Parameters
+    ----------
+    students_dict : dict
+        coap_id -> student details, as update_offers.load_students() gives
+    prev_offers_dict : dict
+        The offers of rounds 1..N as the next round will load them (see
+        load_all_previous_and_current_offers)
+    rem_seats, factors : dict
+        Seats left and the factor per seat category, the factors are
+        taken to stay as they are for the next round
+    depth : int
+        How many applicants to list after the projected offers
+    """
+
+    def __init__(self, students_dict, prev_offers_dict, rem_seats, factors, depth=DEFAULT_DEPTH):
+        self.students = students_dict
+        # Same order as process_applicants(), ties in file order
+        self.order = sorted(
+            students_dict,
+            key=lambda c: (students_dict[c]["gate_score"], students_dict[c]["btech_score"]),
+            reverse=True,
+        )
+        self.position = {c: i for i, c in enumerate(self.order)}
+        self.by_category = {}
+        for i, c in enumerate(self.order):
+            self.by_category.setdefault(students_dict[c]["category"], []).append(i)
+
+        # coap_id -> (status, seat category) of everyone the round skips
+        self.prev = {
+            c: (o["status"], o["offer_seat_category"]) for c, o in prev_offers_dict.items()
+        }
+        self.rem_seats = dict(rem_seats)
+        self.factors = dict(factors)
+        self.depth = depth
+        self._projection = None
+
+    def record(self, coap_id, status, seat_category):
+        """ An offer of this round was made, or its status changed """
+        self.prev[coap_id] = (status, seat_category)
+        self._projection = None
+
+    def set_seats(self, seat_category, seats):
+        self.rem_seats[seat_category] = seats
+        self._projection = None
+
+    def projected_offers(self):
+        return {
+            k: math.ceil(int(v) * float(self.factors[k])) for k, v in self.rem_seats.items()
+        }
+
+    def _reach(self, events, offers_left, skip_until):
+        # events are (position, carried Retain?) in merit order
+        offers, waiting = [], []
+        for i, retain in events:
+            if retain:
+                offers_left -= 1
+                continue
+            coap_id = self.order[i]
+            if coap_id in self.prev or i <= skip_until:
+                continue
+            if offers_left > 0:
+                offers.append(coap_id)
+                offers_left -= 1
+            elif len(waiting) < self.depth:
+                waiting.append(coap_id)
+            else:
+                break
+        return offers, waiting
+
+    def _retains(self, seat_category):
+        return sorted(
+            self.position[c]
+            for c, (status, cat) in self.prev.items()
+            if status == "Retain" and cat == seat_category and c in self.position
+        )
+
+    def _cutoff(self, offers):
+        return self.students[offers[-1]]["gate_score"] if offers else NO_CUTOFF
+
+    def projection(self):
+        """ returns a dict of seat category -> CategoryWaitlist """
+        if self._projection is not None:
+            return self._projection
+        rem_offers = self.projected_offers()
+        projection = {}
+
+        # General seats go to anyone, in merit order
+        n = rem_offers.get("gen", 0)
+        events = heapq.merge(
+            ((i, False) for i in range(len(self.order))),
+            ((i, True) for i in self._retains("gen")),
+        )
+        offers, waiting = self._reach(events, n, -1)
+        projection["gen"] = CategoryWaitlist("gen", n, offers, waiting, self._cutoff(offers))
+        # Nobody after the last general offer finds a general offer left
+        last_gen = self.position[offers[-1]] if offers else -1
+
+        for cat in CATEGORIES[1:]:
+            n = rem_offers.get(cat, 0)
+            events = heapq.merge(
+                ((i, False) for i in self.by_category.get(cat, [])),
+                ((i, True) for i in self._retains(cat)),
+            )
+            offers, waiting = self._reach(events, n, last_gen)
+            projection[cat] = CategoryWaitlist(cat, n, offers, waiting, self._cutoff(offers))
+
+        self._projection = projection
+        return projection
+
+    def cutoffs(self):
+        return {cat: w.cutoff for cat, w in self.projection().items()}
+
+
+def fill_waitlist_sheet(sh, waitlist):
+    """ The column headings and a row per listed applicant of every category """
+    for j, heading in enumerate(WAITLIST_COLUMNS, 1):
+        sh.cell(row=1, column=j, value=heading).font = bold_font()
+
+    row = 2
+    for cat, w in waitlist.projection().items():
+        listed = [("offer", c) for c in w.offers] + [("wait", c) for c in w.waiting]
+        if not listed:
+            listed = [(None, None)]
+        for rank, (projected, coap_id) in enumerate(listed, 1):
+            values = [cat, w.projected_offers, w.cutoff]
+            if coap_id is not None:
+                s = waitlist.students[coap_id]
+                values += [
+                    rank,
+                    projected,
+                    coap_id,
+                    s["name"],
+                    s["category"],
+                    s["gate_score"],
+                    s["btech_score"],
+                ]
+            for j, v in enumerate(values, 1):
+                sh.cell(row=row, column=j, value=v)
+            row += 1
+
+
+def write_waitlist(fname, waitlist, rnd):
+    """ Write the waitlist of round rnd to its own sheet of fname """
+    import openpyxl
+
+    if os.path.exists(fname):
+        wb = openpyxl.load_workbook(filename=fname)
+    else:
+        wb = openpyxl.Workbook()
+        wb.remove(wb.active)
+
+    title = "Round_" + str(rnd)
+    if title in wb.sheetnames:
+        index = wb.sheetnames.index(title)
+        wb.remove(wb[title])
+        sh = wb.create_sheet(title, index)
+    else:
+        sh = wb.create_sheet(title)
+    fill_waitlist_sheet(sh, waitlist)
+    atomic_save(wb, fname)
@@ -0,0 +1,67 @@
+# -----------------------------------------------------------------------------
+# offers_tables() and to_frame() on the sample files, needs
+# pip install ".[arrow,pandas]"
+# -----------------------------------------------------------------------------
+import os
+import shutil
+
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+pd = pytest.importorskip("pandas")
+
+from mtech_offers import make_offers  # noqa: E402
+from mtech_offers.offers_frames import _ledger_table, offers_tables, to_frame  # noqa: E402
+from mtech_offers.offers_ledger import (  # noqa: E402
+    OffersLedger,
+    build_ledger,
+    ledger_fname,
+)
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_FILES = ("sample_app_file.xlsx", "SAMPLE_TA_offers.xlsx", "SAMPLE_TA_summary.xlsx")
+
+
+@pytest.fixture
+def sample_round(tmp_path, monkeypatch):
+    """ Round 1 of the sample files made in a scratch directory """
+    for f in SAMPLE_FILES:
+        shutil.copy(os.path.join(REPO, f), tmp_path)
+    monkeypatch.chdir(tmp_path)
+    assert make_offers.main(["-a", "sample_app_file.xlsx", "-o", "SAMPLE_TA", "-r", "1"]) == 0
+    return "SAMPLE_TA_offers.xlsx"
+
+
+def _check_frame(table):
+    df = to_frame(table)
+    assert len(df) == table.num_rows > 0
+    assert df["gate_score"].dtype == "float64"
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.CategoricalDtype):
+            categories = df[name].cat.categories
+            assert not categories.hasnans
+            assert categories.is_unique
+    return df
+
+
+@pytest.mark.parametrize("with_ledger", [True, False])
+def test_sample_round_to_frame(sample_round, with_ledger):
+    if not with_ledger:
+        os.remove(ledger_fname(sample_round))
+    rounds = offers_tables(sample_round)
+    df = _check_frame(rounds["Round_1"])
+    assert set(df["status"]) == {"Initial_Offer"}
+    assert df["coap_id"].is_unique
+
+
+def test_mixed_types_are_one_category():
+    def row(appl_id):
+        return ("C1", "Accept", None, "n", "M", "GEN", "gen", appl_id, "g", "N",
+                700.0, 80.0, "e", "m", "CS", "CS")
+
+    rows = [row(700), row("700"), row(None), row("A7")]
+    data = build_ledger([("Round_1", rows)], {})
+    table = _ledger_table(OffersLedger("x.ledger", data))
+    df = _check_frame(table)
+    assert df["appl_id"].tolist()[:2] == ["700", "700"]
+    assert df["appl_id"].isna().tolist() == [False, False, True, False]